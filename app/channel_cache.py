@@ -0,0 +1,155 @@
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelCache:
+    """ユーザーID → DMチャンネルIDの永続キャッシュ
+
+    DMチャンネルのIDはユーザーごとに変わらないため、一度conversations.openで
+    取得したIDをワークスペース単位でSQLiteに保存し、次回以降の送信で再利用する。
+    パスが空の場合はプロセス内のメモリのみで保持する。
+
+    メモリ上には最近使った max_size 件のみを保持する（LRU）。SQLiteへの保存は
+    一定件数または一定時間ごとにまとめて書き込み、送信ごとのコミットを避ける。
+    """
+
+    # まとめて書き込む件数と、書き込みの最大間隔（秒）
+    FLUSH_SIZE = 100
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, path: str, max_size: Optional[int] = None):
+        self.path = path
+        self.max_size = max(1, max_size or settings.CHANNEL_CACHE_SIZE)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._memory: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        # 保存待ちのDMチャンネルID: (ワークスペース, ユーザーID) -> (チャンネルID, 更新時刻)
+        self._pending: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and self.path:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS dm_channels ("
+                    " workspace TEXT NOT NULL,"
+                    " user_id TEXT NOT NULL,"
+                    " channel_id TEXT NOT NULL,"
+                    " updated_at REAL NOT NULL,"
+                    " PRIMARY KEY (workspace, user_id))"
+                )
+                conn.commit()
+                self._conn = conn
+            except sqlite3.Error as e:
+                # 永続化できない場合もメモリ上のキャッシュで動作を継続する
+                logger.error(f"Failed to open channel cache {self.path}: {str(e)}")
+                self.path = ""
+        return self._conn
+
+    def get(self, workspace: str, user_id: str) -> Optional[str]:
+        """キャッシュ済みのDMチャンネルIDを取得"""
+        key = (workspace, user_id)
+        channel_id = self._memory.get(key)
+        if channel_id is not None:
+            self._memory.move_to_end(key)
+        elif key in self._pending:
+            channel_id = self._pending[key][0]
+            self._remember(key, channel_id)
+        else:
+            conn = self._connect()
+            if conn is not None:
+                row = conn.execute(
+                    "SELECT channel_id FROM dm_channels WHERE workspace = ? AND user_id = ?",
+                    key
+                ).fetchone()
+                if row:
+                    channel_id = row[0]
+                    self._remember(key, channel_id)
+
+        if channel_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return channel_id
+
+    def set(self, workspace: str, user_id: str, channel_id: str):
+        """DMチャンネルIDを保存（SQLiteへは flush でまとめて書き込む）"""
+        key = (workspace, user_id)
+        if self._memory.get(key) == channel_id:
+            return
+        self._remember(key, channel_id)
+
+        if self.path:
+            self._pending[key] = (channel_id, time.time())
+            if len(self._pending) >= self.FLUSH_SIZE or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+                self.flush()
+
+    def flush(self):
+        """保存待ちのDMチャンネルIDをSQLiteへまとめて書き込む"""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        conn = self._connect()
+        if conn is None:
+            return
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO dm_channels (workspace, user_id, channel_id, updated_at) VALUES (?, ?, ?, ?)",
+                [(workspace, user_id, channel_id, updated_at)
+                 for (workspace, user_id), (channel_id, updated_at) in pending.items()]
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to store {len(pending)} DM channels: {str(e)}")
+
+    def invalidate(self, workspace: str, user_id: str):
+        """無効になったDMチャンネルIDを削除"""
+        self.invalidations += 1
+        self._memory.pop((workspace, user_id), None)
+        self._pending.pop((workspace, user_id), None)
+
+        conn = self._connect()
+        if conn is not None:
+            try:
+                conn.execute("DELETE FROM dm_channels WHERE workspace = ? AND user_id = ?", (workspace, user_id))
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to invalidate DM channel for {user_id}: {str(e)}")
+
+    def _remember(self, key: Tuple[str, str], channel_id: str):
+        self._memory[key] = channel_id
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの統計情報"""
+        lookups = self.hits + self.misses
+        return {
+            "persistent": bool(self.path),
+            "cached_channels": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# プロセス全体で共有するインスタンス
+channel_cache = ChannelCache(settings.CHANNEL_CACHE_PATH)
@@ -0,0 +1,280 @@
+"""コマンドラインからのDM一括送信
+
+Web UI を起動せずに、テンプレートファイルと受信者ファイル（CSV / JSON / NDJSON）から
+DMを送信する。cron などで定期実行するためのエントリポイントで、起動を速くするため
+FastAPI・uvicorn は読み込まない。送信処理は Web UI と同じ UserParser・MessageProcessor・
+SlackClient・SendEngine を使う。
+
+受信者ファイルは先頭から読みながら ``--batch-size`` 行ずつユーザーを解決して送信するため、
+ファイル全体をメモリに読み込むことはない。同じユーザーが複数行にある場合は最初の行のみ送信する。
+
+受信者ごとの結果は1行に1つのJSONオブジェクト（NDJSON）として ``--results``
+（省略時は標準出力）へ書き出す。各行の ``index`` は受信者ファイルでの順番（0始まり、空行を除く）で、
+書き出す順はバッチ内で前後することがある。ワークスペース全体のエラーで中断した場合も、
+送信しなかった残りの行を ``aborted`` として書き出すため、結果は受信者ファイルの全行を含む。
+ログと最後の集計は標準エラー出力へ出す。
+
+使い方:
+    SLACK_TOKEN=xoxp-... python -m app.cli send --template t.txt --recipients r.csv
+    python -m app.cli send --template t.txt --recipients r.ndjson --results results.ndjson
+
+終了コード:
+    0  全員に送信した
+    1  送信できなかった受信者がいる
+    2  送信を開始できなかった（トークン・テンプレート・ファイルのエラー）
+    3  ワークスペース全体のエラーにより送信を中断した
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from .channel_cache import channel_cache
+from .config import settings
+from .http_session import http_session
+from .message_processor import MessageProcessor
+from .models import User
+from .send_engine import SendEngine
+from .slack_client import SlackClient, SlackWorkspaceError
+from .user_parser import ImportFileError, UserParser
+
+logger = logging.getLogger("app.cli")
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_USAGE = 2
+EXIT_ABORTED = 3
+
+# 1回のユーザー解決・送信でまとめて扱う受信者ファイルの行数
+DEFAULT_BATCH_SIZE = 500
+
+
+class ResultWriter:
+    """受信者ごとの結果をNDJSONとして書き出し、状態ごとの件数を数える"""
+
+    def __init__(self, output: TextIO):
+        self.output = output
+        self.counts: Dict[str, int] = {}
+
+    def write(self, record: Dict[str, Any]):
+        """結果を1行書き出す（値がNoneの項目は省略）"""
+        self.output.write(json.dumps({k: v for k, v in record.items() if v is not None}, ensure_ascii=False) + "\n")
+        self.counts[record["status"]] = self.counts.get(record["status"], 0) + 1
+
+    def flush(self):
+        self.output.flush()
+
+
+def send_result_record(index: int, identifier: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """SendEngine の送信結果を結果ファイルの1行に変換"""
+    if result["success"]:
+        status = "sent"
+    elif result.get("error_code") == "job_aborted":
+        status = "aborted"
+    else:
+        status = "failed"
+    return {
+        "index": index,
+        "identifier": identifier,
+        "user_id": result["user_id"],
+        "user_name": result["user_name"],
+        "status": status,
+        "message_ts": result.get("message_ts"),
+        "attempts": result.get("attempts"),
+        "error_code": result.get("error_code"),
+        "error": result.get("error"),
+    }
+
+
+def iter_batches(rows: Iterator[Tuple[Optional[Dict[str, Any]], Optional[str]]],
+                 batch_size: int) -> Iterator[List[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]]:
+    """受信者ファイルの行を (行番号, ユーザーデータ, エラー) のバッチにまとめる"""
+    numbered = ((index, user_data, error) for index, (user_data, error) in enumerate(rows))
+    while True:
+        batch = list(islice(numbered, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def write_aborted(batch: List[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+                  writer: ResultWriter, error_code: Optional[str]):
+    """中断により送信しなかった行の結果を書き出す（解析できなかった行は invalid）"""
+    for index, user_data, error in batch:
+        if error is not None:
+            writer.write({"index": index, "status": "invalid", "error": error})
+            continue
+        writer.write({
+            "index": index,
+            "identifier": user_data["identifier"],
+            "status": "aborted",
+            "attempts": 0,
+            "error_code": "job_aborted",
+            "error": f"Not sent: job aborted after {error_code}",
+        })
+
+
+async def send_batch(
+    engine: SendEngine,
+    user_parser: UserParser,
+    slack_client: SlackClient,
+    template: str,
+    batch: List[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+    seen: Dict[str, int],
+    writer: ResultWriter
+):
+    """1バッチ分の受信者を解決して送信し、結果を書き出す"""
+    parsed = [(index, user_data) for index, user_data, error in batch if error is None]
+    for index, _, error in batch:
+        if error is not None:
+            writer.write({"index": index, "status": "invalid", "error": error})
+
+    found = await user_parser.resolve_rows(slack_client, [user_data for _, user_data in parsed])
+
+    users: List[User] = []
+    user_data: Dict[str, Dict[str, Any]] = {}
+    # SendEngine の受信者番号 -> (行番号, 識別子)
+    sources: List[Tuple[int, str]] = []
+    for (index, row), user_info in zip(parsed, found):
+        identifier = row["identifier"]
+        if not user_info:
+            writer.write({"index": index, "identifier": identifier, "status": "not_found", "error": f"User not found: {identifier}"})
+            continue
+        if user_info["id"] in seen:
+            writer.write({
+                "index": index,
+                "identifier": identifier,
+                "user_id": user_info["id"],
+                "status": "duplicate",
+                "error": f"Duplicate of index {seen[user_info['id']]}",
+            })
+            continue
+
+        seen[user_info["id"]] = index
+        users.append(User(**user_info))
+        user_data[user_info["id"]] = row["variables"]
+        sources.append((index, identifier))
+
+    def on_result(position: int, result: Dict[str, Any]):
+        index, identifier = sources[position]
+        writer.write(send_result_record(index, identifier, result))
+
+    await engine.run(template, users, user_data, on_result)
+    writer.flush()
+
+
+async def run_send(args: argparse.Namespace, output: TextIO) -> int:
+    """send サブコマンド"""
+    try:
+        return await send(args, output)
+    finally:
+        channel_cache.flush()
+        await http_session.close()
+
+
+async def send(args: argparse.Namespace, output: TextIO) -> int:
+    """テンプレートと受信者ファイルを読み込んで送信し、終了コードを返す"""
+    try:
+        with open(args.template, encoding="utf-8-sig") as f:
+            template = f.read()
+    except OSError as e:
+        logger.error(f"Cannot read template: {e}")
+        return EXIT_USAGE
+
+    message_processor = MessageProcessor()
+    template_errors = message_processor.validate_template(template)
+    if template_errors:
+        for error in template_errors:
+            logger.error(f"Invalid template: {error}")
+        return EXIT_USAGE
+
+    token = args.token or settings.SLACK_TOKEN
+    if not token:
+        logger.error("Slack token is required (--token or SLACK_TOKEN)")
+        return EXIT_USAGE
+
+    slack_client = SlackClient(token)
+    if not await slack_client.validate_token():
+        logger.error("Invalid Slack token")
+        return EXIT_USAGE
+
+    user_parser = UserParser()
+    engine = SendEngine(slack_client, message_processor, concurrency=args.concurrency)
+    writer = ResultWriter(output)
+    seen: Dict[str, int] = {}
+    resolve_error: Optional[SlackWorkspaceError] = None
+    started = time.monotonic()
+
+    try:
+        with open(args.recipients, "rb") as stream:
+            rows = user_parser.iter_stream(stream, args.recipients)
+            batches = iter_batches(rows, args.batch_size)
+            for batch in batches:
+                try:
+                    await send_batch(engine, user_parser, slack_client, template, batch, seen, writer)
+                except SlackWorkspaceError as e:
+                    # 解決できなかったバッチの行（invalid は書き出し済み）と残りの行を中断として書き出す
+                    resolve_error = e
+                    write_aborted([row for row in batch if row[2] is None], writer, e.error_code)
+                    break
+                if engine.abort_result is not None:
+                    break
+            # 中断した場合も、受信者ファイルの残りの行はすべて結果に含める
+            abort_code = resolve_error.error_code if resolve_error else (engine.abort_result or {}).get("error_code")
+            for batch in batches:
+                write_aborted(batch, writer, abort_code)
+    except (OSError, ImportFileError) as e:
+        logger.error(f"Cannot read recipients: {e}")
+        return EXIT_USAGE
+    finally:
+        writer.flush()
+
+    summary = dict(writer.counts, elapsed_seconds=round(time.monotonic() - started, 3))
+    logger.info(f"Send summary: {json.dumps(summary, ensure_ascii=False)}")
+
+    if resolve_error is not None:
+        logger.error(f"Aborted: cannot resolve recipients: {resolve_error}")
+        return EXIT_ABORTED
+    if engine.abort_result is not None:
+        logger.error(f"Aborted: workspace-level error {engine.abort_result.get('error_code')}")
+        return EXIT_ABORTED
+    if any(status not in ("sent", "duplicate") for status in writer.counts):
+        return EXIT_FAILURES
+    return EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__.splitlines()[0])
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    send = subcommands.add_parser("send", help="テンプレートと受信者ファイルからDMを送信")
+    send.add_argument("--template", required=True, help="メッセージテンプレートのファイル（UTF-8）")
+    send.add_argument("--recipients", required=True, help="受信者ファイル（.csv / .json / .ndjson / .jsonl）")
+    send.add_argument("--results", default="-", help="受信者ごとの結果（NDJSON）の出力先（省略時は標準出力）")
+    send.add_argument("--token", help="Slackトークン（省略時は環境変数 SLACK_TOKEN）")
+    send.add_argument("--concurrency", type=int, default=None, help="同時送信数（省略時は SEND_CONCURRENCY）")
+    send.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="まとめてユーザーを解決する行数")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=settings.LOG_LEVEL,
+        stream=sys.stderr,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    args.batch_size = max(1, args.batch_size)
+
+    if args.results == "-":
+        return asyncio.run(run_send(args, sys.stdout))
+    with open(args.results, "w", encoding="utf-8") as output:
+        return asyncio.run(run_send(args, output))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,22 +13,88 @@ class Settings:
     
     # Slack API settings
     SLACK_TOKEN: Optional[str] = os.getenv("SLACK_TOKEN")
-    SLACK_RATE_LIMIT_DELAY: float = float(os.getenv("SLACK_RATE_LIMIT_DELAY", "1.0"))  # seconds
+    SLACK_API_BASE_URL: str = os.getenv("SLACK_API_BASE_URL", "https://slack.com/api/")  # point at benchmarks.fake_slack for dry runs
+    SLACK_RATE_LIMIT_DELAY: float = float(os.getenv("SLACK_RATE_LIMIT_DELAY", "1.0"))  # seconds (methods without a tier)
+    SLACK_RATE_LIMITS: str = os.getenv("SLACK_RATE_LIMITS", "")  # e.g. "chat.postMessage=120,users.info=100"
+    SLACK_RATE_LIMIT_BURST: float = float(os.getenv("SLACK_RATE_LIMIT_BURST", "3"))
+    SLACK_CHANNEL_RATE_LIMIT: float = float(os.getenv("SLACK_CHANNEL_RATE_LIMIT", "60"))  # chat.postMessage per channel per minute (0 = off)
     SLACK_MAX_RETRIES: int = int(os.getenv("SLACK_MAX_RETRIES", "3"))
+    SLACK_API_TIMEOUT: float = float(os.getenv("SLACK_API_TIMEOUT", "30"))  # seconds per Slack API request
+    HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", "100"))  # pooled connections to the Slack API
+    HTTP_KEEPALIVE_TIMEOUT: float = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))  # seconds an idle connection is kept
+    HTTP_DNS_CACHE_TTL: float = float(os.getenv("HTTP_DNS_CACHE_TTL", "300"))  # seconds
+    SEND_CONCURRENCY: int = int(os.getenv("SEND_CONCURRENCY", "4"))  # concurrent DM sends per job
+    SLACK_LOOKUP_CONCURRENCY: int = int(os.getenv("SLACK_LOOKUP_CONCURRENCY", "8"))  # concurrent user lookups on import
+    SLACK_BULK_DIRECTORY_THRESHOLD: int = int(os.getenv("SLACK_BULK_DIRECTORY_THRESHOLD", "20"))  # fetch users.list above this many IDs
+    
+    # Job store settings
+    JOB_STORE: str = os.getenv("JOB_STORE", "sqlite")  # sqlite, memory
+    JOB_STORE_PATH: str = os.getenv("JOB_STORE_PATH", "data/jobs.db")
+    JOB_TTL_SECONDS: float = float(os.getenv("JOB_TTL_SECONDS", "86400"))  # keep finished jobs for 1 day
+    JOB_PROGRESS_FLUSH_SIZE: int = int(os.getenv("JOB_PROGRESS_FLUSH_SIZE", "50"))  # results per progress write
+    JOB_PROGRESS_FLUSH_INTERVAL: float = float(os.getenv("JOB_PROGRESS_FLUSH_INTERVAL", "1.0"))  # seconds
+    JOB_STALE_SECONDS: float = float(os.getenv("JOB_STALE_SECONDS", "600"))  # running jobs without updates can be resumed
+    SEND_LEDGER_DIR: str = os.getenv("SEND_LEDGER_DIR", "data/ledger")  # per-job NDJSON send ledgers; empty = disabled
+    SEND_LEDGER_FLUSH_SIZE: int = int(os.getenv("SEND_LEDGER_FLUSH_SIZE", "200"))  # records per ledger append
+    SEND_LEDGER_FLUSH_INTERVAL: float = float(os.getenv("SEND_LEDGER_FLUSH_INTERVAL", "1.0"))  # seconds
+    PROGRESS_STREAM_KEEPALIVE: float = float(os.getenv("PROGRESS_STREAM_KEEPALIVE", "15"))  # seconds between SSE keepalives
+    
+    # Token validation cache settings
+    TOKEN_CACHE_TTL: float = float(os.getenv("TOKEN_CACHE_TTL", "120"))  # seconds to trust a successful auth.test; 0 = always check
+    
+    # User directory cache settings
+    DIRECTORY_CACHE_TTL: float = float(os.getenv("DIRECTORY_CACHE_TTL", "300"))  # seconds
+    SLACK_USERS_LIST_PAGE_SIZE: int = int(os.getenv("SLACK_USERS_LIST_PAGE_SIZE", "1000"))  # users.list limit per page
+    CHANNEL_CACHE_PATH: str = os.getenv("CHANNEL_CACHE_PATH", "data/channel_cache.db")  # empty = memory only
+    CHANNEL_CACHE_SIZE: int = int(os.getenv("CHANNEL_CACHE_SIZE", "100000"))  # DM channels kept in memory
+    
+    # Message template settings
+    TEMPLATE_CACHE_SIZE: int = int(os.getenv("TEMPLATE_CACHE_SIZE", "128"))  # compiled templates kept in memory
+    PREVIEW_SAMPLE_SIZE: int = int(os.getenv("PREVIEW_SAMPLE_SIZE", "20"))  # rendered messages returned by /api/preview
+    PREVIEW_BATCH_SIZE: int = int(os.getenv("PREVIEW_BATCH_SIZE", "1000"))  # users rendered per worker thread batch
+    SLACK_MESSAGE_MAX_LENGTH: int = int(os.getenv("SLACK_MESSAGE_MAX_LENGTH", "40000"))  # chat.postMessage text limit
     
     # File upload settings
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
+    IMPORT_RESOLVE_BATCH_SIZE: int = int(os.getenv("IMPORT_RESOLVE_BATCH_SIZE", "1000"))  # rows parsed and resolved at a time on import
     UPLOAD_FOLDER: str = "static/uploads"
-    ALLOWED_EXTENSIONS: set = {".csv", ".json", ".txt"}
+    ALLOWED_EXTENSIONS: set = {".csv", ".json", ".ndjson", ".jsonl", ".txt"}
     
     # Logging settings
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     LOG_FILE: str = os.getenv("LOG_FILE", "logs/app.log")
     SEND_RESULTS_LOG_FILE: str = os.getenv("SEND_RESULTS_LOG_FILE", "logs/send_results.log")
+    LOG_MODE: str = os.getenv("LOG_MODE", "queue")  # queue (write on a background thread), sync
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # records buffered per logger
+    LOG_QUEUE_POLICY: str = os.getenv("LOG_QUEUE_POLICY", "drop")  # drop, block (when the queue is full)
+    LOG_QUEUE_BLOCK_TIMEOUT: float = float(os.getenv("LOG_QUEUE_BLOCK_TIMEOUT", "1.0"))  # seconds to wait with block
     
     # Security settings
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
     
+    # Requests per minute per workspace (Slack Web API tiers)
+    # 送信ジョブの速度の上限は chat.postMessage と、DMチャンネルが未キャッシュの
+    # 受信者では conversations.open で決まる（SLACK_RATE_LIMITS で調整する）
+    SLACK_TIER_RATE_LIMITS = {
+        "auth.test": 100,             # Special (Tier 4相当)
+        "users.list": 20,             # Tier 2
+        "users.info": 100,            # Tier 4
+        "users.lookupByEmail": 50,    # Tier 3
+        "conversations.open": 50,     # Tier 3
+        "chat.postMessage": 600,      # Special (workspace-wide; 1 per second per channel is SLACK_CHANNEL_RATE_LIMIT)
+    }
+    
+    @classmethod
+    def get_rate_limits(cls) -> dict:
+        """メソッドごとのレート制限（SLACK_RATE_LIMITSで上書き可能）"""
+        limits = dict(cls.SLACK_TIER_RATE_LIMITS)
+        for item in cls.SLACK_RATE_LIMITS.split(","):
+            if "=" not in item:
+                continue
+            method, value = item.split("=", 1)
+            limits[method.strip()] = float(value)
+        return limits
+    
     @classmethod
     def get_log_config(cls) -> dict:
         return {
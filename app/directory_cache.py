@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from .config import settings
+from .user_index import DirectoryUser, UserIndex
+
+logger = logging.getLogger(__name__)
+
+PageFetcher = Callable[[], AsyncIterator[List[DirectoryUser]]]
+
+
+def token_key(token: str) -> str:
+    """トークンからキャッシュキーを生成（生のトークンは保持しない）"""
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), token.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class DirectoryEntry:
+    """ワークスペース単位のユーザーディレクトリ
+
+    取得中はページ単位でメンバーが追加され、待機中の読み手に通知される。
+    検索用のインデックスはページの追加と同時に構築される。
+    """
+
+    def __init__(self, members: Optional[List[DirectoryUser]] = None):
+        self.members: List[DirectoryUser] = []
+        self.index = UserIndex()
+        self.complete = False
+        self.failed = False
+        self.pages = 0
+        self.fetched_at = time.time()
+        self._changed = asyncio.Event()
+        if members is not None:
+            self.add_page(members)
+            self.finish()
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def add_page(self, page: List[DirectoryUser]):
+        """取得したページを追加して読み手に通知"""
+        self.members.extend(page)
+        self.index.add_members(page)
+        self.pages += 1
+        self._notify()
+
+    def finish(self, failed: bool = False):
+        """取得完了（または失敗）を記録"""
+        self.complete = True
+        self.failed = failed
+        self.fetched_at = time.time()
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def iter_updates(self) -> AsyncIterator["DirectoryEntry"]:
+        """新しいページが到着するたびに自身を返す（完了まで）"""
+        seen_pages = 0
+        while True:
+            if seen_pages < self.pages:
+                seen_pages = self.pages
+                yield self
+                continue
+            if self.complete:
+                return
+            await self._changed.wait()
+
+
+class DirectoryCache:
+    """プロセス全体で共有するユーザーディレクトリのキャッシュ
+
+    ワークスペース（トークンのハッシュ）ごとにusers.listの結果を保持し、
+    同時に来たリクエストは1回の取得処理を共有する（single-flight）。
+    取得中のページは到着次第ストリームとして読み手に渡される。
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, DirectoryEntry] = {}
+        self._loading: Dict[str, DirectoryEntry] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.coalesced = 0
+
+    def _fresh_entry(self, key: str) -> Optional[DirectoryEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.age() < self.ttl:
+            return entry
+        return None
+
+    def _ensure_refresh(self, key: str, fetcher: PageFetcher) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            # 取得中のリクエストに相乗りする
+            self.coalesced += 1
+            return task
+
+        loading = DirectoryEntry()
+        self._loading[key] = loading
+        task = asyncio.ensure_future(self._refresh(key, loading, fetcher))
+        self._inflight[key] = task
+
+        def _done(_):
+            self._inflight.pop(key, None)
+            self._loading.pop(key, None)
+
+        task.add_done_callback(_done)
+        return task
+
+    async def get(self, key: str, fetcher: PageFetcher) -> List[DirectoryUser]:
+        """キャッシュからディレクトリ全体を取得し、期限切れなら再取得する"""
+        entry = self._fresh_entry(key)
+        if entry is not None:
+            self.hits += 1
+            return entry.members
+
+        self.misses += 1
+        task = self._ensure_refresh(key, fetcher)
+        # 呼び出し元がキャンセルされても共有中の取得処理は止めない
+        return await asyncio.shield(task)
+
+    def peek(self, key: str) -> Optional[DirectoryEntry]:
+        """有効なキャッシュがあれば返す（取得は行わない）"""
+        return self._fresh_entry(key)
+
+    async def watch(self, key: str, fetcher: PageFetcher) -> AsyncIterator[DirectoryEntry]:
+        """ディレクトリを返し、取得中ならページが到着するたびに再度返す"""
+        entry = self._fresh_entry(key)
+        if entry is not None:
+            self.hits += 1
+            yield entry
+            return
+
+        self.misses += 1
+        self._ensure_refresh(key, fetcher)
+        loading = self._loading.get(key)
+        if loading is not None:
+            async for update in loading.iter_updates():
+                yield update
+            if not loading.failed:
+                return
+
+        # 取得に失敗した場合は残っているキャッシュで補う
+        stale = self._entries.get(key)
+        if stale is not None:
+            yield stale
+
+    async def _refresh(self, key: str, loading: DirectoryEntry, fetcher: PageFetcher) -> List[DirectoryUser]:
+        self.refreshes += 1
+        try:
+            async for page in fetcher():
+                loading.add_page(page)
+        except Exception as e:
+            self.refresh_failures += 1
+            loading.finish(failed=True)
+            logger.error(f"Directory refresh failed after {loading.pages} pages: {str(e)}")
+            stale = self._entries.get(key)
+            if stale is not None:
+                # 取得に失敗した場合は古いディレクトリで継続する
+                logger.warning(f"Serving stale directory cache ({stale.age():.0f}s old)")
+                return stale.members
+            # 途中までのページはキャッシュせずに今回の呼び出しだけで使う
+            return loading.members
+
+        loading.finish()
+        self._entries[key] = loading
+        logger.info(f"Updated directory cache with {len(loading.members)} users ({loading.pages} pages)")
+        return loading.members
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """キャッシュを無効化し、削除したエントリ数を返す（keyがNoneなら全件）"""
+        if key is None:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+        return 1 if self._entries.pop(key, None) is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの統計情報"""
+        lookups = self.hits + self.misses
+        return {
+            "workspaces": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "coalesced_requests": self.coalesced,
+            "inflight_refreshes": len(self._inflight),
+            "entries": [
+                {"members": len(entry.members), "pages": entry.pages, "age_seconds": round(entry.age(), 1)}
+                for entry in self._entries.values()
+            ],
+        }
+
+
+# プロセス全体で共有するインスタンス
+directory_cache = DirectoryCache(ttl=settings.DIRECTORY_CACHE_TTL)
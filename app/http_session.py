@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HttpSessionPool:
+    """Slack API呼び出しで共有するHTTPセッション
+
+    すべての SlackClient（AsyncWebClient）に同じ aiohttp.ClientSession を渡し、
+    接続プール（キープアライブ）とDNSキャッシュを共有する。セッションを渡さない場合、
+    slack_sdk はリクエストごとにセッションを作るため毎回TCP/TLS接続からやり直しになる。
+    接続の新規作成・再利用の回数は TraceConfig で数える。
+    """
+
+    def __init__(self, pool_size: int, dns_cache_ttl: float, keepalive_timeout: float, timeout: float):
+        self.pool_size = pool_size
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.connect_seconds = 0.0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    def get(self) -> Optional[aiohttp.ClientSession]:
+        """実行中のイベントループで共有するセッションを取得（ループ外ではNone）"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return None
+
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # 別のイベントループ（asyncio.runの再実行など）のセッションは使えないため作り直す
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=[self._trace_config()]
+            )
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        """セッションと接続プールを閉じる"""
+        session, self._session, self._loop = self._session, None, None
+        if session is not None and not session.closed:
+            await session.close()
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context: SimpleNamespace, params):
+            self.requests += 1
+
+        async def on_connection_create_start(session, context: SimpleNamespace, params):
+            context.connect_started = asyncio.get_running_loop().time()
+
+        async def on_connection_create_end(session, context: SimpleNamespace, params):
+            self.connections_created += 1
+            started = getattr(context, "connect_started", None)
+            if started is not None:
+                self.connect_seconds += asyncio.get_running_loop().time() - started
+
+        async def on_connection_reuseconn(session, context: SimpleNamespace, params):
+            self.connections_reused += 1
+
+        async def on_dns_cache_hit(session, context: SimpleNamespace, params):
+            self.dns_cache_hits += 1
+
+        async def on_dns_cache_miss(session, context: SimpleNamespace, params):
+            self.dns_cache_misses += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    def stats(self) -> Dict[str, Any]:
+        """接続の再利用状況"""
+        connections = self.connections_created + self.connections_reused
+        return {
+            "open": self._session is not None and not self._session.closed,
+            "pool_size": self.pool_size,
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_rate": round(self.connections_reused / connections, 4) if connections else 0.0,
+            "avg_connect_ms": round(self.connect_seconds / self.connections_created * 1000, 1) if self.connections_created else 0.0,
+            "dns_cache_hits": self.dns_cache_hits,
+            "dns_cache_misses": self.dns_cache_misses,
+        }
+
+
+# プロセス全体で共有するインスタンス
+http_session = HttpSessionPool(
+    pool_size=settings.HTTP_POOL_SIZE,
+    dns_cache_ttl=settings.HTTP_DNS_CACHE_TTL,
+    keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+    timeout=settings.SLACK_API_TIMEOUT
+)
@@ -0,0 +1,687 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from .config import settings
+from .models import ErrorSummary, SendResult, User
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("completed", "failed")
+# 実行中・実行待ちのジョブの状態
+ACTIVE_STATUSES = ("pending", "running")
+
+# 受信者ごとの状態: pending（未送信）→ sending（送信開始）→ sent / failed
+# ジョブの中断により送信しなかった受信者は aborted（再開時に送信対象となる）
+RECIPIENT_PENDING = "pending"
+RECIPIENT_SENDING = "sending"
+RECIPIENT_SENT = "sent"
+RECIPIENT_FAILED = "failed"
+RECIPIENT_ABORTED = "aborted"
+
+# 受信者の状態更新: (受信者の番号, 状態, message_ts, error_code)
+RecipientUpdate = Tuple[int, str, Optional[str], Optional[str]]
+
+# ジョブの変更を受け取るリスナー（ジョブID, 変更内容）
+JobListener = Callable[[str, Dict[str, Any]], None]
+
+# エラー一覧の1ページあたりの既定件数
+DEFAULT_ERRORS_PAGE_SIZE = 100
+
+
+def error_code_of(error: Dict[str, Any]) -> str:
+    """エラーの集計に使うエラーコード"""
+    return error.get("error_code") or "unknown"
+
+
+class DuplicateJobError(Exception):
+    """同じ冪等キーのジョブが既に登録されている"""
+
+    def __init__(self, job_id: Optional[str]):
+        super().__init__(f"Job already exists for this idempotency key: {job_id}")
+        self.job_id = job_id
+
+
+class JobStore(ABC):
+    """送信ジョブの保存先
+
+    ジョブ本体（カウンタと状態）とエラーの一覧を分けて保持し、進捗は
+    差分（カウンタの増分と追加されたエラー）だけを書き込む。ジョブの取得では
+    エラーをエラーコードごとの件数に集計して返し、エラーの一覧は
+    get_errors でカーソルを使ってページ単位で取得する。再開に備えて
+    テンプレート・変数と受信者ごとの状態も保持する。各操作は
+    Redis互換のストアでもハッシュ（HINCRBY / HSET）、リスト（RPUSH / LRANGE）、
+    SET NX、EXPIREで実装できる粒度にしている。
+
+    カウンタ・エラー・状態の変更は登録したリスナーへ差分として通知する
+    （このプロセス内で行われた変更のみ）。
+    """
+
+    def __init__(self):
+        self._listeners: List[JobListener] = []
+
+    def add_listener(self, listener: JobListener):
+        """ジョブの変更を受け取るリスナーを登録"""
+        self._listeners.append(listener)
+
+    def _notify_progress(self, job_id: str, sent: int, failed: int, api_calls_saved: int,
+                         errors: Optional[List[Dict[str, Any]]]):
+        # 受信者の状態のみの変更（送信開始の記録など）は通知しない
+        if not (sent or failed or api_calls_saved or errors):
+            return
+        change = {"sent": sent, "failed": failed, "api_calls_saved": api_calls_saved, "errors": list(errors or [])}
+        for listener in self._listeners:
+            listener(job_id, change)
+
+    def _notify_status(self, job_id: str, status: str, completed_at: Optional[datetime]):
+        change = {"status": status, "completed_at": completed_at.isoformat() if completed_at else None}
+        for listener in self._listeners:
+            listener(job_id, change)
+
+    @abstractmethod
+    def create(self, job: SendResult, users: List[User], template: str,
+               user_data: Dict[str, Dict[str, Any]], workspace: Optional[str] = None,
+               idempotency_key: Optional[str] = None):
+        """ジョブと受信者（すべてpending）を登録"""
+
+    @abstractmethod
+    def find_by_idempotency_key(self, idempotency_key: str) -> Optional[str]:
+        """冪等キーで登録済みのジョブIDを取得"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[SendResult]:
+        """ジョブを取得（存在しない場合はNone）"""
+
+    @abstractmethod
+    def get_errors(self, job_id: str, after: int = 0,
+                   limit: int = DEFAULT_ERRORS_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """カーソル after より後のエラーを最大limit件取得し、(エラー, 次のカーソル) を返す
+
+        次のページがない場合、次のカーソルはNone。
+        """
+
+    @abstractmethod
+    def get_input(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブのテンプレート・変数データ・ワークスペースを取得"""
+
+    @abstractmethod
+    def get_recipients(self, job_id: str, statuses: Iterable[str]) -> List[Tuple[int, User]]:
+        """指定した状態の受信者を (番号, ユーザー) の一覧で取得"""
+
+    @abstractmethod
+    def update_progress(self, job_id: str, sent: int = 0, failed: int = 0,
+                        api_calls_saved: int = 0, errors: Optional[List[Dict[str, Any]]] = None,
+                        recipients: Optional[List[RecipientUpdate]] = None):
+        """進捗の差分を反映（カウンタの増分、追加されたエラー、受信者の状態）"""
+
+    @abstractmethod
+    def discard_errors(self, job_id: str, error_codes: Iterable[str]) -> int:
+        """指定したエラーコードのエラーを削除し、削除件数を返す（再開で再送信する受信者の分など）"""
+
+    @abstractmethod
+    def update_status(self, job_id: str, status: str, completed_at: Optional[datetime] = None):
+        """ジョブの状態を更新"""
+
+    @abstractmethod
+    def claim(self, job_id: str, from_statuses: Iterable[str] = FINISHED_STATUSES,
+              stale_after: Optional[float] = None) -> Optional[str]:
+        """ジョブの状態が from_statuses のいずれかなら pending に変更し、変更前の状態を返す
+
+        状態の確認と変更は不可分に行い、変更できなかった場合はNoneを返す（再開の二重実行の防止）。
+        stale_after を指定すると、その秒数以上更新されていない実行中・実行待ちのジョブ
+        （プロセスの停止で取り残されたもの）も対象にする。
+        """
+
+    @abstractmethod
+    def evict_expired(self) -> int:
+        """TTLを過ぎた完了済みジョブを削除し、削除件数を返す"""
+
+
+class MemoryJobStore(JobStore):
+    """プロセス内メモリのジョブストア（単一インスタンス・開発用）"""
+
+    def __init__(self, ttl: float):
+        super().__init__()
+        self.ttl = ttl
+        self._jobs: Dict[str, SendResult] = {}
+        # ジョブID -> (番号, エラー) の一覧。番号はストア全体で単調増加し、エラー一覧のカーソルに使う
+        self._errors: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+        self._error_seq = 0
+        # ジョブID -> エラーコード -> 集計（最初に発生した順）
+        self._error_summary: Dict[str, Dict[str, ErrorSummary]] = {}
+        self._inputs: Dict[str, Dict[str, Any]] = {}
+        self._recipients: Dict[str, List[Dict[str, Any]]] = {}
+        self._idempotency: Dict[str, str] = {}
+        self._finished_at: Dict[str, float] = {}
+        # ジョブID -> 最後に進捗・状態を書き込んだ時刻
+        self._updated_at: Dict[str, float] = {}
+
+    def create(self, job: SendResult, users: List[User], template: str,
+               user_data: Dict[str, Dict[str, Any]], workspace: Optional[str] = None,
+               idempotency_key: Optional[str] = None):
+        self.evict_expired()
+        if idempotency_key is not None:
+            if idempotency_key in self._idempotency:
+                raise DuplicateJobError(self._idempotency[idempotency_key])
+            self._idempotency[idempotency_key] = job.job_id
+        self._jobs[job.job_id] = job.model_copy(update={"error_count": 0, "error_summary": []})
+        self._errors[job.job_id] = []
+        self._error_summary[job.job_id] = {}
+        self._inputs[job.job_id] = {"template": template, "user_data": user_data, "workspace": workspace}
+        self._recipients[job.job_id] = [
+            {"user": user, "status": RECIPIENT_PENDING, "message_ts": None, "error_code": None}
+            for user in users
+        ]
+        self._updated_at[job.job_id] = time.time()
+
+    def find_by_idempotency_key(self, idempotency_key: str) -> Optional[str]:
+        job_id = self._idempotency.get(idempotency_key)
+        return job_id if job_id in self._jobs else None
+
+    def get(self, job_id: str) -> Optional[SendResult]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        return job.model_copy(update={
+            "error_count": len(self._errors[job_id]),
+            "error_summary": [summary.model_copy() for summary in self._error_summary[job_id].values()]
+        })
+
+    def get_errors(self, job_id: str, after: int = 0,
+                   limit: int = DEFAULT_ERRORS_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        # カーソルはエラーの番号（削除があっても既に返したエラーの位置はずれない）
+        errors = self._errors.get(job_id, [])
+        start = bisect.bisect_left(errors, (after + 1,))
+        page = errors[start:start + limit]
+        next_cursor = page[-1][0] if start + limit < len(errors) else None
+        return [error for _, error in page], next_cursor
+
+    def get_input(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._inputs.get(job_id)
+
+    def get_recipients(self, job_id: str, statuses: Iterable[str]) -> List[Tuple[int, User]]:
+        statuses = set(statuses)
+        return [
+            (seq, recipient["user"])
+            for seq, recipient in enumerate(self._recipients.get(job_id, []))
+            if recipient["status"] in statuses
+        ]
+
+    def update_progress(self, job_id: str, sent: int = 0, failed: int = 0,
+                        api_calls_saved: int = 0, errors: Optional[List[Dict[str, Any]]] = None,
+                        recipients: Optional[List[RecipientUpdate]] = None):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job.sent_count += sent
+        job.failed_count += failed
+        job.api_calls_saved += api_calls_saved
+        if errors:
+            for error in errors:
+                self._error_seq += 1
+                self._errors[job_id].append((self._error_seq, error))
+            summaries = self._error_summary[job_id]
+            for error in errors:
+                code = error_code_of(error)
+                summary = summaries.get(code)
+                if summary is None:
+                    summaries[code] = ErrorSummary(
+                        error_code=code,
+                        count=1,
+                        error=error.get("error"),
+                        detailed_error=error.get("detailed_error")
+                    )
+                else:
+                    summary.count += 1
+        for seq, status, message_ts, error_code in recipients or []:
+            self._recipients[job_id][seq].update(status=status, message_ts=message_ts, error_code=error_code)
+        self._updated_at[job_id] = time.time()
+        self._notify_progress(job_id, sent, failed, api_calls_saved, errors)
+
+    def discard_errors(self, job_id: str, error_codes: Iterable[str]) -> int:
+        errors = self._errors.get(job_id)
+        if not errors:
+            return 0
+        error_codes = set(error_codes)
+        kept = [(seq, error) for seq, error in errors if error_code_of(error) not in error_codes]
+        discarded = len(errors) - len(kept)
+        if discarded:
+            self._errors[job_id] = kept
+            summaries = self._error_summary[job_id]
+            for code in error_codes:
+                summaries.pop(code, None)
+        return discarded
+
+    def update_status(self, job_id: str, status: str, completed_at: Optional[datetime] = None):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job.status = status
+        if completed_at is not None:
+            job.completed_at = completed_at
+        if status in FINISHED_STATUSES:
+            self._finished_at[job_id] = time.time()
+        else:
+            self._finished_at.pop(job_id, None)
+        self._updated_at[job_id] = time.time()
+        self._notify_status(job_id, status, completed_at)
+
+    def claim(self, job_id: str, from_statuses: Iterable[str] = FINISHED_STATUSES,
+              stale_after: Optional[float] = None) -> Optional[str]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        previous = job.status
+        stale = (
+            stale_after is not None
+            and previous in ACTIVE_STATUSES
+            and self._updated_at.get(job_id, 0.0) < time.time() - stale_after
+        )
+        if previous not in set(from_statuses) and not stale:
+            return None
+        self.update_status(job_id, "pending")
+        return previous
+
+    def evict_expired(self) -> int:
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, finished in self._finished_at.items() if finished < cutoff]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+            self._errors.pop(job_id, None)
+            self._error_summary.pop(job_id, None)
+            self._inputs.pop(job_id, None)
+            self._recipients.pop(job_id, None)
+            self._finished_at.pop(job_id, None)
+            self._updated_at.pop(job_id, None)
+        if expired:
+            expired_ids = set(expired)
+            self._idempotency = {key: job_id for key, job_id in self._idempotency.items() if job_id not in expired_ids}
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """SQLiteのジョブストア（再起動後もジョブを参照できる）"""
+
+    # 期限切れジョブの削除を行う最小間隔（秒）
+    EVICTION_INTERVAL = 60.0
+
+    def __init__(self, path: str, ttl: float):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self._last_eviction = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        has_summary = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'job_error_summary'"
+        ).fetchone() is not None
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                total_users INTEGER NOT NULL,
+                sent_count INTEGER NOT NULL DEFAULT 0,
+                failed_count INTEGER NOT NULL DEFAULT 0,
+                api_calls_saved INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                started_at TEXT,
+                completed_at TEXT,
+                finished_at REAL,
+                updated_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS job_errors (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                error_code TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_errors_job ON job_errors (job_id, seq);
+            CREATE TABLE IF NOT EXISTS job_error_summary (
+                job_id TEXT NOT NULL,
+                error_code TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (job_id, error_code)
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at);
+            CREATE TABLE IF NOT EXISTS job_inputs (
+                job_id TEXT PRIMARY KEY,
+                template TEXT NOT NULL,
+                user_data TEXT NOT NULL,
+                workspace TEXT,
+                idempotency_key TEXT UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS job_recipients (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                user TEXT NOT NULL,
+                status TEXT NOT NULL,
+                message_ts TEXT,
+                error_code TEXT,
+                PRIMARY KEY (job_id, seq)
+            );
+            """
+        )
+        # error_code列・updated_at列がない以前のデータベースに列を追加する
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(job_errors)")]
+        if "error_code" not in columns:
+            self._conn.execute("ALTER TABLE job_errors ADD COLUMN error_code TEXT")
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if "updated_at" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN updated_at REAL")
+        if not has_summary:
+            # 以前のデータベースのエラーから集計を作成する（最初に発生した順に挿入する）
+            self._conn.execute(
+                "INSERT INTO job_error_summary (job_id, error_code, count, data)"
+                " SELECT s.job_id, s.error_code, s.count, e.data FROM ("
+                " SELECT job_id, COALESCE(error_code, 'unknown') AS error_code, COUNT(*) AS count, MIN(seq) AS first_seq"
+                " FROM job_errors GROUP BY 1, 2"
+                ") s JOIN job_errors e ON e.seq = s.first_seq ORDER BY s.first_seq"
+            )
+        self._conn.commit()
+
+    def create(self, job: SendResult, users: List[User], template: str,
+               user_data: Dict[str, Dict[str, Any]], workspace: Optional[str] = None,
+               idempotency_key: Optional[str] = None):
+        self._maybe_evict()
+        try:
+            self._conn.execute(
+                "INSERT INTO job_inputs (job_id, template, user_data, workspace, idempotency_key) VALUES (?, ?, ?, ?, ?)",
+                (job.job_id, template, json.dumps(user_data, ensure_ascii=False), workspace, idempotency_key)
+            )
+        except sqlite3.IntegrityError:
+            self._conn.rollback()
+            raise DuplicateJobError(self.find_by_idempotency_key(idempotency_key))
+        self._conn.executemany(
+            "INSERT INTO job_recipients (job_id, seq, user, status) VALUES (?, ?, ?, ?)",
+            [(job.job_id, seq, user.model_dump_json(), RECIPIENT_PENDING) for seq, user in enumerate(users)]
+        )
+        self._conn.execute(
+            "INSERT INTO jobs (job_id, total_users, sent_count, failed_count, api_calls_saved, status, started_at,"
+            " completed_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job.job_id, job.total_users, job.sent_count, job.failed_count, job.api_calls_saved, job.status,
+                job.started_at.isoformat() if job.started_at else None,
+                job.completed_at.isoformat() if job.completed_at else None,
+                time.time()
+            )
+        )
+        self._conn.commit()
+
+    def find_by_idempotency_key(self, idempotency_key: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT job_id FROM job_inputs WHERE idempotency_key = ?", (idempotency_key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_input(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT template, user_data, workspace FROM job_inputs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"template": row[0], "user_data": json.loads(row[1]), "workspace": row[2]}
+
+    def get_recipients(self, job_id: str, statuses: Iterable[str]) -> List[Tuple[int, User]]:
+        statuses = list(statuses)
+        placeholders = ", ".join("?" for _ in statuses)
+        rows = self._conn.execute(
+            f"SELECT seq, user FROM job_recipients WHERE job_id = ? AND status IN ({placeholders}) ORDER BY seq",
+            [job_id, *statuses]
+        )
+        return [(seq, User.model_validate_json(user)) for seq, user in rows]
+
+    def get(self, job_id: str) -> Optional[SendResult]:
+        row = self._conn.execute(
+            "SELECT job_id, total_users, sent_count, failed_count, api_calls_saved, status, started_at, completed_at"
+            " FROM jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        # エラーコードごとの件数と最初のエラーは書き込み時に集計済み（rowidの順が最初に発生した順）
+        summary = []
+        for code, count, data in self._conn.execute(
+            "SELECT error_code, count, data FROM job_error_summary WHERE job_id = ? ORDER BY rowid",
+            (job_id,)
+        ):
+            first = json.loads(data)
+            summary.append(ErrorSummary(
+                error_code=code,
+                count=count,
+                error=first.get("error"),
+                detailed_error=first.get("detailed_error")
+            ))
+        return SendResult(
+            job_id=row[0],
+            total_users=row[1],
+            sent_count=row[2],
+            failed_count=row[3],
+            api_calls_saved=row[4],
+            status=row[5],
+            started_at=datetime.fromisoformat(row[6]) if row[6] else None,
+            completed_at=datetime.fromisoformat(row[7]) if row[7] else None,
+            error_count=sum(item.count for item in summary),
+            error_summary=summary
+        )
+
+    def get_errors(self, job_id: str, after: int = 0,
+                   limit: int = DEFAULT_ERRORS_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        # カーソルはjob_errorsのseq。次のページの有無を知るため1件多く取得する
+        rows = self._conn.execute(
+            "SELECT seq, data FROM job_errors WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (job_id, after, limit + 1)
+        ).fetchall()
+        page = rows[:limit]
+        next_cursor = page[-1][0] if len(rows) > limit else None
+        return [json.loads(data) for _, data in page], next_cursor
+
+    def update_progress(self, job_id: str, sent: int = 0, failed: int = 0,
+                        api_calls_saved: int = 0, errors: Optional[List[Dict[str, Any]]] = None,
+                        recipients: Optional[List[RecipientUpdate]] = None):
+        self._conn.execute(
+            "UPDATE jobs SET sent_count = sent_count + ?, failed_count = failed_count + ?,"
+            " api_calls_saved = api_calls_saved + ?, updated_at = ? WHERE job_id = ?",
+            (sent, failed, api_calls_saved, time.time(), job_id)
+        )
+        if errors:
+            self._insert_errors(job_id, errors)
+        if recipients:
+            self._conn.executemany(
+                "UPDATE job_recipients SET status = ?, message_ts = ?, error_code = ? WHERE job_id = ? AND seq = ?",
+                [(status, message_ts, error_code, job_id, seq) for seq, status, message_ts, error_code in recipients]
+            )
+        self._conn.commit()
+        self._notify_progress(job_id, sent, failed, api_calls_saved, errors)
+
+    def discard_errors(self, job_id: str, error_codes: Iterable[str]) -> int:
+        error_codes = list(error_codes)
+        placeholders = ", ".join("?" for _ in error_codes)
+        cursor = self._conn.execute(
+            f"DELETE FROM job_errors WHERE job_id = ? AND COALESCE(error_code, 'unknown') IN ({placeholders})",
+            [job_id, *error_codes]
+        )
+        self._conn.execute(
+            f"DELETE FROM job_error_summary WHERE job_id = ? AND error_code IN ({placeholders})",
+            [job_id, *error_codes]
+        )
+        self._conn.commit()
+        return cursor.rowcount
+
+    def update_status(self, job_id: str, status: str, completed_at: Optional[datetime] = None):
+        now = time.time()
+        finished_at = now if status in FINISHED_STATUSES else None
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, completed_at = COALESCE(?, completed_at), finished_at = ?, updated_at = ?"
+            " WHERE job_id = ?",
+            (status, completed_at.isoformat() if completed_at else None, finished_at, now, job_id)
+        )
+        self._conn.commit()
+        self._notify_status(job_id, status, completed_at)
+
+    def claim(self, job_id: str, from_statuses: Iterable[str] = FINISHED_STATUSES,
+              stale_after: Optional[float] = None) -> Optional[str]:
+        from_statuses = list(from_statuses)
+        now = time.time()
+        # 他のプロセスと同時に確保しないよう、確認から変更までを書き込みトランザクションで行う
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT status, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                self._conn.rollback()
+                return None
+            previous, updated_at = row
+            stale = (
+                stale_after is not None
+                and previous in ACTIVE_STATUSES
+                and (updated_at or 0.0) < now - stale_after
+            )
+            if previous not in from_statuses and not stale:
+                self._conn.rollback()
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'pending', finished_at = NULL, updated_at = ? WHERE job_id = ?",
+                (now, job_id)
+            )
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+        self._notify_status(job_id, "pending", None)
+        return previous
+
+    def evict_expired(self) -> int:
+        cutoff = time.time() - self.ttl
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT job_id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+        )]
+        for job_id in expired:
+            for table in ("job_errors", "job_error_summary", "job_recipients", "job_inputs", "jobs"):
+                self._conn.execute(f"DELETE FROM {table} WHERE job_id = ?", (job_id,))
+        self._conn.commit()
+        if expired:
+            logger.info(f"Evicted {len(expired)} expired jobs")
+        return len(expired)
+
+    def _maybe_evict(self):
+        now = time.time()
+        if now - self._last_eviction >= self.EVICTION_INTERVAL:
+            self._last_eviction = now
+            self.evict_expired()
+
+    def _insert_errors(self, job_id: str, errors: List[Dict[str, Any]]):
+        if not errors:
+            return
+        rows = [(job_id, error_code_of(error), json.dumps(error, ensure_ascii=False)) for error in errors]
+        self._conn.executemany("INSERT INTO job_errors (job_id, error_code, data) VALUES (?, ?, ?)", rows)
+        # エラーコードごとの件数を加算し、最初のエラーは最初に書き込んだものを残す
+        counts: Dict[str, List[Any]] = {}
+        for _, code, data in rows:
+            if code in counts:
+                counts[code][0] += 1
+            else:
+                counts[code] = [1, data]
+        self._conn.executemany(
+            "INSERT INTO job_error_summary (job_id, error_code, count, data) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (job_id, error_code) DO UPDATE SET count = count + excluded.count",
+            [(job_id, code, count, data) for code, (count, data) in counts.items()]
+        )
+
+
+class JobProgress:
+    """送信結果をまとめてジョブストアに書き込むバッファ
+
+    受信者ごとに書き込むのではなく、一定件数または一定時間ごとに
+    差分（カウンタ・エラー・受信者の状態）をまとめて反映する。
+    受信者は送信を開始する直前に sending として記録するため、プロセスが停止しても
+    送信済みかどうか不明な受信者は送信中だったもの（高々同時送信数）に限られる。
+    """
+
+    def __init__(self, store: JobStore, job_id: str,
+                 flush_size: Optional[int] = None, flush_interval: Optional[float] = None):
+        self.store = store
+        self.job_id = job_id
+        self.flush_size = flush_size or settings.JOB_PROGRESS_FLUSH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else settings.JOB_PROGRESS_FLUSH_INTERVAL
+        self._reset()
+        self._last_flush = time.monotonic()
+        # 送信開始の記録を待っている受信者と、その書き込み
+        self._dispatching: List[int] = []
+        self._dispatch_write: Optional["asyncio.Future[None]"] = None
+
+    def _reset(self):
+        self.sent = 0
+        self.failed = 0
+        self.api_calls_saved = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.recipients: List[RecipientUpdate] = []
+        self.pending = 0
+
+    async def dispatch(self, seq: int):
+        """受信者の送信開始（sending）を記録
+
+        同時に送信を開始するワーカーの分は1回の書き込みにまとめ、
+        書き込みが終わってから戻る（記録前に送信を始めない）。
+        """
+        self._dispatching.append(seq)
+        if self._dispatch_write is None:
+            self._dispatch_write = asyncio.ensure_future(self._write_dispatching())
+        await asyncio.shield(self._dispatch_write)
+
+    async def _write_dispatching(self):
+        # 他のワーカーが送信を開始する分を待ってからまとめて書き込む
+        await asyncio.sleep(0)
+        seqs, self._dispatching, self._dispatch_write = self._dispatching, [], None
+        self.store.update_progress(
+            self.job_id,
+            recipients=[(seq, RECIPIENT_SENDING, None, None) for seq in seqs]
+        )
+
+    def record(self, sent: int = 0, failed: int = 0, api_calls_saved: int = 0,
+               error: Optional[Dict[str, Any]] = None, recipient: Optional[RecipientUpdate] = None):
+        """1件分の結果を記録し、必要ならストアへ反映"""
+        self.sent += sent
+        self.failed += failed
+        self.api_calls_saved += api_calls_saved
+        if error is not None:
+            self.errors.append(error)
+        if recipient is not None:
+            self.recipients.append(recipient)
+        self.pending += 1
+
+        if self.pending >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """溜まっている差分をストアへ反映"""
+        if self.pending or self.errors:
+            self.store.update_progress(
+                self.job_id,
+                sent=self.sent,
+                failed=self.failed,
+                api_calls_saved=self.api_calls_saved,
+                errors=self.errors,
+                recipients=self.recipients
+            )
+            self._reset()
+        self._last_flush = time.monotonic()
+
+
+def create_job_store() -> JobStore:
+    """設定に応じたジョブストアを生成"""
+    if settings.JOB_STORE == "memory":
+        return MemoryJobStore(ttl=settings.JOB_TTL_SECONDS)
+    return SQLiteJobStore(settings.JOB_STORE_PATH, ttl=settings.JOB_TTL_SECONDS)
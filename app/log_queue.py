@@ -0,0 +1,123 @@
+import atexit
+import logging
+import logging.config
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Tuple
+
+from .config import settings
+
+# キュー経由で出力するロガー（dictConfigのロガー名）
+QUEUED_LOGGERS = ("", "send_results")
+
+
+class BoundedQueueHandler(QueueHandler):
+    """容量に上限のあるキューへログレコードを渡すハンドラー
+
+    キューが満杯のとき、policy が "drop" ならレコードを破棄し、"block" なら
+    block_timeout 秒まで空きを待つ（待っても空かなければ破棄する）。
+    破棄したレコードは dropped に数える。
+    """
+
+    def __init__(self, log_queue: queue.Queue, policy: str = "drop", block_timeout: float = 1.0):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.enqueued = 0
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self.policy == "block":
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self.enqueued += 1
+
+
+class BoundedQueueListener(QueueListener):
+    """容量に上限のあるキューからレコードを取り出して出力するリスナー"""
+
+    def enqueue_sentinel(self):
+        # キューが満杯でも停止できるよう、空きを待って終了の目印を入れる
+        self.queue.put(self._sentinel)
+
+
+class QueueLogging:
+    """ロガーのハンドラーをキュー経由の出力に切り替える
+
+    ファイルへの書き込みやローテーションはリスナーのスレッドで行い、
+    ログを出力したスレッド（イベントループ）はキューに入れるだけで戻る。
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, BoundedQueueHandler] = {}
+        self._listeners: List[Tuple[logging.Logger, BoundedQueueListener]] = []
+
+    def install(self, logger_names, maxsize: int, policy: str, block_timeout: float):
+        """各ロガーのハンドラーをリスナーへ移し、キューへ渡すハンドラーに置き換える"""
+        for name in logger_names:
+            logger = logging.getLogger(name)
+            handlers = list(logger.handlers)
+            if not handlers:
+                continue
+
+            log_queue: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+            queue_handler = BoundedQueueHandler(log_queue, policy, block_timeout)
+            for handler in handlers:
+                logger.removeHandler(handler)
+            logger.addHandler(queue_handler)
+
+            listener = BoundedQueueListener(log_queue, *handlers, respect_handler_level=True)
+            listener.start()
+            self._handlers[name or "root"] = queue_handler
+            self._listeners.append((logger, listener))
+
+    def stop(self):
+        """キューに残ったレコードを出力してリスナーを停止し、元のハンドラーに戻す"""
+        for logger, listener in self._listeners:
+            listener.stop()
+            for handler in list(logger.handlers):
+                if isinstance(handler, BoundedQueueHandler):
+                    logger.removeHandler(handler)
+            for handler in listener.handlers:
+                logger.addHandler(handler)
+        self._listeners.clear()
+        self._handlers.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """ロガーごとのキューの状態"""
+        return {
+            "mode": "queue" if self._handlers else "sync",
+            "loggers": {
+                name: {
+                    "queued": handler.queue.qsize(),
+                    "capacity": handler.queue.maxsize,
+                    "policy": handler.policy,
+                    "enqueued": handler.enqueued,
+                    "dropped": handler.dropped,
+                }
+                for name, handler in self._handlers.items()
+            },
+        }
+
+
+# プロセス全体で共有するインスタンス
+queue_logging = QueueLogging()
+
+
+def configure_logging():
+    """設定に従ってログを構成（LOG_MODE=queue ならキュー経由で出力）"""
+    logging.config.dictConfig(settings.get_log_config())
+    if settings.LOG_MODE == "queue":
+        queue_logging.install(
+            QUEUED_LOGGERS,
+            maxsize=settings.LOG_QUEUE_SIZE,
+            policy=settings.LOG_QUEUE_POLICY,
+            block_timeout=settings.LOG_QUEUE_BLOCK_TIMEOUT
+        )
+        # サーバー以外（ベンチマーク等）で読み込んだ場合も終了時に書き出す
+        atexit.register(queue_logging.stop)
@@ -1,41 +1,69 @@
 import logging
-import logging.config
 import asyncio
+import json
+import time
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks, Header, Request, Query
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
 from .config import settings
 from .models import (
     ParseMentionsRequest, ParseMentionsResponse,
-    PreviewRequest, PreviewResponse,
-    SendRequest, SendResult,
-    ImportVariablesResponse,
+    PreviewRequest, PreviewResponse, PreviewStats,
+    SendRequest, SendResult, ResumeRequest, JobErrorsPage,
+    ImportVariablesResponse, InvalidateCacheRequest,
     ErrorResponse, User
 )
-from .slack_client import SlackClient
+from .slack_client import SlackClient, SlackWorkspaceError
+from .directory_cache import directory_cache, token_key
+from .rate_limiter import rate_limiter
+from .channel_cache import channel_cache
+from .token_cache import token_cache
+from .http_session import http_session
+from .metrics import registry as metrics_registry, send_job_messages, send_jobs_finished, send_job_seconds, send_jobs_active
 from .message_processor import MessageProcessor
-from .user_parser import UserParser
+from .user_parser import UserParser, ImportFileError, ImportFileTooLargeError
+from .send_engine import SendEngine
+from .job_store import (
+    create_job_store, JobProgress, DuplicateJobError, FINISHED_STATUSES,
+    RECIPIENT_PENDING, RECIPIENT_SENDING, RECIPIENT_SENT, RECIPIENT_FAILED, RECIPIENT_ABORTED
+)
+from .progress_broker import progress_broker
+from .send_ledger import send_ledger
+from .log_queue import configure_logging, queue_logging
 
 # ログ設定
-logging.config.dictConfig(settings.get_log_config())
+configure_logging()
 logger = logging.getLogger(__name__)
 send_results_logger = logging.getLogger("send_results")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """アプリケーションの起動・終了処理"""
+    yield
+    # 保存待ちのDMチャンネルIDを書き込む
+    channel_cache.flush()
+    # Slack APIへの接続プールを閉じる
+    await http_session.close()
+    # キューに残ったログを書き出す
+    queue_logging.stop()
+
 # アプリケーション初期化
 app = FastAPI(
     title=settings.APP_NAME,
     description="Slack DM Batch Sender - Send personalized DMs to multiple users",
     version="1.0.0",
     docs_url="/docs" if settings.DEBUG else None,
-    redoc_url="/redoc" if settings.DEBUG else None
+    redoc_url="/redoc" if settings.DEBUG else None,
+    lifespan=lifespan
 )
 
 # CORS設定
@@ -50,8 +78,12 @@ app.add_middleware(
 # 静的ファイル配信
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# グローバル変数（本格的なアプリケーションではRedisなどを使用）
-jobs: Dict[str, SendResult] = {}
+# グローバル変数
+job_store = create_job_store()
+job_store.add_listener(progress_broker.publish)
+# このプロセスで実行中のジョブ
+running_jobs = set()
+send_jobs_active.set_function(lambda: len(running_jobs))
 message_processor = MessageProcessor()
 user_parser = UserParser()
 
@@ -60,6 +92,32 @@ async def health_check():
     """ヘルスチェックエンドポイント（Cloud Run用）"""
     return {"status": "healthy", "service": settings.APP_NAME, "version": "1.0.0"}
 
+@app.get("/api/stats")
+async def get_stats():
+    """プロセス内キャッシュ等の統計情報API"""
+    return {
+        "directory_cache": directory_cache.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "channel_cache": channel_cache.stats(),
+        "progress_stream": progress_broker.stats(),
+        "template_cache": message_processor.cache_stats(),
+        "logging": queue_logging.stats(),
+        "send_ledger": send_ledger.stats(),
+        "token_cache": token_cache.stats(),
+        "http_session": http_session.stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus形式のメトリクス"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/cache/directory/invalidate")
+async def invalidate_directory_cache(request: InvalidateCacheRequest):
+    """ユーザーディレクトリキャッシュの無効化API"""
+    slack_client = SlackClient(request.token)
+    return {"invalidated": slack_client.invalidate_users_cache()}
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
     """Web UIを配信"""
@@ -94,11 +152,12 @@ async def parse_mentions(request: ParseMentionsRequest):
         logger.info(f"Extracted mentions: {mentions}")
         
         # ユーザー情報解決
-        users, errors = await slack_client.resolve_users_from_mentions(mentions)
+        users, errors, warnings = await slack_client.resolve_users_from_mentions(mentions)
         
         return ParseMentionsResponse(
             users=[User(**user) for user in users],
-            errors=errors
+            errors=errors,
+            warnings=warnings
         )
     
     except HTTPException:
@@ -119,19 +178,16 @@ async def preview_messages(request: PreviewRequest):
         # 変数抽出
         available_variables = message_processor.extract_variables(request.template)
         
-        # ユーザーごとにレンダリング
-        rendered_messages = {}
-        all_missing_variables = set()
-        
-        for user_id, variables in request.user_data.items():
-            result = message_processor.render_template_safe(request.template, variables)
-            rendered_messages[user_id] = result["rendered_message"]
-            all_missing_variables.update(result.get("missing_variables", []))
+        # 全ユーザー分をバッチごとにレンダリングして集計し、メッセージはサンプルのみ返す
+        sample_size = request.sample_size if request.sample_size is not None else settings.PREVIEW_SAMPLE_SIZE
+        preview = await message_processor.build_preview(request.template, request.user_data, sample_size)
+        stats = preview.stats()
         
         return PreviewResponse(
-            rendered_messages=rendered_messages,
-            missing_variables=list(all_missing_variables),
-            available_variables=available_variables
+            rendered_messages=preview.samples,
+            missing_variables=list(stats["missing_variable_counts"]),
+            available_variables=available_variables,
+            stats=PreviewStats(**stats)
         )
     
     except HTTPException:
@@ -141,40 +197,54 @@ async def preview_messages(request: PreviewRequest):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.post("/api/import-variables", response_model=ImportVariablesResponse)
-async def import_variables(file: UploadFile = File(...)):
-    """変数データCSV/JSONインポートAPI"""
+async def import_variables(file: UploadFile = File(...), token: Optional[str] = Form(None)):
+    """変数データCSV/JSON/NDJSONインポートAPI
+
+    トークンを指定した場合は識別子をSlackユーザーに解決し、
+    SlackユーザーIDをキーにした変数データと解決したユーザーを返す。
+    """
     try:
-        # ファイルサイズチェック
+        # ファイルサイズチェック（サイズ不明の場合は読み込み中に確認）
         if file.size and file.size > settings.MAX_FILE_SIZE:
             raise HTTPException(status_code=413, detail=f"File too large. Max size: {settings.MAX_FILE_SIZE} bytes")
         
-        # ファイル内容読み取り
-        content = await file.read()
-        file_content = content.decode('utf-8')
+        slack_client = None
+        if token:
+            slack_client = SlackClient(token)
+            if not await slack_client.validate_token():
+                raise HTTPException(status_code=401, detail="Invalid Slack token")
         
-        # ファイル形式検証
-        is_valid, format_msg = user_parser.validate_file_format(file_content, file.filename or "")
-        if not is_valid:
-            raise HTTPException(status_code=400, detail=format_msg)
-        
-        # ファイル解析
-        if file.filename and file.filename.lower().endswith('.json'):
-            users_data, errors = user_parser.parse_json(file_content)
-        else:
-            users_data, errors = user_parser.parse_csv(file_content)
+        # ファイルをチャンクごとに読みながら解析（イベントループを塞がないようスレッドプールで実行）
+        loop = asyncio.get_running_loop()
+        try:
+            rows = await loop.run_in_executor(
+                None, user_parser.iter_stream, file.file, file.filename or "", settings.MAX_FILE_SIZE
+            )
+            if slack_client is not None:
+                # IMPORT_RESOLVE_BATCH_SIZE 行ずつ解析して識別子をまとめて解決し、解決済みの結果のみ保持する
+                imported_count, resolved_users, user_variables, errors = await user_parser.resolve_stream_with_variables(
+                    slack_client, rows, settings.IMPORT_RESOLVE_BATCH_SIZE
+                )
+            else:
+                # 識別子をキーとして使用（トークンを指定すればSlackユーザーIDに解決される）
+                resolved_users = []
+                imported_count, user_variables, errors = await loop.run_in_executor(
+                    None, user_parser.collect_variables, rows
+                )
+        except ImportFileTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except ImportFileError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except SlackWorkspaceError as e:
+            raise HTTPException(status_code=403, detail=f"Cannot resolve users: {e}")
         
         if errors:
             logger.warning(f"Import errors: {errors}")
         
-        # 変数データを構築
-        user_variables = {}
-        for user_data in users_data:
-            # 識別子をキーとして使用（実際の使用時にはSlackユーザーIDに解決される）
-            user_variables[user_data["identifier"]] = user_data["variables"]
-        
         return ImportVariablesResponse(
-            imported_count=len(users_data),
+            imported_count=imported_count,
             user_data=user_variables,
+            users=[User(**user) for user in resolved_users],
             errors=errors
         )
     
@@ -185,9 +255,21 @@ async def import_variables(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.post("/api/send-messages", response_model=SendResult)
-async def send_messages(request: SendRequest, background_tasks: BackgroundTasks):
-    """メッセージ送信API"""
+async def send_messages(
+    request: SendRequest,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """メッセージ送信API（Idempotency-Keyヘッダーで二重送信を防止）"""
     try:
+        # 同じ冪等キーのジョブが既にあればそれを返す（キーはワークスペース単位）
+        scoped_key = f"{token_key(request.token)}:{idempotency_key}" if idempotency_key else None
+        if scoped_key:
+            existing_job_id = job_store.find_by_idempotency_key(scoped_key)
+            if existing_job_id:
+                logger.info(f"Duplicate send request for job {existing_job_id}; returning existing job")
+                return job_store.get(existing_job_id)
+        
         # Slackクライアント初期化
         slack_client = SlackClient(request.token)
         
@@ -208,14 +290,25 @@ async def send_messages(request: SendRequest, background_tasks: BackgroundTasks)
             status="pending",
             started_at=datetime.utcnow()
         )
-        jobs[job_id] = job
+        try:
+            job_store.create(
+                job,
+                request.users,
+                request.template,
+                request.user_data,
+                workspace=slack_client.cache_key,
+                idempotency_key=scoped_key
+            )
+        except DuplicateJobError as e:
+            logger.info(f"Duplicate send request for job {e.job_id}; returning existing job")
+            return job_store.get(e.job_id)
         
         # バックグラウンドで送信処理を開始
         background_tasks.add_task(
             process_send_job,
             job_id,
             request.template,
-            request.users,
+            list(enumerate(request.users)),
             request.user_data,
             slack_client
         )
@@ -231,90 +324,288 @@ async def send_messages(request: SendRequest, background_tasks: BackgroundTasks)
 
 @app.get("/api/status/{job_id}", response_model=SendResult)
 async def get_job_status(job_id: str):
-    """送信状況確認API"""
-    if job_id not in jobs:
+    """送信状況確認API（エラーはエラーコードごとの件数のみ）"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job
+
+@app.get("/api/status/{job_id}/errors", response_model=JobErrorsPage)
+async def get_job_errors(
+    job_id: str,
+    after: int = Query(0, ge=0, description="Cursor returned as next_cursor by the previous page"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """送信エラー一覧API（カーソルによるページング）"""
+    if job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    errors, next_cursor = job_store.get_errors(job_id, after=after, limit=limit)
+    return JobErrorsPage(errors=errors, next_cursor=next_cursor)
+
+@app.get("/api/status/{job_id}/ledger")
+async def export_job_ledger(job_id: str):
+    """受信者ごとの送信結果の台帳（NDJSON）のエクスポートAPI
+
+    台帳はファイルから順に読み出して送るため、ジョブの規模によらず
+    メモリに読み込まない。実行中のジョブはその時点までの記録を返す。
+    """
+    if not send_ledger.exists(job_id):
+        raise HTTPException(status_code=404, detail="Ledger not found")
+    
+    return StreamingResponse(
+        send_ledger.iter_bytes(job_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{job_id}.ndjson"'}
+    )
+
+@app.get("/api/status/{job_id}/stream")
+async def stream_job_status(job_id: str, request: Request):
+    """送信状況のストリーム配信API（Server-Sent Events）
+
+    接続時に現在の状況（エラーは集計のみ）を snapshot イベントで送り、以降は
+    進捗の差分（カウンタの増分と新しいエラーのみ）を progress イベントで送る。
+    ジョブが終了したら最終状況（エラーの集計を含む）を snapshot イベントで送って
+    ストリームを閉じる。
+    """
+    if job_store.get(job_id) is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    return jobs[job_id]
+    def format_event(event: str, data: str) -> str:
+        return f"event: {event}\ndata: {data}\n\n"
+    
+    async def events():
+        # 購読の開始と現在の状況の取得の間に変更が入らないよう、awaitを挟まずに行う
+        subscription = progress_broker.subscribe(job_id)
+        try:
+            job = job_store.get(job_id)
+            if job is None:
+                return
+            yield format_event("snapshot", job.model_dump_json())
+            if job.status in FINISHED_STATUSES:
+                return
+            
+            while True:
+                delta = await subscription.get(settings.PROGRESS_STREAM_KEEPALIVE)
+                if delta is not None:
+                    yield format_event("progress", json.dumps(delta, ensure_ascii=False))
+                    if delta.get("status") in FINISHED_STATUSES:
+                        job = job_store.get(job_id)
+                        if job is not None:
+                            yield format_event("snapshot", job.model_dump_json())
+                        return
+                    continue
+                
+                if await request.is_disconnected():
+                    return
+                # 他のインスタンスで実行中のジョブは配信されないため、終了していれば最終状況を送る
+                job = job_store.get(job_id)
+                if job is None or job.status in FINISHED_STATUSES:
+                    if job is not None:
+                        yield format_event("snapshot", job.model_dump_json())
+                    return
+                yield ": keepalive\n\n"
+        finally:
+            progress_broker.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/jobs/{job_id}/resume", response_model=SendResult)
+async def resume_job(job_id: str, request: ResumeRequest, background_tasks: BackgroundTasks):
+    """中断したジョブの再開API（未送信の受信者にのみ送信）"""
+    job_input = job_store.get_input(job_id)
+    if job_input is None or job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    slack_client = SlackClient(request.token)
+    if job_input["workspace"] and job_input["workspace"] != slack_client.cache_key:
+        raise HTTPException(status_code=403, detail="Token does not belong to the job's workspace")
+    
+    # 状態の確認と変更を不可分に行い、同じジョブの再開を1回だけ受け付ける（awaitより前に確保する）
+    previous_status = None
+    if job_id not in running_jobs:
+        previous_status = job_store.claim(job_id, stale_after=settings.JOB_STALE_SECONDS)
+    if previous_status is None:
+        raise HTTPException(status_code=409, detail="Job is already running or being resumed")
+    
+    def release(status: str):
+        """再開しなかったジョブを終了した状態に戻す（取り残されていたジョブは終了扱いにする）"""
+        if previous_status in FINISHED_STATUSES:
+            job_store.update_status(job_id, previous_status)
+        else:
+            job_store.update_status(job_id, status, completed_at=datetime.utcnow())
+    
+    try:
+        if not await slack_client.validate_token():
+            raise HTTPException(status_code=401, detail="Invalid Slack token")
+    except BaseException:
+        release("failed")
+        raise
+    
+    if not request.retry_uncertain:
+        # 送信開始後に結果が記録されなかった受信者は、二重送信を避けるため失敗として扱う
+        uncertain = job_store.get_recipients(job_id, [RECIPIENT_SENDING])
+        if uncertain:
+            job_store.update_progress(
+                job_id,
+                failed=len(uncertain),
+                errors=[{
+                    "user_id": user.id,
+                    "user_name": user.display_name,
+                    "error": "Delivery could not be confirmed; not resent",
+                    "error_code": "delivery_unknown",
+                    "detailed_error": "送信済みか確認できなかったため再送信しませんでした。\n• 必要な場合は retry_uncertain を指定して再開してください"
+                } for _, user in uncertain],
+                recipients=[(seq, RECIPIENT_FAILED, None, "delivery_unknown") for seq, _ in uncertain]
+            )
+    
+    # 中断で送信しなかった受信者は失敗数から除いて再度送信する
+    aborted = job_store.get_recipients(job_id, [RECIPIENT_ABORTED])
+    if aborted:
+        job_store.update_progress(
+            job_id,
+            failed=-len(aborted),
+            recipients=[(seq, RECIPIENT_PENDING, None, None) for seq, _ in aborted]
+        )
+    
+    statuses = [RECIPIENT_PENDING, RECIPIENT_SENDING] if request.retry_uncertain else [RECIPIENT_PENDING]
+    recipients = job_store.get_recipients(job_id, statuses)
+    if not recipients:
+        release("completed")
+        return job_store.get(job_id)
+    
+    # 中断した受信者のエラーとジョブ全体のエラー（中断・異常終了）は再開後の結果で置き換わる
+    job_store.discard_errors(job_id, ["job_aborted", "job_error"])
+    background_tasks.add_task(
+        process_send_job,
+        job_id,
+        job_input["template"],
+        recipients,
+        job_input["user_data"],
+        slack_client
+    )
+    
+    logger.info(f"Resumed send job {job_id} for {len(recipients)} remaining users")
+    return job_store.get(job_id)
 
 async def process_send_job(
     job_id: str,
     template: str,
-    users: List[User],
+    recipients: List[Tuple[int, User]],
     user_data: Dict[str, Dict[str, Any]],
     slack_client: SlackClient
 ):
-    """バックグラウンド送信処理"""
-    job = jobs[job_id]
-    job.status = "running"
+    """バックグラウンド送信処理
+
+    recipients は (ジョブ内の受信者番号, ユーザー) の一覧。受信者ごとの状態は
+    まとめてチェックポイントとして記録され、再開時は未送信の受信者のみを対象にする。
+    """
+    running_jobs.add(job_id)
+    started = time.perf_counter()
+    job_store.update_status(job_id, "running")
+    # 進捗はまとめてジョブストアへ書き込む
+    progress = JobProgress(job_store, job_id)
+    # 受信者ごとの結果は台帳へまとめて追記する
+    ledger = send_ledger.open(job_id)
     
-    sent_count = 0
-    failed_count = 0
-    errors = []
+    def record_result(index: int, result: Dict[str, Any]):
+        """送信結果をジョブに反映（受信者の順に呼ばれる）"""
+        seq = recipients[index][0]
+        user_label = f"{result['user_name']} ({result['user_id']})"
+        
+        if result["success"]:
+            status = RECIPIENT_SENT
+        elif result.get("error_code") == "job_aborted":
+            status = RECIPIENT_ABORTED
+        else:
+            status = RECIPIENT_FAILED
+        send_job_messages.inc(result=status)
+        
+        if ledger is not None:
+            ledger.append(
+                seq,
+                result["user_id"],
+                status,
+                error_code=result.get("error_code"),
+                attempts=result.get("attempts"),
+                latency=result.get("latency"),
+                message_ts=result.get("message_ts")
+            )
+        
+        if result["success"]:
+            progress.record(
+                sent=1,
+                api_calls_saved=result.get("api_calls_saved", 0),
+                recipient=(seq, RECIPIENT_SENT, result.get("message_ts"), None)
+            )
+            send_results_logger.info(f"Successfully sent DM to {user_label}")
+            return
+        
+        error_info = {
+            "user_id": result["user_id"],
+            "user_name": result["user_name"],
+            "error": result["error"],
+            "error_code": result.get("error_code", "unknown"),
+            "detailed_error": result.get("detailed_error", "詳細なエラー情報がありません")
+        }
+        progress.record(
+            failed=1,
+            error=error_info,
+            recipient=(
+                seq,
+                RECIPIENT_ABORTED if error_info["error_code"] == "job_aborted" else RECIPIENT_FAILED,
+                None,
+                error_info["error_code"]
+            )
+        )
+        send_results_logger.error(f"Failed to send DM to {user_label}: {error_info['error']} (Code: {error_info['error_code']})")
     
     try:
-        send_results_logger.info(f"Starting send job {job_id} for {len(users)} users")
+        send_results_logger.info(f"Starting send job {job_id} for {len(recipients)} users")
         
-        for user in users:
-            try:
-                # ユーザー固有の変数を取得
-                variables = user_data.get(user.id, {})
-                
-                # メッセージをレンダリング
-                result = message_processor.render_template_safe(template, variables)
-                if not result["success"]:
-                    error_msg = f"Template rendering failed: {result.get('error', 'Unknown error')}"
-                    errors.append({"user_id": user.id, "user_name": user.display_name, "error": error_msg})
-                    failed_count += 1
-                    continue
-                
-                rendered_message = result["rendered_message"]
-                
-                # DMを送信
-                send_result = await slack_client.send_dm_with_retry(user.id, rendered_message)
-                
-                if send_result["success"]:
-                    sent_count += 1
-                    send_results_logger.info(f"Successfully sent DM to {user.display_name} ({user.id})")
-                else:
-                    failed_count += 1
-                    error_msg = send_result.get("error", "Unknown error")
-                    error_code = send_result.get("error_code", "unknown")
-                    detailed_error = send_result.get("detailed_error", "詳細なエラー情報がありません")
-                    
-                    error_info = {
-                        "user_id": user.id, 
-                        "user_name": user.display_name, 
-                        "error": error_msg,
-                        "error_code": error_code,
-                        "detailed_error": detailed_error
-                    }
-                    errors.append(error_info)
-                    send_results_logger.error(f"Failed to send DM to {user.display_name} ({user.id}): {error_msg} (Code: {error_code})")
-                
-                # 進捗更新
-                job.sent_count = sent_count
-                job.failed_count = failed_count
-                job.errors = errors
-                
-            except Exception as e:
-                failed_count += 1
-                error_msg = f"Unexpected error: {str(e)}"
-                errors.append({"user_id": user.id, "user_name": user.display_name, "error": error_msg})
-                logger.error(f"Error sending to {user.display_name} ({user.id}): {error_msg}")
+        engine = SendEngine(slack_client, message_processor)
+        counts = await engine.run(
+            template,
+            (user for _, user in recipients),
+            user_data,
+            record_result,
+            on_dispatch=lambda index: progress.dispatch(recipients[index][0])
+        )
+        progress.flush()
+        
+        if engine.abort_result is not None:
+            # トークン・権限エラーにより中断
+            abort_code = engine.abort_result.get('error_code')
+            job_store.update_progress(job_id, errors=[{"error": f"Job aborted: {abort_code}", "error_code": "job_error"}])
+            job_store.update_status(job_id, "failed", completed_at=datetime.utcnow())
+            send_jobs_finished.inc(status="aborted")
+            send_results_logger.error(f"Aborted send job {job_id} after {abort_code}: {counts['sent']} sent, {counts['failed']} failed")
+            return
         
         # ジョブ完了
-        job.status = "completed"
-        job.completed_at = datetime.utcnow()
+        job_store.update_status(job_id, "completed", completed_at=datetime.utcnow())
+        send_jobs_finished.inc(status="completed")
         
-        send_results_logger.info(f"Completed send job {job_id}: {sent_count} sent, {failed_count} failed")
+        send_results_logger.info(f"Completed send job {job_id}: {counts['sent']} sent, {counts['failed']} failed, {counts['api_calls_saved']} API calls saved by channel cache")
         
     except Exception as e:
-        job.status = "failed"
-        job.completed_at = datetime.utcnow()
+        progress.flush()
         error_msg = f"Job failed: {str(e)}"
-        job.errors.append({"error": error_msg})
+        job_store.update_progress(job_id, errors=[{"error": error_msg, "error_code": "job_error"}])
+        job_store.update_status(job_id, "failed", completed_at=datetime.utcnow())
+        send_jobs_finished.inc(status="failed")
         logger.error(f"Send job {job_id} failed: {error_msg}")
+    finally:
+        send_job_seconds.observe(time.perf_counter() - started)
+        channel_cache.flush()
+        if ledger is not None:
+            ledger.close()
+        running_jobs.discard(job_id)
 
 if __name__ == "__main__":
     import os
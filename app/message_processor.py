@@ -1,32 +1,55 @@
 import re
+import time
+import asyncio
+import bisect
 import logging
-from typing import List, Dict, Any
+from collections import OrderedDict
+from itertools import islice
+from typing import List, Dict, Any, Optional, Tuple
+from .config import settings
+from .metrics import template_render_seconds, preview_seconds
 
 logger = logging.getLogger(__name__)
 
-class MessageProcessor:
-    def __init__(self):
-        # 変数パターン: {variable_name} 形式
-        self.variable_pattern = re.compile(r'\{([a-zA-Z_][a-zA-Z0-9_]*)\}')
-    
-    def extract_variables(self, template: str) -> List[str]:
-        """テンプレートから変数を抽出"""
-        if not template:
-            return []
-        
-        matches = self.variable_pattern.findall(template)
+# 変数パターン: {variable_name} 形式
+VARIABLE_PATTERN = re.compile(r'\{([a-zA-Z_][a-zA-Z0-9_]*)\}')
+# 波括弧で囲まれた部分（変数名の検証用）
+BRACED_PATTERN = re.compile(r'\{([^}]*)\}')
+VALID_NAME_PATTERN = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+# プレビューのメッセージ長の分布の区切り（文字数の上限）
+PREVIEW_LENGTH_BUCKETS = (100, 500, 1000, 2000, 4000, 10000, 40000)
+# 上限を超えたユーザーとして返す最大件数
+PREVIEW_MAX_OVER_LIMIT_USERS = 100
+
+
+class CompiledTemplate:
+    """解析済みのテンプレート
+
+    テンプレートを固定文字列と変数の並びに分解し、変数の一覧と
+    検証結果とともに保持する。レンダリングは分解済みの部分を連結するだけで行う。
+    """
+
+    __slots__ = ("template", "slots", "variables", "validation_errors", "_parts", "_slot_positions")
+
+    def __init__(self, template: str):
+        self.template = template
+        # VARIABLE_PATTERNでの分割結果は [文字列, 変数名, 文字列, 変数名, ..., 文字列]
+        parts = VARIABLE_PATTERN.split(template)
+        self.slots: Tuple[str, ...] = tuple(parts[1::2])
         # 重複を除去して順序を保持
-        variables = []
-        seen = set()
-        for var in matches:
-            if var not in seen:
-                variables.append(var)
-                seen.add(var)
-        
-        return variables
-    
-    def validate_template(self, template: str) -> List[str]:
-        """テンプレートを検証し、エラーメッセージのリストを返す"""
+        self.variables: Tuple[str, ...] = tuple(dict.fromkeys(self.slots))
+        self.validation_errors: Tuple[str, ...] = tuple(self._validate(template))
+        # レンダリング用の部品。変数の位置には元の {name} を入れておき、値があれば置き換える
+        self._parts: Tuple[str, ...] = tuple(
+            part if index % 2 == 0 else f"{{{part}}}" for index, part in enumerate(parts)
+        )
+        self._slot_positions: Tuple[Tuple[int, str], ...] = tuple(
+            (index, part) for index, part in enumerate(parts) if index % 2 == 1
+        )
+
+    @staticmethod
+    def _validate(template: str) -> List[str]:
         errors = []
         
         if not template or not template.strip():
@@ -35,12 +58,8 @@ class MessageProcessor:
         
         # 不正な変数形式をチェック
         # 例: {123}, {var-name}, {var name} など
-        invalid_pattern = re.compile(r'\{([^}]*)\}')
-        all_matches = invalid_pattern.findall(template)
-        valid_pattern = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
-        
-        for match in all_matches:
-            if not valid_pattern.match(match):
+        for match in BRACED_PATTERN.findall(template):
+            if not VALID_NAME_PATTERN.match(match):
                 errors.append(f"Invalid variable name: '{match}'. Variables must start with a letter or underscore, followed by letters, numbers, or underscores.")
         
         # 閉じられていない括弧をチェック
@@ -50,20 +69,159 @@ class MessageProcessor:
             errors.append(f"Mismatched braces: {open_count} opening, {close_count} closing")
         
         return errors
+
+    def missing_variables(self, variables: Dict[str, Any]) -> List[str]:
+        """値が指定されていない変数"""
+        return [name for name in self.variables if name not in variables]
+
+    def render(self, variables: Dict[str, Any]) -> str:
+        """1回の走査でレンダリング（値のない変数は {name} のまま残す）
+
+        変数以外の波括弧はそのまま出力し、置き換えた値の中の {name} は
+        再度置き換えない。
+        """
+        if not self._slot_positions:
+            return self.template
+        parts = list(self._parts)
+        for position, name in self._slot_positions:
+            if name in variables:
+                parts[position] = str(variables[name])
+        return "".join(parts)
+
+
+class PreviewAccumulator:
+    """プレビューの集計
+
+    ユーザーごとのレンダリング結果を1回の走査で集計し、先頭 sample_size 件の
+    メッセージと、変数ごとの欠損数・メッセージ長の分布・上限超過数を保持する。
+    add_batch はスレッドプールから呼べるよう、解析済みのテンプレートのみを使う。
+    """
+
+    def __init__(self, compiled: CompiledTemplate, sample_size: int, max_length: int):
+        self.compiled = compiled
+        self.sample_size = sample_size
+        self.max_length = max_length
+        self.total = 0
+        self.samples: Dict[str, str] = {}
+        self.missing_counts: Dict[str, int] = {}
+        self.users_with_missing = 0
+        self.length_min: Optional[int] = None
+        self.length_max = 0
+        self.length_sum = 0
+        self.length_buckets = [0] * (len(PREVIEW_LENGTH_BUCKETS) + 1)
+        self.over_limit_count = 0
+        self.over_limit_users: List[str] = []
+
+    def add_batch(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        """ユーザーID・変数の組をまとめてレンダリングして集計"""
+        compiled = self.compiled
+        for user_id, variables in batch:
+            rendered = compiled.render(variables)
+            length = len(rendered)
+            self.total += 1
+
+            missing = compiled.missing_variables(variables)
+            if missing:
+                self.users_with_missing += 1
+                for name in missing:
+                    self.missing_counts[name] = self.missing_counts.get(name, 0) + 1
+
+            if self.length_min is None or length < self.length_min:
+                self.length_min = length
+            if length > self.length_max:
+                self.length_max = length
+            self.length_sum += length
+            self.length_buckets[bisect.bisect_left(PREVIEW_LENGTH_BUCKETS, length)] += 1
+
+            if length > self.max_length:
+                self.over_limit_count += 1
+                if len(self.over_limit_users) < PREVIEW_MAX_OVER_LIMIT_USERS:
+                    self.over_limit_users.append(user_id)
+
+            if len(self.samples) < self.sample_size:
+                self.samples[user_id] = rendered
+
+    def stats(self) -> Dict[str, Any]:
+        """集計結果"""
+        histogram = {}
+        lower = 0
+        for upper, count in zip(PREVIEW_LENGTH_BUCKETS, self.length_buckets):
+            histogram[f"{lower}-{upper}"] = count
+            lower = upper + 1
+        histogram[f"{lower}-"] = self.length_buckets[-1]
+        return {
+            "total": self.total,
+            "missing_variable_counts": self.missing_counts,
+            "users_with_missing_variables": self.users_with_missing,
+            "length_min": self.length_min or 0,
+            "length_max": self.length_max,
+            "length_mean": round(self.length_sum / self.total, 1) if self.total else 0.0,
+            "length_histogram": histogram,
+            "max_length": self.max_length,
+            "over_limit_count": self.over_limit_count,
+            "over_limit_users": self.over_limit_users,
+        }
+
+
+class MessageProcessor:
+    def __init__(self, cache_size: Optional[int] = None):
+        self.variable_pattern = VARIABLE_PATTERN
+        # テンプレート文字列 -> 解析済みテンプレート（LRU）
+        self.cache_size = max(1, cache_size or settings.TEMPLATE_CACHE_SIZE)
+        self._compiled: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def compile(self, template: str) -> CompiledTemplate:
+        """解析済みのテンプレートを取得（同じテンプレートは1度だけ解析する）"""
+        compiled = self._compiled.get(template)
+        if compiled is not None:
+            self.cache_hits += 1
+            self._compiled.move_to_end(template)
+            return compiled
+        
+        self.cache_misses += 1
+        compiled = CompiledTemplate(template)
+        self._compiled[template] = compiled
+        if len(self._compiled) > self.cache_size:
+            self._compiled.popitem(last=False)
+        return compiled
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """テンプレートキャッシュの統計情報"""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "cached_templates": len(self._compiled),
+            "max_size": self.cache_size,
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": round(self.cache_hits / lookups, 4) if lookups else 0.0,
+        }
+    
+    def extract_variables(self, template: str) -> List[str]:
+        """テンプレートから変数を抽出"""
+        if not template:
+            return []
+        
+        return list(self.compile(template).variables)
+    
+    def validate_template(self, template: str) -> List[str]:
+        """テンプレートを検証し、エラーメッセージのリストを返す"""
+        return list(self.compile(template or "").validation_errors)
     
     def render_template(self, template: str, variables: Dict[str, Any]) -> str:
         """テンプレートに変数を埋め込んでレンダリング"""
         if not template:
             return ""
         
-        try:
-            # Pythonの文字列フォーマットを使用
-            return template.format(**variables)
-        except KeyError as e:
-            missing_var = str(e).strip("'")
-            logger.warning(f"Missing variable in template: {missing_var}")
+        compiled = self.compile(template)
+        missing_variables = compiled.missing_variables(variables)
+        if missing_variables:
             # 欠けている変数は元の形式で残す
-            return template
+            logger.warning(f"Missing variables in template: {', '.join(missing_variables)}")
+        
+        try:
+            return compiled.render(variables)
         except Exception as e:
             logger.error(f"Error rendering template: {str(e)}")
             return template
@@ -83,34 +241,32 @@ class MessageProcessor:
             return result
 
         # 必要な変数を取得
-        required_variables = self.extract_variables(template)
+        compiled = self.compile(template)
+        required_variables = compiled.variables
 
         # 変数が1つもない場合はそのまま返す（全員に同じメッセージを送る場合）
         if not required_variables:
             result["rendered_message"] = template
             return result
 
-        missing_variables = [var for var in required_variables if var not in variables]
+        started = time.perf_counter()
+        missing_variables = compiled.missing_variables(variables)
 
         if missing_variables:
             result["missing_variables"] = missing_variables
-            # 部分的にレンダリング（利用可能な変数のみ）
-            available_variables = {k: v for k, v in variables.items() if k in required_variables}
+            # 部分的にレンダリング（欠けている変数は元の形式で保持）
             try:
-                # 欠けている変数は元の形式で保持
-                partial_template = template
-                for var, value in available_variables.items():
-                    partial_template = partial_template.replace(f"{{{var}}}", str(value))
-                result["rendered_message"] = partial_template
+                result["rendered_message"] = compiled.render(variables)
             except Exception as e:
                 result["error"] = f"Partial rendering failed: {str(e)}"
         else:
             try:
-                result["rendered_message"] = self.render_template(template, variables)
+                result["rendered_message"] = compiled.render(variables)
             except Exception as e:
                 result["success"] = False
                 result["error"] = f"Rendering failed: {str(e)}"
 
+        template_render_seconds.observe(time.perf_counter() - started)
         return result
     
     def render_for_users(self, template: str, user_data: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
@@ -122,12 +278,39 @@ class MessageProcessor:
         
         return results
     
+    async def build_preview(self, template: str, user_data: Dict[str, Dict[str, Any]], sample_size: int,
+                            batch_size: Optional[int] = None, max_length: Optional[int] = None) -> PreviewAccumulator:
+        """全ユーザー分をバッチごとにスレッドプールでレンダリングして集計
+
+        大量のユーザーでもイベントループを長時間ブロックしないよう、
+        batch_size件ごとにスレッドプールで処理する。
+        """
+        accumulator = PreviewAccumulator(
+            self.compile(template),
+            sample_size,
+            max_length or settings.SLACK_MESSAGE_MAX_LENGTH
+        )
+        batch_size = max(1, batch_size or settings.PREVIEW_BATCH_SIZE)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        items = iter(user_data.items())
+        
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            await loop.run_in_executor(None, accumulator.add_batch, batch)
+        
+        preview_seconds.observe(time.perf_counter() - started)
+        return accumulator
+    
     def get_template_info(self, template: str) -> Dict[str, Any]:
         """テンプレートの情報を取得"""
+        compiled = self.compile(template or "")
         return {
-            "variables": self.extract_variables(template),
-            "validation_errors": self.validate_template(template),
-            "is_valid": len(self.validate_template(template)) == 0,
+            "variables": list(compiled.variables),
+            "validation_errors": list(compiled.validation_errors),
+            "is_valid": len(compiled.validation_errors) == 0,
             "character_count": len(template),
             "line_count": template.count('\n') + 1 if template else 0
         }
\ No newline at end of file
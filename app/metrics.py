@@ -0,0 +1,232 @@
+import math
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .directory_cache import directory_cache
+
+# Prometheusクライアントの標準のバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# テンプレートのレンダリングなど、マイクロ秒単位の処理のバケット（秒）
+FAST_BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.025)
+# レート制限の待機時間のバケット（秒）
+WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 送信ジョブ全体の所要時間のバケット（秒）
+JOB_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0, 7200.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric(ABC):
+    """メトリクスの共通部分（名前・説明・ラベル）
+
+    値はラベルの値の組ごとに保持する。送信処理はイベントループ上で動くが、
+    プレビューやインポートの解析はワーカースレッドで動くため、更新はロックで保護する。
+    """
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def collect(self) -> List[str]:
+        """テキスト形式のサンプル行"""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self.collect())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """増加のみする値
+
+    function を指定した場合は、既存の統計情報（キャッシュのヒット数など）を
+    出力時に読み出す（ラベルなし）。
+    """
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        if self.function is not None:
+            return [f"{self.name} {format_value(self.function())}"]
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in values]
+
+
+class Gauge(Metric):
+    """増減する現在の値（function を指定した場合は出力時に読み出す）"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+    def collect(self) -> List[str]:
+        if self.function is not None:
+            return [f"{self.name} {format_value(self.function())}"]
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in values]
+
+
+class Histogram(Metric):
+    """値の分布（バケットごとの件数・合計・件数）"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ラベルの値の組 -> [バケットごとの件数（+Infを含む、累積ではない）, 合計]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+
+        lines = []
+        bounds = [format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = format_labels(self.labelnames + ("le",), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスの一覧とテキスト形式（Prometheus exposition format 0.0.4）での出力"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                function: Optional[Callable[[], float]] = None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, function))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+# プロセス全体で共有するインスタンス
+registry = MetricsRegistry()
+
+# Slack API
+slack_api_request_seconds = registry.histogram(
+    "slack_api_request_duration_seconds", "Slack Web API request latency per attempt", ["method"])
+slack_api_errors = registry.counter(
+    "slack_api_errors_total", "Slack Web API calls that returned an error", ["method", "error"])
+slack_rate_limit_wait_seconds = registry.histogram(
+    "slack_rate_limit_wait_seconds", "Time spent waiting for a rate limiter token", ["method"], buckets=WAIT_BUCKETS)
+slack_send_dm_seconds = registry.histogram(
+    "slack_send_dm_duration_seconds", "Time to deliver one DM including retries", ["result"])
+slack_retries = registry.counter(
+    "slack_retries_total", "Retried Slack calls by the error code that caused them (ratelimited = 429)", ["error_code"])
+slack_directory_fetch_seconds = registry.histogram(
+    "slack_directory_fetch_duration_seconds", "Time to page through users.list", buckets=JOB_BUCKETS[:6])
+registry.counter("directory_cache_hits_total", "User directory cache hits", function=lambda: directory_cache.hits)
+registry.counter("directory_cache_misses_total", "User directory cache misses", function=lambda: directory_cache.misses)
+registry.gauge(
+    "directory_cache_hit_ratio", "User directory cache hits / lookups since start",
+    function=lambda: directory_cache.hits / max(1, directory_cache.hits + directory_cache.misses))
+
+# テンプレート・インポート
+template_render_seconds = registry.histogram(
+    "template_render_duration_seconds", "Time to render one message", buckets=FAST_BUCKETS)
+preview_seconds = registry.histogram(
+    "preview_duration_seconds", "Time to build a preview over all recipients")
+import_parse_seconds = registry.histogram(
+    "import_parse_duration_seconds", "Time to parse an uploaded recipients file")
+import_rows = registry.counter(
+    "import_rows_total", "Rows read from uploaded recipients files", ["result"])
+
+# 送信ジョブ
+send_job_messages = registry.counter(
+    "send_messages_total", "Recipients processed by send jobs (rate() gives messages/sec)", ["result"])
+send_jobs_finished = registry.counter(
+    "send_jobs_total", "Finished send jobs", ["status"])
+send_job_seconds = registry.histogram(
+    "send_job_duration_seconds", "Wall time of a send job run", buckets=JOB_BUCKETS)
+send_jobs_active = registry.gauge(
+    "send_jobs_active", "Send jobs currently running in this process")
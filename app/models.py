@@ -51,13 +51,18 @@ class ParseMentionsRequest(BaseModel):
             }
         }
 
+class InvalidateCacheRequest(BaseModel):
+    token: str = Field(..., description="Slack token of the workspace to invalidate")
+
 class ParseMentionsResponse(BaseModel):
     users: List[User] = Field(default_factory=list)
     errors: List[str] = Field(default_factory=list)
+    warnings: List[str] = Field(default_factory=list)
     
 class PreviewRequest(BaseModel):
     template: str = Field(..., description="Message template")
     user_data: Dict[str, Dict[str, Any]] = Field(default_factory=dict, description="User variables")
+    sample_size: Optional[int] = Field(None, ge=0, le=1000, description="Number of rendered messages to return (default: PREVIEW_SAMPLE_SIZE)")
     
     class Config:
         json_schema_extra = {
@@ -69,10 +74,23 @@ class PreviewRequest(BaseModel):
             }
         }
 
+class PreviewStats(BaseModel):
+    total: int = Field(default=0, description="Number of users rendered")
+    missing_variable_counts: Dict[str, int] = Field(default_factory=dict, description="Variable name to number of users missing it")
+    users_with_missing_variables: int = Field(default=0)
+    length_min: int = Field(default=0)
+    length_max: int = Field(default=0)
+    length_mean: float = Field(default=0.0)
+    length_histogram: Dict[str, int] = Field(default_factory=dict, description="Message length range to number of users")
+    max_length: int = Field(default=0, description="Slack message length limit")
+    over_limit_count: int = Field(default=0, description="Number of users whose message exceeds max_length")
+    over_limit_users: List[str] = Field(default_factory=list, description="User IDs over the limit (first 100)")
+
 class PreviewResponse(BaseModel):
-    rendered_messages: Dict[str, str] = Field(default_factory=dict, description="User ID to rendered message mapping")
+    rendered_messages: Dict[str, str] = Field(default_factory=dict, description="User ID to rendered message mapping (sample)")
     missing_variables: List[str] = Field(default_factory=list)
     available_variables: List[str] = Field(default_factory=list)
+    stats: PreviewStats = Field(default_factory=PreviewStats)
 
 class SendRequest(BaseModel):
     template: str = Field(..., description="Message template")
@@ -100,12 +118,24 @@ class SendRequest(BaseModel):
             }
         }
 
+class ResumeRequest(BaseModel):
+    token: str = Field(..., description="Slack token")
+    retry_uncertain: bool = Field(default=False, description="Also resend recipients whose delivery could not be confirmed")
+
+class ErrorSummary(BaseModel):
+    error_code: str = Field(..., description="Error code")
+    count: int = Field(default=0, description="Number of errors with this code")
+    error: Optional[str] = Field(None, description="Error message of the first occurrence")
+    detailed_error: Optional[str] = Field(None, description="Detailed error of the first occurrence")
+
 class SendResult(BaseModel):
     job_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     total_users: int = Field(default=0)
     sent_count: int = Field(default=0)
     failed_count: int = Field(default=0)
-    errors: List[Dict[str, Any]] = Field(default_factory=list)
+    api_calls_saved: int = Field(default=0, description="API calls skipped by the DM channel cache")
+    error_count: int = Field(default=0)
+    error_summary: List[ErrorSummary] = Field(default_factory=list, description="Errors grouped by error code")
     status: str = Field(default="pending")  # pending, running, completed, failed
     started_at: Optional[datetime] = Field(default=None)
     completed_at: Optional[datetime] = Field(default=None)
@@ -117,8 +147,9 @@ class SendResult(BaseModel):
                 "total_users": 2,
                 "sent_count": 1,
                 "failed_count": 1,
-                "errors": [
-                    {"user_id": "U456", "error": "User not found"}
+                "error_count": 1,
+                "error_summary": [
+                    {"error_code": "user_not_found", "count": 1, "error": "User not found"}
                 ],
                 "status": "completed",
                 "started_at": "2023-12-01T10:00:00Z",
@@ -126,9 +157,24 @@ class SendResult(BaseModel):
             }
         }
 
+class JobErrorsPage(BaseModel):
+    errors: List[Dict[str, Any]] = Field(default_factory=list)
+    next_cursor: Optional[int] = Field(None, description="Value for ?after= to fetch the next page (null when no more errors)")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "errors": [
+                    {"user_id": "U456", "user_name": "john.doe", "error": "User not found", "error_code": "user_not_found"}
+                ],
+                "next_cursor": 1
+            }
+        }
+
 class ImportVariablesResponse(BaseModel):
     imported_count: int = Field(default=0)
-    user_data: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+    user_data: Dict[str, Dict[str, Any]] = Field(default_factory=dict, description="Slack user ID (or raw identifier without token) to variables mapping")
+    users: List[User] = Field(default_factory=list, description="Resolved users (only when a token is given)")
     errors: List[str] = Field(default_factory=list)
     
     class Config:
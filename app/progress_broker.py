@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressSubscription:
+    """1つのストリーム接続に対する未送信の差分
+
+    接続側の読み出しが遅れている間に届いた変更は1つの差分にまとめる
+    （カウンタは加算、エラーは追記、状態は最新の値で上書き）。
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._pending: Optional[Dict[str, Any]] = None
+        self._event = asyncio.Event()
+
+    def push(self, change: Dict[str, Any]):
+        """変更を未送信の差分にまとめる"""
+        pending = self._pending
+        if pending is None:
+            pending = self._pending = {"sent": 0, "failed": 0, "api_calls_saved": 0, "errors": []}
+
+        pending["sent"] += change.get("sent", 0)
+        pending["failed"] += change.get("failed", 0)
+        pending["api_calls_saved"] += change.get("api_calls_saved", 0)
+        pending["errors"].extend(change.get("errors", []))
+        if "status" in change:
+            pending["status"] = change["status"]
+            if change.get("completed_at"):
+                pending["completed_at"] = change["completed_at"]
+        self._event.set()
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """次の差分を取得（timeout秒以内に変更がなければNone）"""
+        if self._pending is None:
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+        delta, self._pending = self._pending, None
+        return delta
+
+
+class ProgressBroker:
+    """送信ジョブの進捗をストリーム接続へ配信する
+
+    ジョブストアのリスナーとして登録し、進捗・状態の差分を
+    ジョブを購読している接続ごとの ProgressSubscription へ配る。
+    配信はこのプロセス内で実行しているジョブに限られる。
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[ProgressSubscription]] = {}
+        self.published = 0
+
+    def publish(self, job_id: str, change: Dict[str, Any]):
+        """ジョブの変更を購読中の接続へ配信"""
+        subscriptions = self._subscriptions.get(job_id)
+        if not subscriptions:
+            return
+        self.published += 1
+        for subscription in subscriptions:
+            subscription.push(change)
+
+    def subscribe(self, job_id: str) -> ProgressSubscription:
+        """ジョブの変更の購読を開始"""
+        subscription = ProgressSubscription(job_id)
+        self._subscriptions.setdefault(job_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ProgressSubscription):
+        """購読を終了"""
+        subscriptions = self._subscriptions.get(subscription.job_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """配信の統計情報"""
+        return {
+            "jobs": len(self._subscriptions),
+            "subscribers": sum(len(subscriptions) for subscriptions in self._subscriptions.values()),
+            "published": self.published,
+        }
+
+
+# プロセス全体で共有するインスタンス
+progress_broker = ProgressBroker()
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# チャンネルごとの送信間隔の記録がこの件数を超えたら、経過済みの記録を削除する
+CHANNEL_PRUNE_SIZE = 10000
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限
+
+    トークンは予約方式で取得するため、同時に呼ばれても待機時間が重ならない。
+    Retry-Afterを受け取った場合は指定秒数だけ補充を停止する。
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0  # tokens per second
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.waits = 0
+        self.total_wait = 0.0
+        self.throttled = 0
+
+    def _refill(self, now: float):
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def reserve(self) -> float:
+        """トークンを1つ予約し、使用可能になるまでの待機秒数を返す"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        # updated_atが未来の場合はRetry-Afterによる停止中
+        available_at = self.updated_at + max(0.0, -self.tokens) / self.rate
+        wait = max(0.0, available_at - now)
+        if wait > 0:
+            self.waits += 1
+            self.total_wait += wait
+        return wait
+
+    def pause(self, seconds: float):
+        """Retry-Afterに従って補充を停止する"""
+        resume_at = time.monotonic() + seconds
+        if resume_at > self.updated_at:
+            self.updated_at = resume_at
+            self.tokens = min(self.tokens, 1.0)
+        self.throttled += 1
+
+    def level(self) -> Dict[str, Any]:
+        """現在のバケットの状態"""
+        now = time.monotonic()
+        tokens = self.tokens
+        if now > self.updated_at:
+            tokens = min(self.capacity, tokens + (now - self.updated_at) * self.rate)
+        return {
+            "tokens": round(tokens, 2),
+            "capacity": self.capacity,
+            "rate_per_minute": round(self.rate * 60, 2),
+            "paused_seconds": round(max(0.0, self.updated_at - now), 2),
+            "waits": self.waits,
+            "total_wait_seconds": round(self.total_wait, 2),
+            "throttled": self.throttled,
+        }
+
+
+class RateLimiter:
+    """ワークスペースとAPIメソッドごとのレート制限
+
+    SlackClientのインスタンスをまたいでプロセス全体で共有する。
+    メソッドごとの上限は Settings.get_rate_limits() のTierに従う。
+    chat.postMessage はワークスペース全体の上限に加えて、チャンネルごとに
+    channel_rate（回/分）の間隔を空ける。
+    """
+
+    def __init__(self, limits: Dict[str, float], default_rate: float, burst: float, channel_rate: float = 0.0):
+        self.limits = limits
+        self.default_rate = default_rate
+        self.burst = burst
+        self.channel_interval = 60.0 / channel_rate if channel_rate > 0 else 0.0
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        # (ワークスペース, チャンネル) -> 次に送信できる時刻
+        self._channel_next: Dict[Tuple[str, str], float] = {}
+        self.channel_waits = 0
+
+    def _bucket(self, workspace: str, method: str) -> TokenBucket:
+        key = (workspace, method)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.limits.get(method, self.default_rate), self.burst)
+            self._buckets[key] = bucket
+        return bucket
+
+    def reserve(self, workspace: str, method: str) -> float:
+        """トークンを予約し、待機すべき秒数を返す"""
+        return self._bucket(workspace, method).reserve()
+
+    def reserve_channel(self, workspace: str, channel: str) -> float:
+        """チャンネルへの送信枠を予約し、待機すべき秒数を返す"""
+        if not self.channel_interval:
+            return 0.0
+        now = time.monotonic()
+        if len(self._channel_next) > CHANNEL_PRUNE_SIZE:
+            self._channel_next = {key: at for key, at in self._channel_next.items() if at > now}
+        key = (workspace, channel)
+        start = max(now, self._channel_next.get(key, now))
+        self._channel_next[key] = start + self.channel_interval
+        if start > now:
+            self.channel_waits += 1
+        return start - now
+
+    async def acquire(self, workspace: str, method: str, channel: Optional[str] = None) -> float:
+        """トークン（channel を指定した場合はチャンネルの送信枠も）が使用可能になるまで待機し、待機した秒数を返す"""
+        wait = self.reserve(workspace, method)
+        if channel is not None:
+            wait = max(wait, self.reserve_channel(workspace, channel))
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def throttle(self, workspace: str, method: str, retry_after: float):
+        """429応答を受けたメソッドのバケットを一時停止する"""
+        logger.warning(f"Rate limited on {method}; pausing for {retry_after}s")
+        self._bucket(workspace, method).pause(retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        """バケットごとの現在の状態"""
+        workspaces: Dict[str, Dict[str, Any]] = {}
+        for (workspace, method), bucket in self._buckets.items():
+            # キャッシュキーの先頭のみを表示用に使う
+            workspaces.setdefault(workspace[:12], {})[method] = bucket.level()
+        return {
+            "workspaces": workspaces,
+            "channels": {
+                "rate_per_minute": round(60.0 / self.channel_interval, 2) if self.channel_interval else None,
+                "tracked": len(self._channel_next),
+                "waits": self.channel_waits,
+            },
+        }
+
+
+# プロセス全体で共有するインスタンス
+rate_limiter = RateLimiter(
+    limits=settings.get_rate_limits(),
+    default_rate=60.0 / max(settings.SLACK_RATE_LIMIT_DELAY, 0.001),
+    burst=settings.SLACK_RATE_LIMIT_BURST,
+    channel_rate=settings.SLACK_CHANNEL_RATE_LIMIT
+)
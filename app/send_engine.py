@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from .config import settings
+from .message_processor import MessageProcessor
+from .models import User
+from .slack_client import SlackClient
+
+logger = logging.getLogger(__name__)
+
+# 送信結果を受け取るコールバック（受信者のインデックス, 結果）
+ResultCallback = Callable[[int, Dict[str, Any]], None]
+# 受信者への送信を開始する直前に呼ばれるコールバック（受信者のインデックス）
+DispatchCallback = Callable[[int], Awaitable[None]]
+
+
+class SendEngine:
+    """複数ユーザーへのDMを並行して送信するエンジン
+
+    同時送信数を ``concurrency`` で制限し、完了順に関係なく結果は
+    受信者の入力順にコールバックへ渡す。トークンや権限の問題など
+    ワークスペース全体に影響するエラーが発生した場合は、残りの受信者へは
+    送信せずに中断結果を記録する。ワーカーが想定外の例外で終了した場合は
+    他のワーカーを取り消し、未送信の受信者を中断として記録してから例外を送出する。
+    """
+
+    def __init__(self, slack_client: SlackClient, message_processor: MessageProcessor, concurrency: Optional[int] = None):
+        self.slack_client = slack_client
+        self.message_processor = message_processor
+        self.concurrency = max(1, concurrency or settings.SEND_CONCURRENCY)
+        # ジョブを中断する原因となった送信結果
+        self.abort_result: Optional[Dict[str, Any]] = None
+
+    async def run(
+        self,
+        template: str,
+        users: Iterable[User],
+        user_data: Dict[str, Dict[str, Any]],
+        on_result: ResultCallback,
+        on_dispatch: Optional[DispatchCallback] = None
+    ) -> Dict[str, int]:
+        """全受信者に送信し、送信数・失敗数・節約したAPI呼び出し数を返す
+
+        on_dispatch を指定した場合は、各受信者への送信を開始する前に待機する
+        （送信開始の記録など）。想定外の例外で中断した場合、送信中に取り消した
+        受信者は送信したか不明なため結果を渡さない。
+        """
+        counts = {"sent": 0, "failed": 0, "api_calls_saved": 0}
+        # 完了したが、まだ前の受信者の結果を待っている結果
+        completed: Dict[int, Dict[str, Any]] = {}
+        next_index = 0
+        # ワーカー間で共有するイテレータ（受信者を遅延して読み出す）
+        recipients = enumerate(users)
+        # 送信開始の記録を待っている受信者（まだ送信していない）
+        dispatching: Dict[int, User] = {}
+
+        def deliver(index: int, result: Dict[str, Any]):
+            counts["sent" if result["success"] else "failed"] += 1
+            counts["api_calls_saved"] += result.get("api_calls_saved", 0)
+            on_result(index, result)
+
+        def report(index: int, result: Dict[str, Any]):
+            nonlocal next_index
+            completed[index] = result
+            while next_index in completed:
+                deliver(next_index, completed.pop(next_index))
+                next_index += 1
+
+        async def worker():
+            for index, user in recipients:
+                if self.abort_result is not None:
+                    report(index, self._aborted(user))
+                    continue
+
+                if on_dispatch is not None:
+                    dispatching[index] = user
+                    await on_dispatch(index)
+                    del dispatching[index]
+                    if self.abort_result is not None:
+                        report(index, self._aborted(user))
+                        continue
+                result = await self.send_one(template, user, user_data.get(user.id, {}))
+                if result.get("error_class") == "fatal" and self.abort_result is None:
+                    self.abort_result = result
+                    logger.error(f"Aborting send job: workspace-level error {result.get('error_code')}")
+                report(index, result)
+
+        tasks = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException as e:
+            # 他のワーカーが送信を続けないよう取り消してから、未送信の受信者を中断として記録する
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.abort_result is None:
+                self.abort_result = {
+                    "error_code": "system_error",
+                    "detailed_error": f"送信処理で予期しないエラーが発生しました: {e!r}"
+                }
+            logger.error(f"Aborting send job: unexpected error in send worker: {e!r}")
+            try:
+                for index, user in list(dispatching.items()) + list(recipients):
+                    completed[index] = self._aborted(user)
+                # 結果の順序を待たずに渡す（送信中に取り消した受信者の結果はない）
+                for index in sorted(completed):
+                    deliver(index, completed.pop(index))
+            except Exception as drain_error:
+                logger.error(f"Failed to record aborted recipients: {drain_error!r}")
+            raise
+        return counts
+
+    def _aborted(self, user: User) -> Dict[str, Any]:
+        """中断により送信しなかった受信者の結果"""
+        cause = self.abort_result
+        return {
+            "user_id": user.id,
+            "user_name": user.display_name,
+            "success": False,
+            "attempts": 0,
+            "error": f"Not sent: job aborted after {cause.get('error_code')}",
+            "error_code": "job_aborted",
+            "error_class": "fatal",
+            "detailed_error": f"ワークスペース全体のエラー（{cause.get('error_code')}）のため送信を中止しました。\n\n{cause.get('detailed_error', '')}"
+        }
+
+    async def send_one(self, template: str, user: User, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """1人分のメッセージをレンダリングして送信"""
+        result = {
+            "user_id": user.id,
+            "user_name": user.display_name,
+            "success": False
+        }
+
+        try:
+            # メッセージをレンダリング
+            rendered = self.message_processor.render_template_safe(template, variables)
+            if not rendered["success"]:
+                result["error"] = f"Template rendering failed: {rendered.get('error', 'Unknown error')}"
+                result["error_code"] = "template_error"
+                return result
+
+            # DMを送信（再試行を含めた所要時間を latency として返す）
+            started = time.monotonic()
+            send_result = await self.slack_client.send_dm_with_retry(user.id, rendered["rendered_message"])
+            result["latency"] = time.monotonic() - started
+
+            result["attempts"] = send_result.get("attempts", 1)
+            if send_result["success"]:
+                result["success"] = True
+                result["message_ts"] = send_result.get("message_ts")
+                result["api_calls_saved"] = send_result.get("api_calls_saved", 0)
+            else:
+                result["error"] = send_result.get("error", "Unknown error")
+                result["error_code"] = send_result.get("error_code", "unknown")
+                result["error_class"] = send_result.get("error_class", "retryable")
+                result["detailed_error"] = send_result.get("detailed_error", "詳細なエラー情報がありません")
+
+        except Exception as e:
+            result["error"] = f"Unexpected error: {str(e)}"
+            result["error_code"] = "system_error"
+            logger.error(f"Error sending to {user.display_name} ({user.id}): {result['error']}")
+
+        return result
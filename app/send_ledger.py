@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# 台帳のファイル名に使えるジョブID
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+LEDGER_READ_CHUNK_SIZE = 64 * 1024
+
+
+class LedgerWriter:
+    """1つのジョブの台帳への追記
+
+    受信者ごとに書き込むのではなく、一定件数または一定時間ごとに
+    まとめてファイルの末尾へ追記する。
+    """
+
+    def __init__(self, ledger: "SendLedger", job_id: str, path: str,
+                 flush_size: Optional[int] = None, flush_interval: Optional[float] = None):
+        self.ledger = ledger
+        self.job_id = job_id
+        self.path = path
+        self.flush_size = flush_size or settings.SEND_LEDGER_FLUSH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else settings.SEND_LEDGER_FLUSH_INTERVAL
+        self._lines: List[str] = []
+        self._file = None
+        self._last_flush = time.monotonic()
+
+    def append(self, seq: int, user_id: str, status: str, error_code: Optional[str] = None,
+               attempts: Optional[int] = None, latency: Optional[float] = None, message_ts: Optional[str] = None):
+        """受信者1人分の結果を記録（値がNoneの項目は省略）"""
+        record: Dict[str, Any] = {"job_id": self.job_id, "seq": seq, "user_id": user_id, "status": status}
+        if error_code is not None:
+            record["error_code"] = error_code
+        if attempts is not None:
+            record["attempts"] = attempts
+        if latency is not None:
+            record["latency_ms"] = round(latency * 1000, 1)
+        if message_ts is not None:
+            record["message_ts"] = message_ts
+        record["at"] = round(time.time(), 3)
+        self._lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+
+        if len(self._lines) >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """溜まっている記録をファイルへ追記"""
+        if self._lines:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write("\n".join(self._lines) + "\n")
+                self._file.flush()
+                self.ledger.records_written += len(self._lines)
+            except OSError as e:
+                logger.error(f"Failed to write send ledger for job {self.job_id}: {e}")
+            self._lines = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        """残りの記録を書き込んでファイルを閉じる"""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SendLedger:
+    """受信者ごとの送信結果の台帳（ジョブごとの追記専用NDJSONファイル）
+
+    ジョブを再開した場合も同じファイルへ追記するため、同じ受信者（seq）の
+    記録が複数ある場合は後の記録が最新の結果になる。
+    ジョブストアの保持期間を過ぎたジョブの台帳も残る。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.records_written = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def path(self, job_id: str) -> Optional[str]:
+        """ジョブの台帳ファイルのパス（無効化されている・不正なジョブIDの場合はNone）"""
+        if not self.enabled or not JOB_ID_PATTERN.match(job_id):
+            return None
+        return os.path.join(self.directory, f"{job_id}.ndjson")
+
+    def open(self, job_id: str) -> Optional[LedgerWriter]:
+        """ジョブの台帳への追記を開始（無効化されている場合はNone）"""
+        path = self.path(job_id)
+        if path is None:
+            return None
+        return LedgerWriter(self, job_id, path)
+
+    def exists(self, job_id: str) -> bool:
+        path = self.path(job_id)
+        return path is not None and os.path.isfile(path)
+
+    def iter_bytes(self, job_id: str, chunk_size: int = LEDGER_READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """台帳をチャンクごとに読み出す（ファイル全体をメモリに読み込まない）"""
+        path = self.path(job_id)
+        if path is None:
+            return
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def stats(self) -> Dict[str, Any]:
+        """台帳の統計情報"""
+        return {
+            "enabled": self.enabled,
+            "records_written": self.records_written,
+        }
+
+
+# プロセス全体で共有するインスタンス
+send_ledger = SendLedger(settings.SEND_LEDGER_DIR)
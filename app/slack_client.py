@@ -1,26 +1,113 @@
 import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+import time
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, AsyncIterator, Awaitable, Callable, Iterable, Tuple
 from slack_sdk.web.async_client import AsyncWebClient
 from slack_sdk.errors import SlackApiError
-import time
 from .config import settings
+from .rate_limiter import rate_limiter
+from .channel_cache import channel_cache
+from .token_cache import token_cache, TokenInfo, TOKEN_INVALID_ERROR_CODES
+from .http_session import http_session
+from .metrics import (
+    slack_api_request_seconds, slack_api_errors, slack_rate_limit_wait_seconds,
+    slack_send_dm_seconds, slack_retries, slack_directory_fetch_seconds
+)
+from .directory_cache import directory_cache, token_key, DirectoryEntry
+from .user_index import DirectoryUser, user_info_from_member
 
 logger = logging.getLogger(__name__)
 
+# ワークスペース全体に影響するエラー（トークン・権限の問題）: ジョブ全体を中断する
+FATAL_ERROR_CODES = {
+    "missing_scope", "not_authed", "invalid_auth", "token_revoked", "token_expired",
+    "account_inactive", "team_access_not_granted", "not_allowed_token_type"
+}
+
+# 受信者固有の恒久的なエラー: 再試行しても結果は変わらない
+PERMANENT_ERROR_CODES = FATAL_ERROR_CODES | {
+    "user_not_found", "cant_dm_bot", "user_disabled", "channel_not_found",
+    "is_archived", "msg_too_long", "no_text", "invalid_arguments", "invalid_blocks"
+}
+
+# 現在のタスクで _call が429により再試行した回数（send_dm_with_retry の試行回数に含める）
+_ratelimit_retries: ContextVar[int] = ContextVar("slack_ratelimit_retries", default=0)
+
+
+def classify_error(error_code: Optional[str]) -> str:
+    """エラーコードを fatal / permanent / retryable に分類"""
+    if error_code in FATAL_ERROR_CODES:
+        return "fatal"
+    if error_code in PERMANENT_ERROR_CODES:
+        return "permanent"
+    return "retryable"
+
+
+async def gather_or_cancel(coroutines: List[Awaitable[Any]]) -> List[Any]:
+    """並行して実行し、いずれかが例外を送出したら残りを取り消して例外を送出する"""
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # 取り消したタスクの終了を待つ（未回収の例外を残さない）
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class SlackWorkspaceError(Exception):
+    """トークン・権限の問題（FATAL_ERROR_CODES）により処理を続けられない"""
+
+    def __init__(self, method: str, error_code: str, needed: Optional[str] = None):
+        message = f"{method} failed: {error_code}"
+        if needed:
+            message += f" (required scope: {needed})"
+        super().__init__(message)
+        self.method = method
+        self.error_code = error_code
+        self.needed = needed
+
+
 class SlackClient:
     def __init__(self, token: str):
         self.token = token
-        self.client = AsyncWebClient(token=token)
-        self.last_request_time = 0
-        self._users_cache = None
-        self._cache_timestamp = 0
-        self._cache_duration = 300  # 5分でキャッシュを無効化
+        # 接続プールはプロセス全体で共有する（イベントループ外ではリクエストごとのセッション）
+        self.client = AsyncWebClient(
+            token=token,
+            base_url=settings.SLACK_API_BASE_URL,
+            timeout=int(settings.SLACK_API_TIMEOUT),
+            session=http_session.get()
+        )
+        # ディレクトリキャッシュのキー（生のトークンは使わない）
+        self.cache_key = token_key(token)
+        # 検証済みのトークンの情報（team_id / user_id）
+        self.token_info: Optional[TokenInfo] = None
+    
+    @property
+    def rate_limit_key(self) -> str:
+        """レート制限を共有する単位のキー
+
+        Slackの上限はワークスペース単位のため、検証済みならteam_idを使い、同じワークスペースの
+        別のトークンとも上限を共有する。検証前はトークンのHMACを使う。
+        """
+        if self.token_info is not None and self.token_info.team_id:
+            return self.token_info.team_id
+        return self.cache_key
         
     async def validate_token(self) -> bool:
-        """トークンの有効性を検証"""
+        """トークンの有効性を検証（TTL内に検証済みならauth.testを呼ばない）"""
+        cached = token_cache.get(self.cache_key)
+        if cached is not None:
+            self.token_info = cached
+            return True
+        
         try:
-            response = await self.client.auth_test()
+            response = await self._call("auth.test", self.client.auth_test)
+            if response["ok"]:
+                self.token_info = TokenInfo.from_response(response)
+                token_cache.set(self.cache_key, self.token_info)
             return response["ok"]
         except SlackApiError as e:
             logger.error(f"Token validation failed: {e.response['error']}")
@@ -30,91 +117,199 @@ class SlackClient:
             return False
     
     async def get_user_info(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """ユーザーIDからユーザー情報を取得"""
+        """ユーザーIDからユーザー情報を取得（トークン・権限のエラーは SlackWorkspaceError を送出）"""
+        # キャッシュ済みのディレクトリにあればAPIを呼ばない
+        cached = directory_cache.peek(self.cache_key)
+        if cached is not None:
+            member = cached.index.find_by_id(user_id)
+            if member is not None:
+                return member.to_user_info()
+        
         try:
-            await self._rate_limit()
-            response = await self.client.users_info(user=user_id)
+            response = await self._call("users.info", self.client.users_info, user=user_id)
             if response["ok"]:
-                user = response["user"]
-                return {
-                    "id": user["id"],
-                    "name": user["name"],
-                    "display_name": user.get("profile", {}).get("display_name") or user["real_name"] or user["name"],
-                    "real_name": user.get("real_name"),
-                    "email": user.get("profile", {}).get("email")
-                }
+                return user_info_from_member(response["user"])
             return None
         except SlackApiError as e:
+            if e.response.get("error") in FATAL_ERROR_CODES:
+                raise SlackWorkspaceError("users.info", e.response["error"], e.response.get("needed"))
             logger.error(f"Failed to get user info for {user_id}: {e.response['error']}")
             return None
         except Exception as e:
             logger.error(f"Error getting user info for {user_id}: {str(e)}")
             return None
     
-    async def _get_users_list(self) -> List[Dict[str, Any]]:
-        """ユーザーリストを取得（キャッシュ付き）"""
-        current_time = time.time()
-        
-        # キャッシュが有効な場合はそれを返す
-        if (self._users_cache is not None and 
-            current_time - self._cache_timestamp < self._cache_duration):
-            return self._users_cache
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """メールアドレスからユーザー情報を取得（トークン・権限のエラーは SlackWorkspaceError を送出）"""
+        # キャッシュ済みのディレクトリにあればAPIを呼ばない
+        cached = directory_cache.peek(self.cache_key)
+        if cached is not None:
+            member = cached.index.find_by_email(email)
+            if member is not None:
+                return member.to_user_info()
         
         try:
-            await self._rate_limit()
-            response = await self.client.users_list()
+            response = await self._call("users.lookupByEmail", self.client.users_lookupByEmail, email=email)
             if response["ok"]:
-                self._users_cache = response["members"]
-                self._cache_timestamp = current_time
-                logger.info(f"Updated users cache with {len(self._users_cache)} users")
-                return self._users_cache
-            return []
+                return user_info_from_member(response["user"])
+            return None
         except SlackApiError as e:
-            logger.error(f"Failed to get users list: {e.response['error']}")
-            return []
+            if e.response.get("error") in FATAL_ERROR_CODES:
+                # users:read.email がないトークンでは全件が同じエラーになる
+                raise SlackWorkspaceError("users.lookupByEmail", e.response["error"], e.response.get("needed"))
+            logger.error(f"Failed to look up user by email {email}: {e.response['error']}")
+            return None
         except Exception as e:
-            logger.error(f"Error getting users list: {str(e)}")
-            return []
+            logger.error(f"Error looking up user by email {email}: {str(e)}")
+            return None
+    
+    async def _get_users_list(self) -> List[DirectoryUser]:
+        """ユーザーリスト全体を取得（プロセス共有キャッシュ付き）"""
+        return await directory_cache.get(self.cache_key, self._iter_users_pages)
+    
+    def _watch_directory(self) -> AsyncIterator[DirectoryEntry]:
+        """ディレクトリを取得（取得中はページが届くたびにインデックスを返す）"""
+        return directory_cache.watch(self.cache_key, self._iter_users_pages)
+    
+    async def _iter_users_pages(self) -> AsyncIterator[List[DirectoryUser]]:
+        """users.listをカーソルに従ってページ単位で取得（失敗時は例外）
 
-    async def get_user_by_name(self, display_name: str) -> Optional[Dict[str, Any]]:
-        """表示名からユーザー情報を取得（キャッシュされたユーザーリストから検索）"""
-        users = await self._get_users_list()
+        生のメンバー情報は保持せず、必要な項目だけのレコードに変換して返す。
+        """
+        cursor = None
+        started = time.perf_counter()
         
-        for user in users:
-            if user.get("deleted"):
-                continue
+        while True:
+            # ページ間の間隔はusers.listのレート制限（Tier 2）に従う
+            response = await self._call(
+                "users.list",
+                self.client.users_list,
+                limit=settings.SLACK_USERS_LIST_PAGE_SIZE,
+                cursor=cursor
+            )
             
-            # 複数の名前パターンをチェック
-            names_to_check = [
-                user["name"],
-                user.get("real_name", ""),
-                user.get("profile", {}).get("display_name", ""),
-                user.get("profile", {}).get("real_name", "")
-            ]
+            if not response["ok"]:
+                raise RuntimeError(f"users.list failed: {response.get('error', 'unknown')}")
             
-            # @を除去した表示名でも比較
-            clean_display_name = display_name.lstrip("@")
+            yield [DirectoryUser.from_member(member) for member in response["members"]]
             
-            for name in names_to_check:
-                if name and (name == display_name or name == clean_display_name):
-                    return {
-                        "id": user["id"],
-                        "name": user["name"],
-                        "display_name": user.get("profile", {}).get("display_name") or user.get("real_name") or user["name"],
-                        "real_name": user.get("real_name"),
-                        "email": user.get("profile", {}).get("email")
-                    }
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                break
+        
+        slack_directory_fetch_seconds.observe(time.perf_counter() - started)
+    
+    def invalidate_users_cache(self) -> bool:
+        """このワークスペースのディレクトリキャッシュを無効化"""
+        return directory_cache.invalidate(self.cache_key) > 0
+
+    async def get_user_by_name(self, display_name: str) -> Optional[Dict[str, Any]]:
+        """表示名からユーザー情報を取得（キャッシュされたユーザーリストから検索）"""
+        # @を除去した表示名でも比較
+        clean_display_name = display_name.lstrip("@")
+        
+        async for directory in self._watch_directory():
+            member = directory.index.find_by_name(display_name) or directory.index.find_by_name(clean_display_name)
+            if member:
+                return member.to_user_info()
         return None
     
+    async def resolve_identifiers(self, user_ids: Iterable[str] = (), names: Iterable[str] = (),
+                                  emails: Iterable[str] = ()) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """ユーザーID・名前・メールアドレスをまとめてユーザー情報に解決
+
+        まずディレクトリのインデックスで解決する。名前を含む場合やユーザーIDと
+        メールアドレスが合わせて SLACK_BULK_DIRECTORY_THRESHOLD 件を超える場合は、
+        1件ずつ users.info / users.lookupByEmail を呼ぶよりも users.list の方が
+        少ない呼び出しで済むためディレクトリを取得する。インデックスで
+        見つからなかったもののみ users.info / users.lookupByEmail を並行して呼び出す
+        （呼び出し間隔はレート制限に従う）。
+
+        戻り値は {"user_id": {ID: ユーザー情報}, "name": {...}, "email": {...}}。
+        見つからなかった識別子は含まない。トークン・権限のエラー（missing_scope など）が
+        返された時点で残りの呼び出しを取り消し、SlackWorkspaceError を送出する。
+        """
+        pending_ids = set(user_ids)
+        pending_names = set(names)
+        pending_emails = set(emails)
+        found: Dict[str, Dict[str, Dict[str, Any]]] = {"user_id": {}, "name": {}, "email": {}}
+        
+        def resolve_from(directory: DirectoryEntry):
+            for user_id in list(pending_ids):
+                member = directory.index.find_by_id(user_id)
+                if member is not None:
+                    found["user_id"][user_id] = member.to_user_info()
+                    pending_ids.discard(user_id)
+            for name in list(pending_names):
+                member = directory.index.find_by_name(name) or directory.index.find_by_name(name.lstrip("@"))
+                if member is not None:
+                    found["name"][name] = member.to_user_info()
+                    pending_names.discard(name)
+            for email in list(pending_emails):
+                member = directory.index.find_by_email(email)
+                if member is not None:
+                    found["email"][email] = member.to_user_info()
+                    pending_emails.discard(email)
+        
+        if pending_names or len(pending_ids) + len(pending_emails) > settings.SLACK_BULK_DIRECTORY_THRESHOLD:
+            # ページが届くたびに解決し、全員見つかった時点で打ち切る
+            async for directory in self._watch_directory():
+                resolve_from(directory)
+                if not pending_ids and not pending_names and not pending_emails:
+                    break
+        else:
+            cached = directory_cache.peek(self.cache_key)
+            if cached is not None:
+                resolve_from(cached)
+        
+        if pending_ids or pending_emails:
+            # メールアドレスの表示権限（users:read.email）がないとディレクトリには含まれない
+            logger.info(f"Looking up {len(pending_ids)} users with users.info and {len(pending_emails)} with users.lookupByEmail")
+            by_id, by_email = await gather_or_cancel([
+                self._lookup_concurrently(pending_ids, self.get_user_info),
+                self._lookup_concurrently(pending_emails, self.get_user_by_email)
+            ])
+            found["user_id"].update((user_id, user_info) for user_id, user_info in by_id if user_info)
+            found["email"].update((email, user_info) for email, user_info in by_email if user_info)
+        
+        return found
+    
+    async def _lookup_concurrently(self, keys: Iterable[str],
+                                   lookup: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """lookupを並行して呼び出し、(キー, 結果) の一覧を返す（同時実行数を制限、例外で残りを取り消す）"""
+        semaphore = asyncio.Semaphore(max(1, settings.SLACK_LOOKUP_CONCURRENCY))
+        
+        async def run(key: str):
+            async with semaphore:
+                return key, await lookup(key)
+        
+        return await gather_or_cancel([run(key) for key in keys])
+    
+    async def _open_dm_channel(self, user_id: str) -> Dict[str, Any]:
+        """DMチャンネルを開く（キャッシュ済みならAPIを呼ばない）"""
+        channel_id = channel_cache.get(self.cache_key, user_id)
+        if channel_id is not None:
+            return {"ok": True, "channel_id": channel_id, "cached": True}
+        
+        channel_response = await self._call("conversations.open", self.client.conversations_open, users=[user_id])
+        if not channel_response["ok"]:
+            return {"ok": False, "error": channel_response.get('error', 'unknown')}
+        
+        channel_id = channel_response["channel"]["id"]
+        channel_cache.set(self.cache_key, user_id, channel_id)
+        return {"ok": True, "channel_id": channel_id, "cached": False}
+    
     async def send_dm(self, user_id: str, message: str) -> Dict[str, Any]:
-        """ユーザーにDMを送信"""
+        """ユーザーにDMを送信
+
+        DMチャンネルIDがキャッシュ済みの場合はconversations.openを省略し、
+        節約できたAPI呼び出し数を api_calls_saved として返す。
+        """
         try:
-            await self._rate_limit()
-            
             # DMチャンネルを開く
-            channel_response = await self.client.conversations_open(users=[user_id])
-            if not channel_response["ok"]:
-                error_code = channel_response.get('error', 'unknown')
+            channel = await self._open_dm_channel(user_id)
+            if not channel["ok"]:
+                error_code = channel["error"]
                 return {
                     "success": False,
                     "error": f"Failed to open DM channel: {error_code}",
@@ -122,19 +317,39 @@ class SlackClient:
                     "detailed_error": self._get_detailed_error_message(error_code)
                 }
             
-            channel_id = channel_response["channel"]["id"]
+            channel_id = channel["channel_id"]
             
             # メッセージを送信
-            message_response = await self.client.chat_postMessage(
-                channel=channel_id,
-                text=message
-            )
+            try:
+                message_response = await self._call(
+                    "chat.postMessage",
+                    self.client.chat_postMessage,
+                    channel=channel_id,
+                    text=message
+                )
+            except SlackApiError as e:
+                if not (channel["cached"] and e.response.get('error') == "channel_not_found"):
+                    raise
+                # キャッシュしたチャンネルが無効になっていたら開き直して再送信
+                logger.info(f"Cached DM channel for {user_id} is no longer valid; reopening")
+                channel_cache.invalidate(self.cache_key, user_id)
+                channel = await self._open_dm_channel(user_id)
+                if not channel["ok"]:
+                    raise
+                channel_id = channel["channel_id"]
+                message_response = await self._call(
+                    "chat.postMessage",
+                    self.client.chat_postMessage,
+                    channel=channel_id,
+                    text=message
+                )
             
             if message_response["ok"]:
                 return {
                     "success": True,
                     "message_ts": message_response["ts"],
-                    "channel": channel_id
+                    "channel": channel_id,
+                    "api_calls_saved": 1 if channel["cached"] else 0
                 }
             else:
                 error_code = message_response.get('error', 'unknown')
@@ -192,88 +407,140 @@ class SlackClient:
         return error_messages.get(error_code, f"不明なエラー: {error_code}\n詳細はSlack APIドキュメントを確認してください。")
     
     async def send_dm_with_retry(self, user_id: str, message: str, max_retries: int = None) -> Dict[str, Any]:
-        """リトライ機能付きのDM送信"""
+        """リトライ機能付きのDM送信
+
+        恒久的なエラー（権限不足・ユーザー不在など）は再試行せずに返す。
+        429は _call がRetry-Afterに従って再試行するため、ここでは再試行しない。
+        結果には試行回数（attempts、429による再試行を含む）とエラー分類（error_class）を含める。
+        """
         if max_retries is None:
             max_retries = settings.SLACK_MAX_RETRIES
-        
-        last_error = None
+        started = time.perf_counter()
+        ratelimit_retries = _ratelimit_retries.get()
         
         for attempt in range(max_retries + 1):
             result = await self.send_dm(user_id, message)
+            result["attempts"] = attempt + 1 + _ratelimit_retries.get() - ratelimit_retries
             
             if result["success"]:
                 if attempt > 0:
                     logger.info(f"Successfully sent DM to {user_id} after {attempt} retries")
+                slack_send_dm_seconds.observe(time.perf_counter() - started, result="sent")
+                return result
+            
+            error_class = classify_error(result.get("error_code"))
+            result["error_class"] = error_class
+            
+            # 再試行しても解決しないエラーは即座に失敗とする
+            if error_class != "retryable":
+                logger.error(f"Permanent failure for {user_id}: {result['error']} ({error_class})")
+                slack_send_dm_seconds.observe(time.perf_counter() - started, result="failed")
                 return result
             
-            last_error = result["error"]
+            # 429の再試行は _call で使い切っている
+            if result.get("error_code") == "ratelimited":
+                logger.error(f"Rate limited for {user_id} after {result['attempts']} attempts")
+                slack_send_dm_seconds.observe(time.perf_counter() - started, result="failed")
+                return result
             
             # 最終試行でなければ待機
             if attempt < max_retries:
+                slack_retries.inc(error_code=result.get("error_code") or "unknown")
                 wait_time = (2 ** attempt) * settings.SLACK_RATE_LIMIT_DELAY
-                logger.warning(f"Attempt {attempt + 1} failed for {user_id}: {last_error}. Retrying in {wait_time}s...")
+                logger.warning(f"Attempt {attempt + 1} failed for {user_id}: {result['error']}. Retrying in {wait_time}s...")
                 await asyncio.sleep(wait_time)
         
-        logger.error(f"All {max_retries + 1} attempts failed for {user_id}: {last_error}")
-        return {
-            "success": False,
-            "error": f"Failed after {max_retries + 1} attempts: {last_error}"
-        }
+        logger.error(f"All {max_retries + 1} attempts failed for {user_id}: {result['error']}")
+        result["error"] = f"Failed after {max_retries + 1} attempts: {result['error']}"
+        slack_send_dm_seconds.observe(time.perf_counter() - started, result="failed")
+        return result
+    
+    async def _rate_limit(self, method: str, channel: Optional[str] = None):
+        """レート制限を遵守するための待機（ワークスペース・メソッド単位で共有、chat.postMessage はチャンネル単位も）"""
+        wait = await rate_limiter.acquire(self.rate_limit_key, method, channel if method == "chat.postMessage" else None)
+        slack_rate_limit_wait_seconds.observe(wait, method=method)
+    
+    async def _call(self, method: str, api: Callable[..., Awaitable[Any]], **kwargs) -> Any:
+        """レート制限を適用してSlack APIを呼び出す
+
+        429が返された場合はRetry-Afterの間バケットを停止し、同じ呼び出しを再試行する。
+        トークンの無効を示すエラーの場合は検証済みトークンのキャッシュを破棄する。
+        """
+        attempt = 0
+        while True:
+            await self._rate_limit(method, kwargs.get("channel"))
+            started = time.perf_counter()
+            try:
+                response = await api(**kwargs)
+                slack_api_request_seconds.observe(time.perf_counter() - started, method=method)
+                return response
+            except SlackApiError as e:
+                slack_api_request_seconds.observe(time.perf_counter() - started, method=method)
+                slack_api_errors.inc(method=method, error=e.response.get('error') or str(e.response.status_code))
+                if e.response.get('error') in TOKEN_INVALID_ERROR_CODES:
+                    # トークンが無効になったら次回の validate_token で再検証する
+                    token_cache.invalidate(self.cache_key)
+                if e.response.status_code != 429 or attempt >= settings.SLACK_MAX_RETRIES:
+                    raise
+                attempt += 1
+                _ratelimit_retries.set(_ratelimit_retries.get() + 1)
+                slack_retries.inc(error_code="ratelimited")
+                rate_limiter.throttle(self.rate_limit_key, method, self._get_retry_after(e.response))
+            except Exception as e:
+                slack_api_errors.inc(method=method, error=type(e).__name__)
+                raise
+    
+    def _get_retry_after(self, response) -> float:
+        """429レスポンスのRetry-Afterヘッダーから待機秒数を取得"""
+        headers = response.headers or {}
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        try:
+            return max(float(value), settings.SLACK_RATE_LIMIT_DELAY)
+        except (TypeError, ValueError):
+            return settings.SLACK_RATE_LIMIT_DELAY
     
-    async def _rate_limit(self):
-        """レート制限を遵守するための待機"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
+    async def resolve_users_from_mentions(self, mentions: List[str]) -> tuple[List[Dict[str, Any]], List[str], List[str]]:
+        """メンションリストからユーザー情報を解決（インデックス検索）
+
+        同じ名前のメンバーが複数いる場合はディレクトリ順で最初のメンバーを採用し、
+        警告を返す。重複の判定のため、全員が見つかってもディレクトリ全体の取得を待つ。
+        """
+        # メンションごとの解決結果（入力順を保持）
+        resolved: Dict[str, Optional[Dict[str, Any]]] = {}
+        for mention in mentions:
+            clean_mention = mention.strip().lstrip("@")
+            if clean_mention:
+                resolved.setdefault(clean_mention, None)
         
-        if time_since_last < settings.SLACK_RATE_LIMIT_DELAY:
-            wait_time = settings.SLACK_RATE_LIMIT_DELAY - time_since_last
-            await asyncio.sleep(wait_time)
+        # ページが届くたびに未解決のメンションを検索する。後のページに同じ名前の
+        # メンバーがいる可能性があるため、全員見つかっても最後のページまで読む
+        unresolved = set(resolved)
+        candidates: Dict[str, int] = {}
+        if unresolved:
+            directory = None
+            async for directory in self._watch_directory():
+                for clean_mention in list(unresolved):
+                    member = directory.index.find_by_name(clean_mention)
+                    if member:
+                        resolved[clean_mention] = member.to_user_info()
+                        unresolved.discard(clean_mention)
+            if directory is not None:
+                for clean_mention in resolved:
+                    candidates[clean_mention] = directory.index.candidates(clean_mention)
         
-        self.last_request_time = time.time()
-    
-    async def resolve_users_from_mentions(self, mentions: List[str]) -> tuple[List[Dict[str, Any]], List[str]]:
-        """メンションリストからユーザー情報を解決（効率化版）"""
         users = []
         errors = []
-        
-        # 一度だけユーザーリストを取得
-        all_users = await self._get_users_list()
-        
+        warnings = []
         for mention in mentions:
             clean_mention = mention.strip().lstrip("@")
             if not clean_mention:
                 continue
-            
-            # キャッシュされたリストから検索（API呼び出し不要）
-            user_info = self._find_user_in_list(all_users, clean_mention)
+            user_info = resolved.get(clean_mention)
             if user_info:
                 users.append(user_info)
+                if candidates.get(clean_mention, 0) > 1:
+                    warnings.append(f"Ambiguous mention: {mention} matches {candidates[clean_mention]} users; using {user_info['name']} ({user_info['id']})")
             else:
                 errors.append(f"User not found: {mention}")
         
-        return users, errors
-    
-    def _find_user_in_list(self, users: List[Dict[str, Any]], display_name: str) -> Optional[Dict[str, Any]]:
-        """ユーザーリストから指定した名前のユーザーを検索"""
-        for user in users:
-            if user.get("deleted"):
-                continue
-            
-            # 複数の名前パターンをチェック
-            names_to_check = [
-                user["name"],
-                user.get("real_name", ""),
-                user.get("profile", {}).get("display_name", ""),
-                user.get("profile", {}).get("real_name", "")
-            ]
-            
-            for name in names_to_check:
-                if name and name == display_name:
-                    return {
-                        "id": user["id"],
-                        "name": user["name"],
-                        "display_name": user.get("profile", {}).get("display_name") or user.get("real_name") or user["name"],
-                        "real_name": user.get("real_name"),
-                        "email": user.get("profile", {}).get("email")
-                    }
-        return None
\ No newline at end of file
+        return users, errors, warnings
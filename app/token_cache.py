@@ -0,0 +1,88 @@
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# トークン自体が無効になったことを示すエラー: 検証済みのキャッシュを破棄する
+TOKEN_INVALID_ERROR_CODES = {
+    "invalid_auth", "not_authed", "token_revoked", "token_expired", "account_inactive"
+}
+
+
+class TokenInfo:
+    """auth.test で検証したトークンの情報"""
+
+    __slots__ = ("team_id", "user_id", "team", "user", "validated_at")
+
+    def __init__(self, team_id: Optional[str], user_id: Optional[str],
+                 team: Optional[str] = None, user: Optional[str] = None):
+        self.team_id = team_id
+        self.user_id = user_id
+        self.team = team
+        self.user = user
+        self.validated_at = time.monotonic()
+
+    @classmethod
+    def from_response(cls, response: Any) -> "TokenInfo":
+        """auth.test のレスポンスから生成"""
+        return cls(response.get("team_id"), response.get("user_id"), response.get("team"), response.get("user"))
+
+    def age(self) -> float:
+        return time.monotonic() - self.validated_at
+
+
+class TokenCache:
+    """検証済みトークンのキャッシュ
+
+    キーはトークンのHMAC（SlackClient.cache_key）で、生のトークンは保持しない。
+    TTLを過ぎるか、APIがトークンの無効を示すエラーを返したら再検証する。
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, TokenInfo] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[TokenInfo]:
+        """TTL内の検証結果を取得"""
+        info = self._entries.get(key)
+        if info is not None and info.age() < self.ttl:
+            self.hits += 1
+            return info
+        if info is not None:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, key: str, info: TokenInfo):
+        if self.ttl > 0:
+            self._entries[key] = info
+
+    def invalidate(self, key: str) -> bool:
+        """検証結果を破棄（破棄した場合True）"""
+        if self._entries.pop(key, None) is None:
+            return False
+        self.invalidations += 1
+        logger.info("Discarded cached token validation after an authentication error")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """キャッシュの統計情報"""
+        lookups = self.hits + self.misses
+        return {
+            "tokens": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# プロセス全体で共有するインスタンス
+token_cache = TokenCache(ttl=settings.TOKEN_CACHE_TTL)
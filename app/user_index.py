@@ -0,0 +1,123 @@
+from typing import Any, Dict, List, Optional
+
+
+def user_info_from_member(member: Dict[str, Any]) -> Dict[str, Any]:
+    """users.info / users.listのメンバーからAPIで返すユーザー情報を生成"""
+    profile = member.get("profile", {})
+    return {
+        "id": member["id"],
+        "name": member["name"],
+        "display_name": profile.get("display_name") or member.get("real_name") or member["name"],
+        "real_name": member.get("real_name"),
+        "email": profile.get("email")
+    }
+
+
+class DirectoryUser:
+    """キャッシュに保持するユーザーレコード
+
+    users.listのメンバーは画像URLやステータス等を含み大きいため、
+    取得時に検索と送信に使う項目だけを射影して保持する。
+    """
+
+    __slots__ = ("id", "name", "real_name", "display_name", "profile_real_name", "email", "deleted")
+
+    def __init__(self, id: str, name: str, real_name: Optional[str], display_name: Optional[str],
+                 profile_real_name: Optional[str], email: Optional[str], deleted: bool):
+        self.id = id
+        self.name = name
+        self.real_name = real_name
+        self.display_name = display_name
+        self.profile_real_name = profile_real_name
+        self.email = email
+        self.deleted = deleted
+
+    @classmethod
+    def from_member(cls, member: Dict[str, Any]) -> "DirectoryUser":
+        """users.listのメンバーからレコードを生成"""
+        profile = member.get("profile", {})
+        return cls(
+            member["id"],
+            member["name"],
+            member.get("real_name") or None,
+            profile.get("display_name") or None,
+            profile.get("real_name") or None,
+            profile.get("email") or None,
+            bool(member.get("deleted"))
+        )
+
+    def names(self) -> set:
+        """検索対象の名前"""
+        return {self.name, self.real_name, self.display_name, self.profile_real_name}
+
+    def to_user_info(self) -> Dict[str, Any]:
+        """APIで返すユーザー情報を生成"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "display_name": self.display_name or self.real_name or self.name,
+            "real_name": self.real_name,
+            "email": self.email
+        }
+
+
+class UserIndex:
+    """ユーザーディレクトリの検索用インデックス
+
+    name / real_name / profile.display_name / profile.real_name の各値と
+    ユーザーIDからメンバーを引けるようにする。ページ単位で追加できる。
+
+    同じ名前を持つメンバーが複数いる場合（表示名の重複など）は、
+    ディレクトリ順で最初のメンバーを返し、候補数を ``candidates`` で返す。
+    メールアドレス（大文字小文字を区別しない）からも検索できる。
+    これは従来の線形探索と同じ結果になる。取得途中のディレクトリでは
+    到着済みのページの範囲でのみ重複を判定する。削除済みユーザーは
+    名前では検索されないが、IDでは検索できる。
+    """
+
+    def __init__(self):
+        self.by_id: Dict[str, DirectoryUser] = {}
+        self.by_name: Dict[str, DirectoryUser] = {}
+        # 小文字にしたメールアドレス -> メンバー
+        self.by_email: Dict[str, DirectoryUser] = {}
+        # 複数のメンバーが共有している名前 -> メンバー数
+        self.ambiguous: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def add_members(self, members: List[DirectoryUser]):
+        """メンバーをインデックスに追加"""
+        for member in members:
+            self.by_id[member.id] = member
+            if member.deleted:
+                continue
+            if member.email:
+                self.by_email.setdefault(member.email.lower(), member)
+
+            for name in member.names():
+                if not name:
+                    continue
+                existing = self.by_name.get(name)
+                if existing is None:
+                    self.by_name[name] = member
+                elif existing.id != member.id:
+                    self.ambiguous[name] = self.ambiguous.get(name, 1) + 1
+
+    def find_by_id(self, user_id: str) -> Optional[DirectoryUser]:
+        """ユーザーIDからメンバーを検索"""
+        return self.by_id.get(user_id)
+
+    def find_by_name(self, name: str) -> Optional[DirectoryUser]:
+        """名前からメンバーを検索（重複時はディレクトリ順で最初のメンバー）"""
+        return self.by_name.get(name)
+
+    def find_by_email(self, email: str) -> Optional[DirectoryUser]:
+        """メールアドレスからメンバーを検索"""
+        return self.by_email.get(email.strip().lower())
+
+    def candidates(self, name: str) -> int:
+        """指定した名前に一致するメンバー数"""
+        if name not in self.by_name:
+            return 0
+        return self.ambiguous.get(name, 1)
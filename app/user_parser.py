@@ -1,13 +1,45 @@
 import re
 import csv
+import time
+import asyncio
 import json
+import codecs
 import logging
-from typing import List, Dict, Any, Optional, Tuple
-from io import StringIO
-from .slack_client import SlackClient
+from itertools import chain, islice
+from typing import List, Dict, Any, Optional, Tuple, BinaryIO, Iterable, Iterator
+from .slack_client import SlackClient, SlackWorkspaceError
+from .metrics import import_parse_seconds, import_rows
 
 logger = logging.getLogger(__name__)
 
+# ユーザー識別子として扱うフィールド（優先順）
+# emailは他の識別子がない行でのみ使う（users:read.email がないとディレクトリで解決できないため）
+IDENTIFIER_FIELDS = ('user_id', 'username', 'display_name', 'name', 'email')
+# 変数データに含めないフィールド（emailは識別子に使っても変数として参照できる）
+NON_VARIABLE_FIELDS = ('user_id', 'username', 'display_name', 'name')
+# アップロードを読み込む単位（バイト）
+IMPORT_CHUNK_SIZE = 64 * 1024
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# SlackのユーザーID（U / W で始まる英大文字と数字）
+USER_ID_PATTERN = re.compile(r'^[UW][A-Z0-9]{8,10}$')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+class ImportFileError(ValueError):
+    """ファイル全体を解析できない（形式・文字コードの誤りなど）"""
+
+
+class ImportFileTooLargeError(ImportFileError):
+    """ファイルサイズが上限を超えている"""
+
+
+class InvalidItem:
+    """NDJSONで解析できなかった行"""
+
+    def __init__(self, error: str):
+        self.error = error
+
+
 class UserParser:
     def __init__(self):
         # メンションパターン: @ユーザー名 (日本語文字も含む)
@@ -33,26 +65,229 @@ class UserParser:
     
     def parse_csv(self, file_content: str) -> Tuple[List[Dict[str, Any]], List[str]]:
         """CSVファイルの内容を解析"""
+        return self._collect(self._iter_csv_rows(self._iter_lines([file_content])))
+    
+    def parse_json(self, file_content: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """JSONファイルの内容を解析"""
+        try:
+            return self._collect(self._iter_json_rows(self._iter_json_array([file_content])))
+        except ImportFileError as e:
+            return [], [str(e)]
+    
+    def parse_stream(self, stream: BinaryIO, filename: str = "", max_size: Optional[int] = None,
+                     chunk_size: int = IMPORT_CHUNK_SIZE) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """アップロードされたファイルをチャンクごとに読みながら1回で解析
+        
+        CSV・JSON配列・NDJSON（1行に1つのJSONオブジェクト）に対応する。
+        ファイル全体を文字列として保持しないため、解析中のメモリ使用量は
+        ファイルサイズによらず、読み込み中のチャンクと1行（1要素）分に限られる
+        （戻り値は全行の一覧になるため、大きなファイルは iter_stream で順に処理する）。
+        ファイル全体に関するエラーは ImportFileError を送出し、
+        行ごとのエラーは戻り値のエラー一覧に含める。
+        """
+        started = time.perf_counter()
+        users_data, errors = self._collect(self.iter_stream(stream, filename, max_size, chunk_size))
+        import_parse_seconds.observe(time.perf_counter() - started)
+        import_rows.inc(len(users_data), result="valid")
+        import_rows.inc(len(errors), result="invalid")
+        return users_data, errors
+    
+    def iter_stream(self, stream: BinaryIO, filename: str = "", max_size: Optional[int] = None,
+                    chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+        """ファイルを読みながら1行（1要素）ずつ (ユーザーデータ, エラー) を返す
+        
+        parse_stream と同じ解析を、結果を一覧にまとめずに順に返す。
+        どちらか一方は None。
+        """
+        chunks = self._iter_text_chunks(stream, max_size, chunk_size)
+        first = next((chunk for chunk in chunks if chunk.strip()), None)
+        if first is None:
+            raise ImportFileError("File is empty")
+        chunks = chain([first], chunks)
+        
+        file_format = self.detect_format(filename, first.lstrip()[0])
+        if file_format == "json":
+            return self._iter_json_rows(self._iter_json_array(chunks))
+        if file_format == "ndjson":
+            return self._iter_json_rows(self._iter_ndjson(chunks))
+        return self._iter_csv_rows(self._iter_lines(chunks))
+    
+    def collect_variables(self, rows: Iterable[Tuple[Optional[Dict[str, Any]], Optional[str]]]) -> Tuple[int, Dict[str, Dict[str, Any]], List[str]]:
+        """iter_stream の行から識別子をキーにした変数データを構築（解析した行は保持しない）
+        
+        戻り値は (有効な行数, 変数データ, エラー)。
+        """
+        started = time.perf_counter()
+        imported = 0
+        user_variables: Dict[str, Dict[str, Any]] = {}
+        errors: List[str] = []
+        for user_data, error in rows:
+            if error is not None:
+                errors.append(error)
+                continue
+            imported += 1
+            user_variables[user_data["identifier"]] = user_data["variables"]
+        import_parse_seconds.observe(time.perf_counter() - started)
+        import_rows.inc(imported, result="valid")
+        import_rows.inc(len(errors), result="invalid")
+        return imported, user_variables, errors
+    
+    def detect_format(self, filename: str, first_char: str) -> str:
+        """拡張子（なければ先頭の文字）からファイル形式を判定"""
+        file_ext = filename.lower().rsplit('.', 1)[-1] if '.' in filename else ''
+        if file_ext in ('ndjson', 'jsonl'):
+            return "ndjson"
+        if file_ext == 'json':
+            return "json"
+        if file_ext == 'csv':
+            return "csv"
+        
+        # 内容から推測
+        if first_char == '[':
+            return "json"
+        if first_char == '{':
+            return "ndjson"
+        return "csv"
+    
+    def _iter_text_chunks(self, stream: BinaryIO, max_size: Optional[int], chunk_size: int) -> Iterator[str]:
+        """バイト列をチャンクごとに読み込み、UTF-8として逐次デコード"""
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        total = 0
+        try:
+            while True:
+                data = stream.read(chunk_size)
+                if not data:
+                    break
+                total += len(data)
+                if max_size and total > max_size:
+                    raise ImportFileTooLargeError(f"File too large. Max size: {max_size} bytes")
+                text = decoder.decode(data)
+                if text:
+                    yield text
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield text
+        except UnicodeDecodeError:
+            raise ImportFileError("File must be UTF-8 encoded")
+    
+    def _iter_lines(self, chunks: Iterable[str]) -> Iterator[str]:
+        """チャンクを行単位（改行文字付き）に分割"""
+        buffer = ""
+        for chunk in chunks:
+            lines = (buffer + chunk).split("\n")
+            buffer = lines.pop()
+            for line in lines:
+                yield line + "\n"
+        if buffer:
+            yield buffer
+    
+    def _iter_ndjson(self, chunks: Iterable[str]) -> Iterator[Tuple[str, Any]]:
+        """NDJSONを1行ずつ解析し、(位置, 要素) を返す"""
+        for line_num, line in enumerate(self._iter_lines(chunks), start=1):
+            if not line.strip():
+                continue
+            try:
+                yield f"Line {line_num}", json.loads(line)
+            except json.JSONDecodeError as e:
+                yield f"Line {line_num}", InvalidItem(f"Invalid JSON: {str(e)}")
+    
+    def _iter_json_array(self, chunks: Iterable[str]) -> Iterator[Tuple[str, Any]]:
+        """JSON配列を要素ごとに逐次解析し、(位置, 要素) を返す"""
+        decoder = json.JSONDecoder()
+        chunks = iter(chunks)
+        buffer = ""
+        pos = 0
+        eof = False
+        
+        def read_more(minimum: int = 1) -> bool:
+            # 未解析の部分を残してチャンクを追加（長い要素でも再解析が増えすぎないよう倍々で読む）
+            nonlocal buffer, pos, eof
+            pending = [buffer[pos:]]
+            size = len(pending[0])
+            while not eof and size < minimum:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    eof = True
+                    break
+                pending.append(chunk)
+                size += len(chunk)
+            if len(pending) == 1:
+                return False
+            buffer = "".join(pending)
+            pos = 0
+            return True
+        
+        def next_char() -> Optional[str]:
+            # 空白を読み飛ばして次の文字を返す（終端ならNone）
+            nonlocal pos
+            while True:
+                pos = JSON_WHITESPACE.match(buffer, pos).end()
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not read_more():
+                    return None
+        
+        if next_char() != '[':
+            raise ImportFileError("JSON must be an array of user objects")
+        pos += 1
+        
+        index = 0
+        if next_char() == ']':
+            pos += 1
+        else:
+            while True:
+                if next_char() is None:
+                    raise ImportFileError("Invalid JSON format: unexpected end of data")
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                    # 数値などはチャンクの境界で途切れている可能性がある
+                    if end == len(buffer) and read_more(len(buffer) - pos + 1):
+                        continue
+                except json.JSONDecodeError as e:
+                    if read_more(2 * (len(buffer) - pos) + 1):
+                        continue
+                    raise ImportFileError(f"Invalid JSON format: {str(e)}")
+                pos = end
+                yield f"Item {index}", item
+                index += 1
+                
+                separator = next_char()
+                pos += 1
+                if separator == ']':
+                    break
+                if separator != ',':
+                    raise ImportFileError("Invalid JSON format: expected ',' or ']' in array")
+        
+        if next_char() is not None:
+            raise ImportFileError("Invalid JSON format: extra data after array")
+    
+    def _collect(self, rows: Iterable[Tuple[Optional[Dict[str, Any]], Optional[str]]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """(ユーザーデータ, エラー) の列をユーザーデータとエラーの一覧にまとめる"""
         users_data = []
         errors = []
-        
+        for user_data, error in rows:
+            if error is not None:
+                errors.append(error)
+            else:
+                users_data.append(user_data)
+        return users_data, errors
+    
+    def _iter_csv_rows(self, lines: Iterable[str]) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+        """CSVの行を順に解析"""
         try:
             # CSVを解析
-            reader = csv.DictReader(StringIO(file_content))
+            reader = csv.DictReader(lines)
             
             # ヘッダーの確認
             if not reader.fieldnames:
-                errors.append("CSV file is empty or has no headers")
-                return users_data, errors
+                yield None, "CSV file is empty or has no headers"
+                return
             
             # 必須フィールドの確認
-            required_fields = ['user_id']  # 最低限user_idが必要
-            alternative_fields = ['username', 'display_name', 'name']  # user_idの代替
-            
-            has_user_identifier = any(field in reader.fieldnames for field in required_fields + alternative_fields)
+            has_user_identifier = any(field in reader.fieldnames for field in IDENTIFIER_FIELDS)
             if not has_user_identifier:
-                errors.append(f"CSV must contain at least one of: {required_fields + alternative_fields}")
-                return users_data, errors
+                yield None, f"CSV must contain at least one of: {list(IDENTIFIER_FIELDS)}"
+                return
             
             # 各行を処理
             for row_num, row in enumerate(reader, start=2):  # ヘッダーを考慮して2から開始
@@ -63,14 +298,14 @@ class UserParser:
                 user_identifier = None
                 identifier_type = None
                 
-                for field in required_fields + alternative_fields:
+                for field in IDENTIFIER_FIELDS:
                     if field in row and row[field] and row[field].strip():
                         user_identifier = row[field].strip()
                         identifier_type = field
                         break
                 
                 if not user_identifier:
-                    errors.append(f"Row {row_num}: No valid user identifier found")
+                    yield None, f"Row {row_num}: No valid user identifier found"
                     continue
                 
                 # ユーザーデータを構築
@@ -80,165 +315,176 @@ class UserParser:
                     "variables": {}
                 }
                 
-                # 変数データを抽出（user_id以外のフィールド）
+                # 変数データを抽出（識別子以外のフィールド）
                 for field, value in row.items():
-                    if field not in required_fields + alternative_fields and value is not None:
+                    if field not in NON_VARIABLE_FIELDS and value is not None:
                         user_data["variables"][field] = value.strip() if isinstance(value, str) else value
                 
-                users_data.append(user_data)
+                yield user_data, None
         
+        except ImportFileError:
+            raise
         except csv.Error as e:
-            errors.append(f"CSV parsing error: {str(e)}")
+            yield None, f"CSV parsing error: {str(e)}"
         except Exception as e:
-            errors.append(f"Unexpected error parsing CSV: {str(e)}")
-        
-        return users_data, errors
+            yield None, f"Unexpected error parsing CSV: {str(e)}"
     
-    def parse_json(self, file_content: str) -> Tuple[List[Dict[str, Any]], List[str]]:
-        """JSONファイルの内容を解析"""
-        users_data = []
-        errors = []
-        
-        try:
-            data = json.loads(file_content)
+    def _iter_json_rows(self, items: Iterable[Tuple[str, Any]]) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+        """JSONの要素を順に解析"""
+        for position, item in items:
+            if isinstance(item, InvalidItem):
+                yield None, f"{position}: {item.error}"
+                continue
             
-            if not isinstance(data, list):
-                errors.append("JSON must be an array of user objects")
-                return users_data, errors
+            if not isinstance(item, dict):
+                yield None, f"{position}: Must be an object"
+                continue
             
-            for index, item in enumerate(data):
-                if not isinstance(item, dict):
-                    errors.append(f"Item {index}: Must be an object")
-                    continue
-                
-                # ユーザー識別子を取得
-                user_identifier = None
-                identifier_type = None
-                
-                for field in ['user_id', 'username', 'display_name', 'name']:
-                    if field in item and item[field]:
-                        user_identifier = str(item[field]).strip()
-                        identifier_type = field
-                        break
-                
-                if not user_identifier:
-                    errors.append(f"Item {index}: No valid user identifier found")
-                    continue
-                
-                # ユーザーデータを構築
-                user_data = {
-                    "identifier": user_identifier,
-                    "identifier_type": identifier_type,
-                    "variables": {}
-                }
-                
-                # 変数データを抽出
-                for field, value in item.items():
-                    if field not in ['user_id', 'username', 'display_name', 'name'] and value is not None:
-                        user_data["variables"][field] = str(value) if not isinstance(value, (dict, list)) else value
-                
-                users_data.append(user_data)
-        
-        except json.JSONDecodeError as e:
-            errors.append(f"Invalid JSON format: {str(e)}")
-        except Exception as e:
-            errors.append(f"Unexpected error parsing JSON: {str(e)}")
-        
-        return users_data, errors
+            # ユーザー識別子を取得
+            user_identifier = None
+            identifier_type = None
+            
+            for field in IDENTIFIER_FIELDS:
+                if field in item and item[field]:
+                    user_identifier = str(item[field]).strip()
+                    identifier_type = field
+                    break
+            
+            if not user_identifier:
+                yield None, f"{position}: No valid user identifier found"
+                continue
+            
+            # ユーザーデータを構築
+            user_data = {
+                "identifier": user_identifier,
+                "identifier_type": identifier_type,
+                "variables": {}
+            }
+            
+            # 変数データを抽出
+            for field, value in item.items():
+                if field not in NON_VARIABLE_FIELDS and value is not None:
+                    user_data["variables"][field] = str(value) if not isinstance(value, (dict, list)) else value
+            
+            yield user_data, None
+    
+    def identifier_kind(self, identifier: str, identifier_type: Optional[str] = None) -> str:
+        """識別子の種類（user_id / email / name）を判定
+
+        識別子の列（identifier_type）が指定されている場合はその列に従い、
+        形式による推定は列のない識別子（メンションの一覧など）にのみ使う。
+        """
+        if identifier_type is not None:
+            return identifier_type if identifier_type in ('user_id', 'email') else "name"
+        if USER_ID_PATTERN.match(identifier):
+            return "user_id"
+        if EMAIL_PATTERN.match(identifier):
+            return "email"
+        return "name"
     
     async def resolve_users(self, slack_client: SlackClient, user_identifiers: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
         """ユーザー識別子のリストからSlackユーザー情報を解決"""
-        resolved_users = []
-        errors = []
+        rows = [
+            {"identifier": identifier.strip().lstrip('@'), "identifier_type": None, "variables": {}}
+            for identifier in user_identifiers
+        ]
+        rows = [row for row in rows if row["identifier"]]
+        resolved_users, _, errors = await self.resolve_users_with_variables(slack_client, rows)
+        return resolved_users, errors
+    
+    async def resolve_rows(self, slack_client: SlackClient, users_data: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """各行の識別子をまとめて解決し、行ごとのSlackユーザー情報（見つからない場合はNone）を返す"""
+        identifiers: Dict[str, List[str]] = {"user_id": [], "email": [], "name": []}
+        kinds = []
+        for user_data in users_data:
+            kind = self.identifier_kind(user_data["identifier"], user_data["identifier_type"])
+            identifiers[kind].append(user_data["identifier"])
+            kinds.append(kind)
         
-        for identifier in user_identifiers:
-            try:
-                clean_identifier = identifier.strip().lstrip('@')
-                if not clean_identifier:
-                    continue
-                
-                # ユーザーIDの形式かチェック（Uで始まる）
-                if clean_identifier.startswith('U') and len(clean_identifier) == 11:
-                    # ユーザーIDとして扱う
-                    user_info = await slack_client.get_user_info(clean_identifier)
-                else:
-                    # 表示名として扱う
-                    user_info = await slack_client.get_user_by_name(clean_identifier)
-                
-                if user_info:
-                    resolved_users.append(user_info)
-                else:
-                    errors.append(f"User not found: {identifier}")
+        found = await slack_client.resolve_identifiers(
+            user_ids=identifiers["user_id"],
+            names=identifiers["name"],
+            emails=identifiers["email"]
+        )
+        return [found[kind].get(user_data["identifier"]) for kind, user_data in zip(kinds, users_data)]
+    
+    async def resolve_stream_with_variables(
+        self,
+        slack_client: SlackClient,
+        rows: Iterator[Tuple[Optional[Dict[str, Any]], Optional[str]]],
+        batch_size: int
+    ) -> Tuple[int, List[Dict[str, Any]], Dict[str, Dict[str, Any]], List[str]]:
+        """iter_stream の行を batch_size 行ずつ読み込んで解決
+        
+        読み込み（ファイルの読み出しと解析）はスレッドプールで行い、解決済みの
+        ユーザーと変数データのみを保持する（解析した行は1バッチ分だけ）。
+        戻り値は (有効な行数, ユーザー情報, 変数データ, エラー)。
+        """
+        loop = asyncio.get_running_loop()
+        imported = 0
+        parse_seconds = 0.0
+        resolved_users: List[Dict[str, Any]] = []
+        user_variables: Dict[str, Dict[str, Any]] = {}
+        errors: List[str] = []
+        seen = set()
+        
+        def read_batch() -> Tuple[List[Tuple[Optional[Dict[str, Any]], Optional[str]]], float]:
+            started = time.perf_counter()
+            return list(islice(rows, batch_size)), time.perf_counter() - started
+        
+        while True:
+            batch, elapsed = await loop.run_in_executor(None, read_batch)
+            parse_seconds += elapsed
+            if not batch:
+                break
+            
+            users_data, parse_errors = self._collect(batch)
+            imported += len(users_data)
+            errors.extend(parse_errors)
+            import_rows.inc(len(users_data), result="valid")
+            import_rows.inc(len(parse_errors), result="invalid")
             
-            except Exception as e:
-                logger.error(f"Error resolving user {identifier}: {str(e)}")
-                errors.append(f"Error resolving user {identifier}: {str(e)}")
+            batch_users, batch_variables, batch_errors = await self.resolve_users_with_variables(slack_client, users_data)
+            for user_info in batch_users:
+                if user_info["id"] not in seen:
+                    seen.add(user_info["id"])
+                    resolved_users.append(user_info)
+            user_variables.update(batch_variables)
+            errors.extend(batch_errors)
         
-        return resolved_users, errors
+        import_parse_seconds.observe(parse_seconds)
+        return imported, resolved_users, user_variables, errors
     
     async def resolve_users_with_variables(self, slack_client: SlackClient, users_data: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]], List[str]]:
-        """変数付きのユーザーデータからSlackユーザー情報と変数データを解決"""
+        """変数付きのユーザーデータからSlackユーザー情報と変数データを解決
+        
+        識別子をまとめてSlackClient.resolve_identifiersで解決し、変数データは
+        SlackユーザーIDをキーにして返す。同じユーザーが複数行にある場合は1人として扱う。
+        トークン・権限のエラーは行ごとのエラーにせず SlackWorkspaceError を送出する。
+        """
         resolved_users = []
         user_variables = {}
         errors = []
         
-        for user_data in users_data:
-            try:
-                identifier = user_data["identifier"]
-                identifier_type = user_data["identifier_type"]
-                variables = user_data["variables"]
-                
-                # Slackユーザー情報を取得
-                if identifier_type == 'user_id' or (identifier.startswith('U') and len(identifier) == 11):
-                    user_info = await slack_client.get_user_info(identifier)
-                else:
-                    user_info = await slack_client.get_user_by_name(identifier)
-                
-                if user_info:
-                    resolved_users.append(user_info)
-                    # 変数データを保存
-                    if variables:
-                        user_variables[user_info["id"]] = variables
-                else:
-                    errors.append(f"User not found: {identifier}")
+        try:
+            found = await self.resolve_rows(slack_client, users_data)
+        except SlackWorkspaceError:
+            raise
+        except Exception as e:
+            logger.error(f"Error resolving users: {str(e)}")
+            return resolved_users, user_variables, [f"Error resolving users: {str(e)}"]
+        
+        seen = set()
+        for user_data, user_info in zip(users_data, found):
+            if not user_info:
+                errors.append(f"User not found: {user_data['identifier']}")
+                continue
             
-            except Exception as e:
-                logger.error(f"Error resolving user with variables {user_data}: {str(e)}")
-                errors.append(f"Error resolving user {identifier}: {str(e)}")
+            if user_info["id"] not in seen:
+                seen.add(user_info["id"])
+                resolved_users.append(user_info)
+            # 変数データを保存
+            if user_data["variables"]:
+                user_variables[user_info["id"]] = user_data["variables"]
         
         return resolved_users, user_variables, errors
-    
-    def validate_file_format(self, file_content: str, filename: str) -> Tuple[bool, str]:
-        """ファイル形式を検証"""
-        if not file_content or not file_content.strip():
-            return False, "File is empty"
-        
-        file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
-        
-        if file_ext == 'csv':
-            try:
-                reader = csv.reader(StringIO(file_content))
-                next(reader)  # ヘッダー行を読む
-                return True, "CSV format detected"
-            except:
-                return False, "Invalid CSV format"
-        
-        elif file_ext == 'json':
-            try:
-                json.loads(file_content)
-                return True, "JSON format detected"
-            except:
-                return False, "Invalid JSON format"
-        
-        else:
-            # 内容から推測
-            try:
-                json.loads(file_content)
-                return True, "JSON format detected (by content)"
-            except:
-                try:
-                    reader = csv.reader(StringIO(file_content))
-                    next(reader)
-                    return True, "CSV format detected (by content)"
-                except:
-                    return False, "Unknown file format"
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""ユーザーディレクトリキャッシュのメモリ使用量ベンチマーク
+
+users.listの生のメンバー情報を保持した場合と、DirectoryUserに射影して
+保持した場合のメモリ使用量をtracemallocで比較する。
+
+使い方:
+    python -m benchmarks.directory_memory --members 20000
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from app.user_index import DirectoryUser, UserIndex
+
+
+def make_member(i: int) -> dict:
+    """users.listが返すメンバーに近い形のダミーデータを生成"""
+    image_base = f"https://avatars.slack-edge.com/2023-01-01/{1000000 + i}_abcdef0123456789"
+    return {
+        "id": f"U{i:010d}",
+        "team_id": "T0123456789",
+        "name": f"user.{i}",
+        "deleted": i % 50 == 0,
+        "color": "9f69e7",
+        "real_name": f"User Number {i}",
+        "tz": "Asia/Tokyo",
+        "tz_label": "Japan Standard Time",
+        "tz_offset": 32400,
+        "profile": {
+            "title": "Software Engineer",
+            "phone": "",
+            "skype": "",
+            "real_name": f"User Number {i}",
+            "real_name_normalized": f"User Number {i}",
+            "display_name": f"user{i}",
+            "display_name_normalized": f"user{i}",
+            "fields": None,
+            "status_text": "In a meeting",
+            "status_emoji": ":calendar:",
+            "status_emoji_display_info": [],
+            "status_expiration": 0,
+            "avatar_hash": f"{i:012x}",
+            "email": f"user.{i}@example.com",
+            "first_name": "User",
+            "last_name": f"Number {i}",
+            "image_24": f"{image_base}_24.png",
+            "image_32": f"{image_base}_32.png",
+            "image_48": f"{image_base}_48.png",
+            "image_72": f"{image_base}_72.png",
+            "image_192": f"{image_base}_192.png",
+            "image_512": f"{image_base}_512.png",
+            "image_1024": f"{image_base}_1024.png",
+            "image_original": f"{image_base}_original.png",
+            "is_custom_image": True,
+            "status_text_canonical": "",
+            "team": "T0123456789",
+        },
+        "is_admin": False,
+        "is_owner": False,
+        "is_primary_owner": False,
+        "is_restricted": False,
+        "is_ultra_restricted": False,
+        "is_bot": False,
+        "is_app_user": False,
+        "updated": 1700000000 + i,
+        "is_email_confirmed": True,
+        "who_can_share_contact_card": "EVERYONE",
+        "locale": "ja-JP",
+    }
+
+
+def measure(build) -> tuple:
+    """build()で生成したオブジェクトのメモリ使用量（バイト）を計測"""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=20000, help="ワークスペースのメンバー数")
+    parser.add_argument("--page-size", type=int, default=1000, help="users.listの1ページあたりの件数")
+    args = parser.parse_args()
+
+    # Slackからのレスポンスと同様にページ単位のJSON文字列から復元する
+    pages = [
+        json.dumps([make_member(i) for i in range(start, min(start + args.page_size, args.members))])
+        for start in range(0, args.members, args.page_size)
+    ]
+
+    def build_raw():
+        members = []
+        for page in pages:
+            members.extend(json.loads(page))
+        return members
+
+    raw, raw_bytes, raw_peak = measure(build_raw)
+    del raw
+
+    def build_compact():
+        members = []
+        for page in pages:
+            members.extend(DirectoryUser.from_member(member) for member in json.loads(page))
+        return members
+
+    compact, compact_bytes, compact_peak = measure(build_compact)
+
+    def build_index():
+        index = UserIndex()
+        index.add_members(compact)
+        return index
+
+    index, index_bytes, _ = measure(build_index)
+
+    mb = 1024 * 1024
+    print(f"members:              {args.members}")
+    print(f"raw members:          {raw_bytes / mb:8.2f} MB retained ({raw_bytes / args.members:6.0f} B/user)")
+    print(f"DirectoryUser:        {compact_bytes / mb:8.2f} MB retained ({compact_bytes / args.members:6.0f} B/user), "
+          f"peak {compact_peak / mb:.2f} MB while ingesting")
+    print(f"UserIndex (on top):   {index_bytes / mb:8.2f} MB")
+    print(f"reduction:            {raw_bytes / compact_bytes:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
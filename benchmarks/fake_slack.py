@@ -0,0 +1,338 @@
+"""ローカルで動かすダミーのSlack Web APIサーバー
+
+実際のワークスペースに送信せずに送信処理を試すためのサンドボックス。
+SlackClient が使うメソッド（auth.test / users.list / users.info /
+users.lookupByEmail / conversations.open / chat.postMessage）に、
+合成したユーザー（U000000000〜）で応答する。
+
+- 応答の遅延（--latency / --jitter）
+- メソッドごとの上限（回/分）を超えた呼び出しへの429応答（Retry-After付き）と、
+  ランダムな429の注入（--throttle-ratio）
+- ユーザーごとのエラーコードの注入（--fail USER=CODE、--fail-ratio）と、
+  初回のみ失敗する一時的なエラー（--flaky-ratio）
+
+を設定できる。呼び出し数や429の件数は GET /stats で確認できる。
+
+使い方:
+    python -m benchmarks.fake_slack --port 8990 --users 50000 --latency 0.05 \\
+        --rate-limit chat.postMessage=600 --fail U000000007=user_not_found
+    SLACK_API_BASE_URL=http://127.0.0.1:8990/api/ SLACK_TOKEN=xoxp-sandbox \\
+        python -m app.cli send --template t.txt --recipients r.csv
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+from aiohttp import web
+
+# 上限を数える期間（秒）
+RATE_WINDOW = 60.0
+
+
+def user_id_of(index: int) -> str:
+    return f"U{index:09d}"
+
+
+def make_member(index: int) -> Dict[str, Any]:
+    """users.list / users.info が返すメンバー"""
+    return {
+        "id": user_id_of(index),
+        "team_id": "T000SANDBOX",
+        "name": f"user{index}",
+        "deleted": False,
+        "is_bot": False,
+        "real_name": f"User {index}",
+        "profile": {
+            "display_name": f"user{index}",
+            "real_name": f"User {index}",
+            "email": f"user{index}@example.com",
+        },
+    }
+
+
+class MethodStats:
+    """メソッドごとの呼び出し数と、直近の呼び出し時刻"""
+
+    def __init__(self):
+        self.calls = 0
+        self.ok = 0
+        self.errors: Dict[str, int] = {}
+        self.rate_limited = 0
+        self.injected_429 = 0
+        self.peak_per_minute = 0
+        self.peak_per_second = 0
+        self.recent: Deque[float] = deque()
+        self.last_second: Deque[float] = deque()
+
+    def record_call(self, now: float) -> int:
+        """呼び出しを記録し、直近 RATE_WINDOW 秒の呼び出し数を返す"""
+        self.calls += 1
+        recent = self.recent
+        while recent and recent[0] <= now - RATE_WINDOW:
+            recent.popleft()
+        recent.append(now)
+        self.peak_per_minute = max(self.peak_per_minute, len(recent))
+        last_second = self.last_second
+        while last_second and last_second[0] <= now - 1.0:
+            last_second.popleft()
+        last_second.append(now)
+        self.peak_per_second = max(self.peak_per_second, len(last_second))
+        return len(recent)
+
+    def discard_call(self):
+        """上限を超えて拒否した呼び出しを数から除く"""
+        self.recent.pop()
+        self.last_second.pop()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "ok": self.ok,
+            "errors": dict(self.errors),
+            "rate_limited": self.rate_limited,
+            "injected_429": self.injected_429,
+            "peak_per_minute": self.peak_per_minute,
+            "peak_per_second": self.peak_per_second,
+        }
+
+
+class FakeSlack:
+    """ダミーのSlack Web API
+
+    ``rate_limits`` はメソッドごとの上限（回/分）。直近1分の呼び出し数が上限に
+    達しているメソッドには、最も古い呼び出しが期間外になるまでの秒数を
+    Retry-After として429を返す（上限を超えた呼び出しは数に含めない）。
+    """
+
+    def __init__(
+        self,
+        users: int = 1000,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_limits: Optional[Dict[str, float]] = None,
+        throttle_ratio: float = 0.0,
+        retry_after: float = 1.0,
+        user_errors: Optional[Dict[str, str]] = None,
+        fail_ratio: float = 0.0,
+        fail_code: str = "user_not_found",
+        flaky_ratio: float = 0.0,
+        flaky_code: str = "internal_error",
+        seed: Optional[int] = None
+    ):
+        self.users = users
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limits = rate_limits or {}
+        self.throttle_ratio = throttle_ratio
+        self.retry_after = retry_after
+        self.user_errors = user_errors or {}
+        self.fail_ratio = fail_ratio
+        self.fail_code = fail_code
+        self.flaky_ratio = flaky_ratio
+        self.flaky_code = flaky_code
+        self.random = random.Random(seed)
+        self.methods: Dict[str, MethodStats] = {}
+        self.messages = 0
+        # 一時的なエラーを返したユーザー（2回目以降は成功させる）
+        self._flaked: Set[str] = set()
+        self._handlers = {
+            "auth.test": self.auth_test,
+            "users.list": self.users_list,
+            "users.info": self.users_info,
+            "users.lookupByEmail": self.users_lookup_by_email,
+            "conversations.open": self.conversations_open,
+            "chat.postMessage": self.chat_post_message,
+        }
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/api/{method}", self.handle)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "messages": self.messages,
+            "methods": {method: stats.to_dict() for method, stats in self.methods.items()},
+        }
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        stats = self.methods.setdefault(method, MethodStats())
+        recent = stats.record_call(time.monotonic())
+
+        limit = self.rate_limits.get(method)
+        if limit is not None and recent > limit:
+            stats.discard_call()
+            stats.rate_limited += 1
+            oldest = stats.recent[0] if stats.recent else time.monotonic()
+            retry_after = max(1, int(oldest + RATE_WINDOW - time.monotonic()) + 1)
+            return self._rate_limited(retry_after)
+        if self.throttle_ratio and self.random.random() < self.throttle_ratio:
+            stats.injected_429 += 1
+            return self._rate_limited(self.retry_after)
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+        handler = self._handlers.get(method)
+        if handler is None:
+            body = {"ok": False, "error": "unknown_method"}
+        else:
+            body = handler(await self._params(request))
+
+        if body["ok"]:
+            stats.ok += 1
+        else:
+            stats.errors[body["error"]] = stats.errors.get(body["error"], 0) + 1
+        return web.json_response(body)
+
+    def _rate_limited(self, retry_after: float) -> web.Response:
+        return web.json_response(
+            {"ok": False, "error": "ratelimited"},
+            status=429,
+            headers={"Retry-After": str(int(retry_after))}
+        )
+
+    async def _params(self, request: web.Request) -> Dict[str, Any]:
+        """クエリ・フォーム・JSONの引数をまとめる"""
+        params: Dict[str, Any] = dict(request.query)
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                params.update(await request.json())
+            else:
+                params.update(await request.post())
+        return params
+
+    def _index_of(self, user_id: str) -> Optional[int]:
+        if len(user_id) == 10 and user_id[0] == "U" and user_id[1:].isdigit():
+            index = int(user_id[1:])
+            if index < self.users:
+                return index
+        return None
+
+    def _user_error(self, user_id: str) -> Optional[str]:
+        """ユーザーに注入するエラーコード"""
+        if user_id in self.user_errors:
+            return self.user_errors[user_id]
+        # 割合の指定はユーザーIDから決まる（同じユーザーは常に同じ結果）
+        bucket = zlib.crc32(user_id.encode()) % 1_000_000 / 1_000_000
+        if bucket < self.fail_ratio:
+            return self.fail_code
+        if bucket < self.fail_ratio + self.flaky_ratio and user_id not in self._flaked:
+            self._flaked.add(user_id)
+            return self.flaky_code
+        return None
+
+    def auth_test(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {"ok": True, "url": "https://sandbox.slack.com/", "team": "sandbox",
+                "user": "sandbox", "team_id": "T000SANDBOX", "user_id": "U999999999"}
+
+    def users_list(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        start = int(params.get("cursor") or 0)
+        limit = int(params.get("limit") or 1000)
+        end = min(self.users, start + limit)
+        return {
+            "ok": True,
+            "members": [make_member(index) for index in range(start, end)],
+            "response_metadata": {"next_cursor": str(end) if end < self.users else ""},
+        }
+
+    def users_info(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        index = self._index_of(params.get("user", ""))
+        if index is None:
+            return {"ok": False, "error": "user_not_found"}
+        return {"ok": True, "user": make_member(index)}
+
+    def users_lookup_by_email(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        email = params.get("email", "")
+        local, _, domain = email.partition("@")
+        if domain == "example.com" and local.startswith("user") and local[4:].isdigit():
+            index = int(local[4:])
+            if index < self.users:
+                return {"ok": True, "user": make_member(index)}
+        return {"ok": False, "error": "users_not_found"}
+
+    def conversations_open(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        user_id = params.get("users", "")
+        if self._index_of(user_id) is None:
+            return {"ok": False, "error": "user_not_found"}
+        error = self._user_error(user_id)
+        if error:
+            return {"ok": False, "error": error}
+        return {"ok": True, "channel": {"id": "D" + user_id[1:]}}
+
+    def chat_post_message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        channel = params.get("channel", "")
+        if not channel.startswith("D") or self._index_of("U" + channel[1:]) is None:
+            return {"ok": False, "error": "channel_not_found"}
+        if not params.get("text"):
+            return {"ok": False, "error": "no_text"}
+        self.messages += 1
+        return {"ok": True, "channel": channel, "ts": f"{time.time():.6f}"}
+
+
+def parse_pairs(values, convert=str) -> Dict[str, Any]:
+    """KEY=VALUE の一覧を辞書に変換"""
+    pairs = {}
+    for value in values or []:
+        key, _, item = value.partition("=")
+        pairs[key.strip()] = convert(item.strip())
+    return pairs
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """ダミーサーバーの設定の引数（ベンチマークと共通）"""
+    parser.add_argument("--users", type=int, default=1000, help="ワークスペースのユーザー数")
+    parser.add_argument("--latency", type=float, default=0.0, help="応答の遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅延に加えるランダムな時間の上限（秒）")
+    parser.add_argument("--rate-limit", action="append", metavar="METHOD=RPM",
+                        help="メソッドごとの上限（回/分）。超えた呼び出しには429を返す")
+    parser.add_argument("--throttle-ratio", type=float, default=0.0, help="ランダムに429を返す割合")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="ランダムな429のRetry-After（秒）")
+    parser.add_argument("--fail", action="append", metavar="USER=CODE", help="ユーザーに返すエラーコード")
+    parser.add_argument("--fail-ratio", type=float, default=0.0, help="恒久的なエラーを返すユーザーの割合")
+    parser.add_argument("--fail-code", default="user_not_found", help="--fail-ratio のエラーコード")
+    parser.add_argument("--flaky-ratio", type=float, default=0.0, help="初回のみ一時的なエラーを返すユーザーの割合")
+    parser.add_argument("--seed", type=int, default=None, help="乱数のシード")
+
+
+def server_from_args(args: argparse.Namespace) -> FakeSlack:
+    return FakeSlack(
+        users=args.users,
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limits=parse_pairs(args.rate_limit, float),
+        throttle_ratio=args.throttle_ratio,
+        retry_after=args.retry_after,
+        user_errors=parse_pairs(args.fail),
+        fail_ratio=args.fail_ratio,
+        fail_code=args.fail_code,
+        flaky_ratio=args.flaky_ratio,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8990)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args)
+    print(f"Fake Slack API: SLACK_API_BASE_URL=http://{args.host}:{args.port}/api/")
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+    print(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""テンプレートレンダリングのベンチマーク
+
+変数が1・10・50個のテンプレートについて、1回のレンダリングにかかる時間を
+以前の実装（str.format と、変数が欠けている場合の str.replace の繰り返し）と
+解析済みテンプレートによる1回の走査でのレンダリングで比較する。
+
+使い方:
+    python -m benchmarks.template_render --repeat 20000
+"""
+import argparse
+import timeit
+
+from app.message_processor import MessageProcessor
+
+
+def make_template(variable_count: int) -> str:
+    """指定した数の変数を含むテンプレートを生成"""
+    lines = ["{name}さん、お疲れさまです。"]
+    lines.extend(f"項目{i}: {{var_{i}}}" for i in range(1, variable_count))
+    lines.append("よろしくお願いします。")
+    return "\n".join(lines)
+
+
+def legacy_format(template: str, variables: dict) -> str:
+    """以前の実装（すべての変数が揃っている場合）"""
+    return template.format(**variables)
+
+
+def legacy_replace(template: str, variables: dict, required_variables: list) -> str:
+    """以前の実装（変数が欠けている場合）"""
+    available_variables = {k: v for k, v in variables.items() if k in required_variables}
+    partial_template = template
+    for var, value in available_variables.items():
+        partial_template = partial_template.replace(f"{{{var}}}", str(value))
+    return partial_template
+
+
+def per_render_us(func, repeat: int) -> float:
+    """1回あたりの実行時間（マイクロ秒）。5回計測した最小値を使う"""
+    return min(timeit.repeat(func, number=repeat, repeat=5)) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20000, help="1回の計測でのレンダリング回数")
+    args = parser.parse_args()
+
+    processor = MessageProcessor()
+    print(f"{'vars':>4}  {'case':<8} {'legacy':>10} {'compiled':>10} {'speedup':>8}")
+
+    for variable_count in (1, 10, 50):
+        template = make_template(variable_count)
+        compiled = processor.compile(template)
+        variables = {name: f"value of {name}" for name in compiled.variables}
+        # 最後の変数が欠けているデータ
+        partial = dict(variables)
+        partial.pop(compiled.variables[-1])
+
+        # 出力が以前の実装と同じであることを確認
+        assert compiled.render(variables) == legacy_format(template, variables)
+        assert compiled.render(partial) == legacy_replace(template, partial, list(compiled.variables))
+
+        cases = [
+            ("all", lambda: legacy_format(template, variables), lambda: compiled.render(variables)),
+            ("missing", lambda: legacy_replace(template, partial, list(compiled.variables)),
+             lambda: compiled.render(partial)),
+        ]
+        for case, legacy, current in cases:
+            legacy_us = per_render_us(legacy, args.repeat)
+            current_us = per_render_us(current, args.repeat)
+            print(f"{variable_count:>4}  {case:<8} {legacy_us:>8.2f}us {current_us:>8.2f}us {legacy_us / current_us:>7.1f}x")
+
+    # 送信時の経路（キャッシュ参照・欠損チェックを含む）
+    template = make_template(10)
+    variables = {name: f"value of {name}" for name in processor.compile(template).variables}
+    safe_us = per_render_us(lambda: processor.render_template_safe(template, variables), args.repeat)
+    print(f"render_template_safe (10 vars, cached): {safe_us:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
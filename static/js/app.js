@@ -5,7 +5,8 @@ const AppState = {
     targetUsers: [],
     messageTemplate: '',
     userVariables: {},
-    sendJobId: null
+    sendJobId: null,
+    sendIdempotencyKey: null
 };
 
 // DOM要素の取得
@@ -197,6 +198,8 @@ async function parseMentions() {
             
             if (result.errors.length > 0) {
                 showNotification(`一部のユーザーが見つかりませんでした: ${result.errors.join(', ')}`, 'warning');
+            } else if (result.warnings && result.warnings.length > 0) {
+                showNotification(`同名のユーザーが複数います: ${result.warnings.join(', ')}`, 'warning');
             } else {
                 showNotification(`${result.users.length}人のユーザーを取得しました`, 'success');
             }
@@ -241,6 +244,8 @@ async function handleFileUpload() {
     try {
         const formData = new FormData();
         formData.append('file', file);
+        // トークンを渡すとサーバー側でSlackユーザーに解決される
+        formData.append('token', AppState.slackToken);
         
         const response = await fetch('/api/import-variables', {
             method: 'POST',
@@ -250,8 +255,11 @@ async function handleFileUpload() {
         const result = await response.json();
         
         if (response.ok) {
-            // ユーザーデータの処理（簡略版 - 実際のユーザー解決は後で実装）
-            showNotification(`${result.imported_count}件のデータをインポートしました`, 'success');
+            // 解決したユーザーを送信対象に、変数データをユーザーIDごとに反映
+            AppState.targetUsers = result.users;
+            AppState.userVariables = result.user_data;
+            updateUsersPreview();
+            showNotification(`${result.users.length}人のユーザーをインポートしました`, 'success');
             
             if (result.errors.length > 0) {
                 showNotification(`警告: ${result.errors.join(', ')}`, 'warning');
@@ -385,6 +393,11 @@ function setupVariablesStep() {
                 <input type="text" data-user="${user.id}" data-variable="${variable}" 
                        placeholder="${variable}の値を入力">
             `;
+            // インポート済みの値があれば反映
+            const importedValue = (AppState.userVariables[user.id] || {})[variable];
+            if (importedValue !== undefined) {
+                inputDiv.querySelector('input').value = importedValue;
+            }
             inputsDiv.appendChild(inputDiv);
         });
         
@@ -426,6 +439,8 @@ async function importVariables() {
     try {
         const formData = new FormData();
         formData.append('file', file);
+        // トークンを渡すとサーバー側でSlackユーザーに解決される
+        formData.append('token', AppState.slackToken);
         
         const response = await fetch('/api/import-variables', {
             method: 'POST',
@@ -435,12 +450,9 @@ async function importVariables() {
         const result = await response.json();
         
         if (response.ok) {
-            // 変数データをフォームに反映
-            Object.entries(result.user_data).forEach(([identifier, variables]) => {
-                // ユーザーIDまたは名前で一致するユーザーを探す
-                const user = AppState.targetUsers.find(u => 
-                    u.id === identifier || u.name === identifier || u.display_name === identifier
-                );
+            // 変数データをフォームに反映（キーはSlackユーザーID）
+            Object.entries(result.user_data).forEach(([userId, variables]) => {
+                const user = AppState.targetUsers.find(u => u.id === userId);
                 
                 if (user) {
                     Object.entries(variables).forEach(([varName, varValue]) => {
@@ -464,8 +476,18 @@ async function importVariables() {
     }
 }
 
+// 送信リクエストの冪等キーを生成（二重送信防止）
+function generateIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
 // Step 5: 最終確認ステップ
 async function setupFinalStep() {
+    AppState.sendIdempotencyKey = generateIdempotencyKey();
+    
     // 送信サマリー
     DOM.sendSummary.innerHTML = `
         <div class="status">
@@ -490,7 +512,10 @@ async function setupFinalStep() {
         
         if (response.ok) {
             let previewHTML = '';
-            AppState.targetUsers.forEach(user => {
+            // プレビューは先頭のユーザーのみ表示（全体はサーバー側で集計）
+            const sampleCount = Math.max(Object.keys(result.rendered_messages).length, 1);
+            const sampleUsers = AppState.targetUsers.slice(0, sampleCount);
+            sampleUsers.forEach(user => {
                 const renderedMessage = result.rendered_messages[user.id] || AppState.messageTemplate;
                 previewHTML += `
                     <div style="margin-bottom: 20px; padding: 15px; border: 1px solid #e2e8f0; border-radius: 8px;">
@@ -501,10 +526,31 @@ async function setupFinalStep() {
                     </div>
                 `;
             });
+            const stats = result.stats;
+            if (AppState.targetUsers.length > sampleUsers.length) {
+                previewHTML += `<p>他${AppState.targetUsers.length - sampleUsers.length}人分のプレビューは省略しています</p>`;
+            }
+            if (stats.total > 0) {
+                previewHTML += `
+                    <div class="status">
+                        <strong>メッセージ長:</strong> 最小 ${stats.length_min} / 平均 ${stats.length_mean} / 最大 ${stats.length_max} 文字
+                    </div>
+                `;
+            }
+            if (stats.over_limit_count > 0) {
+                previewHTML += `
+                    <div class="status error">
+                        ${stats.over_limit_count}人のメッセージがSlackの上限（${stats.max_length}文字）を超えています
+                    </div>
+                `;
+            }
             DOM.finalMessagePreview.innerHTML = previewHTML;
             
             if (result.missing_variables.length > 0) {
-                showNotification(`警告: 一部の変数が設定されていません: ${result.missing_variables.join(', ')}`, 'warning');
+                const missingCounts = result.missing_variables
+                    .map(name => `${name}（${stats.missing_variable_counts[name]}人）`)
+                    .join(', ');
+                showNotification(`警告: 一部の変数が設定されていません: ${missingCounts}`, 'warning');
             }
         }
     } catch (error) {
@@ -526,7 +572,10 @@ async function startSending() {
     try {
         const response = await fetch('/api/send-messages', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: {
+                'Content-Type': 'application/json',
+                'Idempotency-Key': AppState.sendIdempotencyKey
+            },
             body: JSON.stringify({
                 template: AppState.messageTemplate,
                 users: AppState.targetUsers,
@@ -556,34 +605,91 @@ async function startSending() {
     }
 }
 
-// 送信進捗の監視
-async function monitorSendProgress() {
+// 送信進捗の監視（Server-Sent Eventsを使い、使えない場合はポーリング）
+function monitorSendProgress() {
+    if (!AppState.sendJobId) return;
+    
+    if (!window.EventSource) {
+        pollSendProgress();
+        return;
+    }
+    
+    const jobId = AppState.sendJobId;
+    const source = new EventSource(`/api/status/${jobId}/stream`);
+    let job = null;
+    
+    source.addEventListener('snapshot', (event) => {
+        job = JSON.parse(event.data);
+        handleSendProgress(job, source);
+    });
+    
+    source.addEventListener('progress', (event) => {
+        if (!job) return;
+        // 差分（カウンタの増分）を反映。エラーの詳細は終了後に取得する
+        const delta = JSON.parse(event.data);
+        job.sent_count += delta.sent;
+        job.failed_count += delta.failed;
+        job.api_calls_saved += delta.api_calls_saved;
+        // 終了の状態は反映しない（続けて届く最終状況の snapshot でエラーの集計とともに反映する。
+        // 届かずに切断された場合は onerror からポーリングで最終状況を取得する）
+        if (delta.status && !isJobFinished(delta)) job.status = delta.status;
+        handleSendProgress(job, source);
+    });
+    
+    source.onerror = () => {
+        // ジョブ終了前に切断された場合はポーリングに切り替える
+        source.close();
+        if (AppState.sendJobId === jobId && (!job || !isJobFinished(job))) {
+            setTimeout(pollSendProgress, 1000);
+        }
+    };
+}
+
+// 送信進捗のポーリング
+async function pollSendProgress() {
     if (!AppState.sendJobId) return;
     
     try {
         const response = await fetch(`/api/status/${AppState.sendJobId}`);
         const result = await response.json();
         
-        if (response.ok) {
-            const progress = ((result.sent_count + result.failed_count) / result.total_users) * 100;
-            DOM.progressFill.style.width = `${progress}%`;
-            DOM.progressText.textContent = `${result.sent_count + result.failed_count} / ${result.total_users} 完了 (成功: ${result.sent_count}, 失敗: ${result.failed_count})`;
-            
-            if (result.status === 'completed' || result.status === 'failed') {
-                showSendResults(result);
-            } else {
-                // 1秒後に再チェック
-                setTimeout(monitorSendProgress, 1000);
-            }
+        if (response.ok && handleSendProgress(result)) {
+            return;
         }
+        // 1秒後に再チェック
+        setTimeout(pollSendProgress, 1000);
     } catch (error) {
         console.error('Progress monitoring error:', error);
-        setTimeout(monitorSendProgress, 1000);
+        setTimeout(pollSendProgress, 1000);
+    }
+}
+
+function isJobFinished(job) {
+    return job.status === 'completed' || job.status === 'failed';
+}
+
+// 進捗の表示を更新し、ジョブが終了していれば結果を表示してtrueを返す
+function handleSendProgress(result, source) {
+    const progress = ((result.sent_count + result.failed_count) / result.total_users) * 100;
+    DOM.progressFill.style.width = `${progress}%`;
+    DOM.progressText.textContent = `${result.sent_count + result.failed_count} / ${result.total_users} 完了 (成功: ${result.sent_count}, 失敗: ${result.failed_count})`;
+    
+    if (!isJobFinished(result)) {
+        return false;
     }
+    if (source) {
+        // 自動再接続させない
+        source.close();
+    }
+    showSendResults(result);
+    return true;
 }
 
+// エラー表示でエラーコードごとに表示するユーザー数の上限
+const MAX_ERROR_USERS_PER_CODE = 50;
+
 // 送信結果の表示
-function showSendResults(result) {
+async function showSendResults(result) {
     DOM.sendProgress.style.display = 'none';
     DOM.sendResults.style.display = 'block';
     
@@ -596,33 +702,29 @@ function showSendResults(result) {
         </div>
     `;
     
-    if (result.errors.length > 0) {
+    if (result.error_summary.length > 0) {
+        const errorUsers = await fetchErrorUsers(result.job_id, result.error_summary);
         let errorsHTML = '<h4>エラー詳細</h4><div class="error-details">';
         
-        // エラーコード別にグループ化
-        const groupedErrors = {};
-        result.errors.forEach(error => {
-            const code = error.error_code || 'unknown';
-            if (!groupedErrors[code]) {
-                groupedErrors[code] = [];
+        // エラーコード別に表示（集計はサーバー側）
+        result.error_summary.forEach(summary => {
+            const errorCode = summary.error_code;
+            const names = errorUsers[errorCode] || [];
+            const others = summary.count - names.length;
+            let userNames = names.join(', ');
+            if (others > 0 && names.length > 0) {
+                userNames += ` 他${others}人`;
             }
-            groupedErrors[code].push(error);
-        });
-        
-        // 各エラーコードグループを表示
-        Object.entries(groupedErrors).forEach(([errorCode, errors]) => {
-            const firstError = errors[0];
-            const userNames = errors.map(e => e.user_name || e.user_id).join(', ');
             
             errorsHTML += `
                 <div class="error-group">
                     <div class="error-header">
-                        <strong>${errorCode}: ${errors.length}人が失敗</strong>
+                        <strong>${errorCode}: ${summary.count}人が失敗</strong>
                         <span class="toggle-detail" onclick="toggleErrorDetail('${errorCode}')">詳細を表示 ▼</span>
                     </div>
-                    <div class="error-users">対象ユーザー: ${userNames}</div>
+                    ${userNames ? `<div class="error-users">対象ユーザー: ${userNames}</div>` : ''}
                     <div id="detail-${errorCode}" class="error-detail" style="display: none;">
-                        <div class="detailed-message">${firstError.detailed_error || firstError.error}</div>
+                        <div class="detailed-message">${summary.detailed_error || summary.error}</div>
                     </div>
                 </div>
             `;
@@ -644,27 +746,89 @@ function showSendResults(result) {
     document.getElementById('reset-app').style.display = 'inline-flex';
 }
 
+// エラー一覧をページ単位で取得し、エラーコードごとのユーザー名を返す
+// （各エラーコードで表示する人数が揃った時点で取得をやめる）
+async function fetchErrorUsers(jobId, errorSummary) {
+    const usersByCode = {};
+    let remaining = errorSummary.reduce(
+        (total, summary) => total + Math.min(summary.count, MAX_ERROR_USERS_PER_CODE), 0);
+    let after = 0;
+    
+    try {
+        while (after !== null && remaining > 0) {
+            const response = await fetch(`/api/status/${jobId}/errors?after=${after}&limit=500`);
+            if (!response.ok) break;
+            const page = await response.json();
+            
+            page.errors.forEach(error => {
+                const code = error.error_code || 'unknown';
+                const names = usersByCode[code] || (usersByCode[code] = []);
+                if (names.length >= MAX_ERROR_USERS_PER_CODE) return;
+                remaining--;
+                if (error.user_id) {
+                    names.push(error.user_name || error.user_id);
+                }
+            });
+            after = page.next_cursor;
+        }
+    } catch (error) {
+        console.error('Failed to fetch send errors:', error);
+    }
+    return usersByCode;
+}
+
 // 送信の再実行
 async function retrySending() {
-    if (!confirm('送信を再実行しますか？失敗したユーザーのみに再送信されます。')) {
+    if (!AppState.sendJobId) return;
+    if (!confirm('送信を再開しますか？送信済みのユーザーには送信せず、未送信のユーザー（中断により送信しなかったユーザーを含む）にのみ送信します。')) {
         return;
     }
+    // 送信を開始したが結果を記録できなかったユーザーは、二重送信になる可能性があるため確認する
+    const retryUncertain = confirm('送信済みか確認できなかったユーザーにも再送信しますか？\n（キャンセルした場合は失敗として扱い、再送信しません）');
     
-    // 失敗したユーザーのみに絞り込み
-    // 実際の実装ではAPI側で失敗リストを管理する必要がありますが、
-    // ここでは全ユーザーに再送信として簡易実装
-    
-    // UIリセット
-    DOM.sendResults.style.display = 'none';
-    DOM.sendProgress.style.display = 'block';
-    DOM.progressFill.style.width = '0%';
-    DOM.progressText.textContent = '準備中...';
-    
-    document.getElementById('retry-send').style.display = 'none';
-    document.getElementById('reset-app').style.display = 'none';
+    showLoading(true);
     
-    // 送信実行（元の関数を再利用）
-    await startSending();
+    try {
+        const response = await fetch(`/api/jobs/${AppState.sendJobId}/resume`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                token: AppState.slackToken,
+                retry_uncertain: retryUncertain
+            })
+        });
+        
+        const result = await response.json();
+        
+        if (!response.ok) {
+            showNotification(`再開エラー: ${result.detail}`, 'error');
+            return;
+        }
+        
+        if (isJobFinished(result)) {
+            // 送信する受信者が残っていなかった
+            showNotification('未送信のユーザーはいません', 'warning');
+            showSendResults(result);
+            return;
+        }
+        
+        // UIリセット
+        DOM.sendResults.style.display = 'none';
+        DOM.sendProgress.style.display = 'block';
+        handleSendProgress(result);
+        
+        document.getElementById('retry-send').style.display = 'none';
+        document.getElementById('reset-app').style.display = 'none';
+        
+        showNotification('送信を再開しました', 'success');
+        monitorSendProgress();
+    } catch (error) {
+        showNotification(`再開エラー: ${error.message}`, 'error');
+    } finally {
+        showLoading(false);
+    }
 }
 
 // アプリケーションのリセット
@@ -680,6 +844,7 @@ function resetApplication() {
     AppState.messageTemplate = '';
     AppState.userVariables = {};
     AppState.sendJobId = null;
+    AppState.sendIdempotencyKey = null;
     
     // UI要素をリセット
     DOM.slackTokenInput.value = '';
@@ -0,0 +1,60 @@
+"""テスト共通の設定
+
+アプリのモジュールは読み込み時に設定を読むため、読み込む前に環境変数を設定する。
+Slack APIは benchmarks.fake_slack のダミーサーバーを使い、ジョブ・DMチャンネル・ログは
+一時ディレクトリとメモリにのみ書き込む。レート制限はテストの実行時間に影響しないよう緩める
+（レート制限自体は test_rate_limiter.py で個別のインスタンスを使って確認する）。
+"""
+import os
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="slack-dm-batch-tests-")
+
+os.environ.update({
+    "JOB_STORE": "memory",
+    "CHANNEL_CACHE_PATH": "",
+    "SEND_LEDGER_DIR": "",
+    "LOG_LEVEL": "WARNING",
+    "LOG_MODE": "sync",
+    "LOG_FILE": os.path.join(_TMP_DIR, "app.log"),
+    "SEND_RESULTS_LOG_FILE": os.path.join(_TMP_DIR, "send_results.log"),
+    "SLACK_RATE_LIMITS": ",".join(f"{method}=600000" for method in (
+        "auth.test", "users.list", "users.info", "users.lookupByEmail", "conversations.open", "chat.postMessage"
+    )),
+    "SLACK_RATE_LIMIT_BURST": "1000",
+    "SLACK_RATE_LIMIT_DELAY": "0.01",
+    "SLACK_CHANNEL_RATE_LIMIT": "0",
+})
+
+from typing import Any, Awaitable, Callable, List
+
+import pytest
+from aiohttp import web
+
+from app.config import settings
+from app.http_session import http_session
+from benchmarks.fake_slack import FakeSlack
+
+
+@pytest.fixture
+async def start_fake_slack(monkeypatch) -> Callable[..., Awaitable[FakeSlack]]:
+    """ダミーのSlack APIサーバーを起動する関数（引数は FakeSlack と同じ）
+
+    起動後に生成した SlackClient はこのサーバーに接続する。
+    """
+    runners: List[web.AppRunner] = []
+
+    async def start(**options: Any) -> FakeSlack:
+        server = FakeSlack(**options)
+        runner = web.AppRunner(server.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        runners.append(runner)
+        monkeypatch.setattr(settings, "SLACK_API_BASE_URL", f"http://127.0.0.1:{runner.addresses[0][1]}/api/")
+        return server
+
+    yield start
+    await http_session.close()
+    for runner in runners:
+        await runner.cleanup()
@@ -0,0 +1,127 @@
+import io
+import json
+
+import pytest
+
+from app.user_parser import ImportFileError, ImportFileTooLargeError, UserParser
+
+# 要素・行・マルチバイト文字がチャンクの境界をまたぐよう、小さいチャンクで読む
+CHUNK_SIZES = [1, 3, 7, 64 * 1024]
+
+
+def parse(content: str, filename: str, chunk_size: int, bom: bool = False):
+    data = content.encode("utf-8")
+    if bom:
+        data = b"\xef\xbb\xbf" + data
+    return UserParser().parse_stream(io.BytesIO(data), filename, chunk_size=chunk_size)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_json_array(chunk_size):
+    items = [
+        {"user_id": "U0123456789", "name": "山田", "score": 1234567890},
+        {"email": "user1@example.com", "note": "a, \"quoted\" ]", "nested": {"k": [1, 2]}},
+        {"username": "watanabe", "amount": 12.5},
+    ]
+    users, errors = parse(json.dumps(items, ensure_ascii=False, indent=2), "users.json", chunk_size)
+
+    assert errors == []
+    assert [(user["identifier"], user["identifier_type"]) for user in users] == [
+        ("U0123456789", "user_id"), ("user1@example.com", "email"), ("watanabe", "username")
+    ]
+    assert users[0]["variables"] == {"score": "1234567890"}
+    assert users[1]["variables"]["note"] == 'a, "quoted" ]'
+    assert users[1]["variables"]["nested"] == {"k": [1, 2]}
+    assert users[2]["variables"] == {"amount": "12.5"}
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_json_array_row_errors_and_bom(chunk_size):
+    content = '[{"user_id": "U0123456789"}, "text", {"company": "Acme"}]'
+    users, errors = parse(content, "users.json", chunk_size, bom=True)
+
+    assert [user["identifier"] for user in users] == ["U0123456789"]
+    assert errors == ["Item 1: Must be an object", "Item 2: No valid user identifier found"]
+
+
+@pytest.mark.parametrize("content, message", [
+    ('{"user_id": "U0123456789"}', "JSON must be an array"),
+    ('[{"user_id": "U0123456789"},', "unexpected end of data"),
+    ('[{"user_id": "U0123456789"}', "expected ',' or ']'"),
+    ('[{"user_id": "U0123456789"} {"user_id": "U0123456780"}]', "expected ',' or ']'"),
+    ('[{"user_id": "U0123456789"}] []', "extra data after array"),
+])
+def test_invalid_json_array(content, message):
+    with pytest.raises(ImportFileError, match=message):
+        parse(content, "users.json", 4)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_ndjson(chunk_size):
+    content = (
+        '{"user_id": "U0123456789", "name": "山田"}\n'
+        '\n'
+        '{"user_id": broken}\n'
+        '{"display_name": "佐藤", "company": "Acme"}'
+    )
+    users, errors = parse(content, "users.ndjson", chunk_size, bom=True)
+
+    assert [user["identifier"] for user in users] == ["U0123456789", "佐藤"]
+    assert users[1]["variables"] == {"company": "Acme"}
+    assert len(errors) == 1 and errors[0].startswith("Line 3: Invalid JSON")
+
+
+def test_format_is_detected_from_content():
+    users, errors = parse('{"user_id": "U0123456789"}\n{"user_id": "U0123456780"}\n', "upload", 5)
+    assert errors == [] and len(users) == 2
+
+    users, errors = parse('[{"user_id": "U0123456789"}]', "upload", 5)
+    assert errors == [] and len(users) == 1
+
+    users, errors = parse("user_id\nU0123456789\n", "upload", 5)
+    assert errors == [] and len(users) == 1
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_csv_with_bom_and_quoted_newlines(chunk_size):
+    content = (
+        "user_id,username,message,company\r\n"
+        'U0123456789,,"1行目\n2行目, ""引用""",山田商事\r\n'
+        ",watanabe,こんにちは,\r\n"
+        ",,no identifier,Acme\r\n"
+    )
+    users, errors = parse(content, "users.csv", chunk_size, bom=True)
+
+    assert [(user["identifier"], user["identifier_type"]) for user in users] == [
+        ("U0123456789", "user_id"), ("watanabe", "username")
+    ]
+    assert users[0]["variables"] == {"message": '1行目\n2行目, "引用"', "company": "山田商事"}
+    assert users[1]["variables"] == {"message": "こんにちは", "company": ""}
+    assert errors == ["Row 4: No valid user identifier found"]
+
+
+def test_csv_without_identifier_column():
+    users, errors = parse("company,message\nAcme,hi\n", "users.csv", 64)
+    assert users == []
+    assert errors == ["CSV must contain at least one of: ['user_id', 'username', 'display_name', 'name', 'email']"]
+
+
+def test_file_level_errors():
+    with pytest.raises(ImportFileError, match="empty"):
+        parse(" \n", "users.csv", 64)
+    with pytest.raises(ImportFileError, match="UTF-8"):
+        UserParser().parse_stream(io.BytesIO("user_id\n山田\n".encode("shift_jis")), "users.csv")
+    with pytest.raises(ImportFileTooLargeError):
+        UserParser().parse_stream(io.BytesIO(b"user_id\n" + b"U0123456789\n" * 100), "users.csv",
+                                  max_size=64, chunk_size=16)
+
+
+def test_identifier_column_takes_precedence_over_the_id_pattern():
+    parser = UserParser()
+    assert parser.identifier_kind("WATANABE12", "username") == "name"
+    assert parser.identifier_kind("user1@example.com", "display_name") == "name"
+    assert parser.identifier_kind("U0123456789", "user_id") == "user_id"
+    # 列のない識別子（メンションなど）は形式から判定する
+    assert parser.identifier_kind("U0123456789") == "user_id"
+    assert parser.identifier_kind("user1@example.com") == "email"
+    assert parser.identifier_kind("watanabe") == "name"